@@ -36,6 +36,13 @@ interface Pharmacy {
   sources_count?: number
   date: string
   scraped_at?: string
+  lat?: number | null
+  lng?: number | null
+  geohash?: string | null
+  geo_precision?: 'quartier' | 'city' | null
+  predicted?: boolean
+  confidence?: number
+  stale?: boolean
 }
 
 interface PharmacyMeta {
@@ -45,6 +52,7 @@ interface PharmacyMeta {
   cities: string[]
   sources_used: string[]
   sources_status: Record<string, { ok: boolean; count: number; error?: string }>
+  shards?: Record<string, { file: string; count: number; hash: string }>
   previous_total: number
   delta: number | null
 }
@@ -72,17 +80,44 @@ function hoursAgo(isoDate: string): number {
   }
 }
 
+const GITHUB_DATA =
+  'https://raw.githubusercontent.com/MokokAf/PharmaDW/main/public/data'
+
+async function fetchWithFallback(file: string): Promise<Response> {
+  try {
+    const resp = await fetch(`${GITHUB_DATA}/${file}`)
+    if (resp.ok) return resp
+  } catch {
+    /* GitHub unavailable — fall back to local static copy */
+  }
+  return fetch(`/data/${file}`)
+}
+
+async function fetchAllPharmacies(): Promise<Pharmacy[]> {
+  const resp = await fetchWithFallback('pharmacies.json')
+  if (!resp.ok) {
+    throw new Error('Erreur de chargement des donnees.')
+  }
+  return (await resp.json()) as Pharmacy[]
+}
+
 export default function PharmaciesDeGardeContent() {
+  // Full list, only loaded when the meta has no per-city shards
   const [pharmacies, setPharmacies] = useState<Pharmacy[]>([])
+  // Per-city shards loaded so far (public/data/pharmacies/<city>.json)
+  const [shardData, setShardData] = useState<Record<string, Pharmacy[]>>({})
   const [meta, setMeta] = useState<PharmacyMeta | null>(null)
   const [loading, setLoading] = useState(true)
+  const [loadingCity, setLoadingCity] = useState('')
   const [error, setError] = useState<string | null>(null)
 
   const [city, setCity] = useState<string>('')
   const [filter, setFilter] = useState('')
 
+  const shards = meta?.shards && Object.keys(meta.shards).length > 0 ? meta.shards : null
+
   const cities = useMemo(() => {
-    const unique = Array.from(new Set(pharmacies.map((p) => p.city)))
+    const unique = shards ? Object.keys(shards) : Array.from(new Set(pharmacies.map((p) => p.city)))
     return unique.sort((a, b) => {
       const aRank = POP_RANK[a] ?? 1_000_000
       const bRank = POP_RANK[b] ?? 1_000_000
@@ -91,38 +126,21 @@ export default function PharmaciesDeGardeContent() {
       }
       return a.localeCompare(b)
     })
-  }, [pharmacies])
+  }, [shards, pharmacies])
 
   useEffect(() => {
-    const GITHUB_DATA =
-      'https://raw.githubusercontent.com/MokokAf/PharmaDW/main/public/data'
-
-    async function fetchWithFallback(file: string): Promise<Response> {
-      try {
-        const resp = await fetch(`${GITHUB_DATA}/${file}`)
-        if (resp.ok) return resp
-      } catch {
-        /* GitHub unavailable — fall back to local static copy */
-      }
-      return fetch(`/data/${file}`)
-    }
-
     async function fetchData() {
       try {
-        const [phRes, metaRes] = await Promise.all([
-          fetchWithFallback('pharmacies.json'),
-          fetchWithFallback('pharmacies_meta.json').catch(() => null),
-        ])
-        if (!phRes.ok) {
-          throw new Error('Erreur de chargement des donnees.')
-        }
-        const json = (await phRes.json()) as Pharmacy[]
-        setPharmacies(json)
-
+        const metaRes = await fetchWithFallback('pharmacies_meta.json').catch(() => null)
+        let metaJson: PharmacyMeta | null = null
         if (metaRes && metaRes.ok) {
-          const metaJson = (await metaRes.json()) as PharmacyMeta
+          metaJson = (await metaRes.json()) as PharmacyMeta
           setMeta(metaJson)
         }
+        // Older data without a shard index: load everything up front
+        if (!metaJson?.shards || Object.keys(metaJson.shards).length === 0) {
+          setPharmacies(await fetchAllPharmacies())
+        }
       } catch (fetchError) {
         const message =
           fetchError instanceof Error
@@ -140,12 +158,57 @@ export default function PharmaciesDeGardeContent() {
     })
   }, [])
 
+  useEffect(() => {
+    const shard = city && shards ? shards[city] : undefined
+    if (!shard || shardData[city] || pharmacies.length > 0) {
+      return
+    }
+
+    let cancelled = false
+    async function fetchCity(cityName: string, file: string, hash: string) {
+      setLoadingCity(cityName)
+      try {
+        const resp = await fetchWithFallback(`${file}?v=${hash}`)
+        if (!resp.ok) {
+          throw new Error(`HTTP ${resp.status}`)
+        }
+        const json = (await resp.json()) as Pharmacy[]
+        if (!cancelled) {
+          setShardData((prev) => ({ ...prev, [cityName]: json }))
+        }
+      } catch {
+        // Shard unavailable — fall back to the full list
+        try {
+          const all = await fetchAllPharmacies()
+          if (!cancelled) {
+            setPharmacies(all)
+          }
+        } catch (fetchError) {
+          if (!cancelled) {
+            setError(
+              fetchError instanceof Error
+                ? fetchError.message
+                : 'Une erreur est survenue pendant le chargement.'
+            )
+          }
+        }
+      } finally {
+        setLoadingCity((current) => (current === cityName ? '' : current))
+      }
+    }
+
+    fetchCity(city, shard.file, shard.hash)
+    return () => {
+      cancelled = true
+    }
+  }, [city, shards, shardData, pharmacies])
+
   const filtered = useMemo(() => {
     if (!city) {
       return []
     }
 
-    let result = pharmacies.filter((p) => p.city === city)
+    let result = shardData[city] ?? pharmacies.filter((p) => p.city === city)
     if (filter) {
       const normalizedFilter = filter.toLowerCase()
       result = result.filter(
@@ -157,8 +220,9 @@ export default function PharmaciesDeGardeContent() {
     }
 
     return result
-  }, [city, filter, pharmacies])
+  }, [city, filter, shardData, pharmacies])
 
+  const cityLoading = city !== '' && loadingCity === city
   const isStale = meta ? hoursAgo(meta.scraped_at) > 48 : false
 
   return (
@@ -226,7 +290,7 @@ export default function PharmaciesDeGardeContent() {
         </div>
       )}
 
-      {loading && (
+      {(loading || cityLoading) && (
         <div className="space-y-3 py-2" aria-live="polite" aria-busy="true">
           <div className="h-5 w-44 rounded bg-muted animate-pulse" />
           {Array.from({ length: 4 }).map((_, index) => (
@@ -250,7 +314,7 @@ export default function PharmaciesDeGardeContent() {
         <p className="text-center text-muted-foreground py-12">Selectionnez une ville ci-dessus.</p>
       )}
 
-      {!loading && !error && city && filtered.length === 0 && (
+      {!loading && !cityLoading && !error && city && filtered.length === 0 && (
         <div className="rounded-xl border border-border bg-card p-6 text-center space-y-3 animate-fade-in">
           <div className="mx-auto w-12 h-12 rounded-full bg-muted flex items-center justify-center">
             <MapPin className="h-5 w-5 text-muted-foreground" />
@@ -271,6 +335,22 @@ export default function PharmaciesDeGardeContent() {
               <div>
                 <div className="flex items-start justify-between gap-2">
                   <h2 className="text-base font-semibold text-foreground">{pharmacy.name}</h2>
+                  {pharmacy.predicted && (
+                    <span
+                      className="shrink-0 rounded-full bg-amber-100 px-2 py-0.5 text-xs font-medium text-amber-800"
+                      title="Deduit du tour de garde habituel, source indisponible : appelez avant de vous deplacer"
+                    >
+                      Prevision {Math.round((pharmacy.confidence ?? 0) * 100)}%
+                    </span>
+                  )}
+                  {pharmacy.stale && (
+                    <span
+                      className="shrink-0 rounded-full bg-amber-100 px-2 py-0.5 text-xs font-medium text-amber-800"
+                      title="Reprise de la derniere liste complete, source incomplete : appelez avant de vous deplacer"
+                    >
+                      Liste du {pharmacy.date}
+                    </span>
+                  )}
                 </div>
                 {(pharmacy.district || pharmacy.area) && (
                   <p className="text-sm text-muted-foreground mt-1 flex items-center gap-1.5">
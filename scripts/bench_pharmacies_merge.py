@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark for the pharmacy merge at national scale.
+
+Generates synthetic duty pharmacies for many cities, spread over the four
+sources with realistic overlap (the same pharmacy listed by several
+sources, with spelling variants, appended quartiers and missing phones),
+then runs `pharmacies_scraper.merge_and_validate` on them. Reports wall
+time, records per second, norm_key() calls per record, fuzzy merges and
+peak RSS.
+
+Usage:
+    python scripts/bench_pharmacies_merge.py
+    python scripts/bench_pharmacies_merge.py --records 300000 --cities 400
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import resource
+import time
+from typing import List, Tuple
+
+
+_SOURCES = ["lematin.ma", "guidepharmacies.ma", "infopoint.ma", "annuaire-gratuit.ma"]
+_SYLLABLES = ["ka", "ri", "mo", "sa", "la", "nou", "di", "ha", "be", "to", "fa", "zi", "you", "mi", "ra", "ne"]
+_ARTICLES = ["", "", "Al ", "El "]
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_sources(ps, records: int, cities: int, seed: int) -> List[Tuple[str, list]]:
+    """About *records* pharmacies over *cities*; each listed by 1-3 sources."""
+    rng = random.Random(seed)
+    by_source = {name: [] for name in _SOURCES}
+    city_names = [f"Ville {i:04d}" for i in range(cities)]
+    emitted = 0
+    while emitted < records:
+        city = rng.choice(city_names)
+        word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        area = f"Quartier {rng.randint(1, 40)}"
+        phone = f"05{rng.randint(0, 99_999_999):08d}"
+        for source in rng.sample(_SOURCES, rng.randint(1, 3)):
+            name = f"Pharmacie {rng.choice(_ARTICLES)}{word.title()}"
+            if rng.random() < 0.15:
+                name += word[-1]  # doubled final letter ("Ikhlass")
+            if rng.random() < 0.1:
+                name += f" {area}"
+            by_source[source].append(ps.Pharmacy(
+                city=city, area=area, name=name,
+                address=f"{rng.randint(1, 200)} Rue {word.title()}" if rng.random() < 0.5 else "",
+                phone=phone if rng.random() < 0.6 else "",
+                district=area, duty="Garde de nuit", source_site=source, date="2026-01-01",
+            ))
+            emitted += 1
+    return [(name, by_source[name]) for name in _SOURCES]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark pharmacies_scraper.merge_and_validate")
+    parser.add_argument("--records", type=int, default=100_000, help="Synthetic records (default 100000)")
+    parser.add_argument("--cities", type=int, default=300, help="Number of cities (default 300)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    import pharmacies_scraper as ps
+
+    logging.getLogger("pharmacies_scraper").setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    source_lists = synthetic_sources(ps, args.records, args.cities, args.seed)
+    total = sum(len(phs) for _, phs in source_lists)
+    print(f"Built {total} synthetic records in {time.perf_counter() - started:.2f}s")
+
+    calls = [0]
+    norm_key = ps.Pharmacy.norm_key
+
+    def counting_norm_key(self):
+        calls[0] += 1
+        return norm_key(self)
+
+    ps.Pharmacy.norm_key = counting_norm_key
+    started = time.perf_counter()
+    merged = ps.merge_and_validate(source_lists)
+    elapsed = time.perf_counter() - started
+
+    confirmed = sum(1 for rec in merged if rec.sources_count >= 2)
+    print(f"Merged into {len(merged)} pharmacies ({confirmed} confirmed by 2+ sources)")
+    print(f"merge_and_validate: {elapsed:.2f}s ({total / elapsed:,.0f} records/s)")
+    print(f"norm_key() calls per record: {calls[0] / total:.2f}")
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Offline replay benchmark for the pharmacy sources.
+
+Serves the recorded fixtures (scripts/fixtures/pharmacies/, see
+pharmacy_fixtures.py) from local stand-in servers, points the scraper at
+them (ANNUAIRE_BASE, GUIDE_BASE, INFOPOINT_URL, LEMATIN_BASE, MEDMA_BASE)
+with empty caches, and runs every registered source on the real fetch
+engine with its declared host budgets. Reports per source: wall time, requests, errors, retries, records and a
+fingerprint of the parsed records, plus the merged total.
+
+--check compares the run with fixtures/pharmacies/expected.json and exits
+1 on a parser regression (record count or fingerprint changed), or on a
+performance regression (more requests, or a wall time above
+--max-slowdown x the reference plus --slack seconds). Record checks are
+skipped when failures are injected.
+
+--trace FILE writes the runs' spans (tracing.py, one "bench run" span per
+run) for trace_report.py.
+
+Usage:
+    python scripts/bench_pharmacy_sources.py
+    python scripts/bench_pharmacy_sources.py --check
+    python scripts/bench_pharmacy_sources.py --latency 0.3 --jitter 0.2 --fail-rate 0.1 --seed 1
+    python scripts/bench_pharmacy_sources.py --update-expected
+    python scripts/bench_pharmacy_sources.py --latency 0.2 --trace /tmp/bench.trace.ndjson
+    python scripts/bench_pharmacy_sources.py --record        # re-record from the live sites
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import tracing
+from pharmacy_fixtures import (
+    FIXTURE_SOURCES,
+    FIXTURES_DIR,
+    fixture_name,
+    load_manifest,
+    standin_env,
+    start_standins,
+)
+
+# Fields compared by the fingerprint (`source` holds the stand-in URL)
+_FINGERPRINT_FIELDS = ("city", "area", "name", "address", "phone", "district", "duty", "date")
+
+
+def records_fingerprint(pharmacies) -> str:
+    digest = hashlib.sha256()
+    for ph in pharmacies:
+        digest.update(json.dumps([getattr(ph, f) for f in _FINGERPRINT_FIELDS], ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def run_once(ps, cache_dir: Path) -> Dict[str, Any]:
+    """One cold run of every source; per-source results plus the merge."""
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    ps._STORES.clear()
+    engine = ps.make_engine()
+    telemetry: Dict[str, Any] = {}
+    started = time.perf_counter()
+    with tracing.span("bench run"):
+        outcomes = ps.run_sources(engine, ps.source_scrapers(), telemetry)
+    total_wall = time.perf_counter() - started
+
+    sources: Dict[str, Dict[str, Any]] = {}
+    source_lists = []
+    for name, outcome in outcomes.items():
+        pharmacies, status = ps._source_outcome(name, outcome)
+        source_lists.append((name, pharmacies))
+        stats = telemetry[name].as_dict()
+        sources[name] = {
+            "ok": status["ok"],
+            "records": len(pharmacies),
+            "fingerprint": records_fingerprint(pharmacies),
+            "wall_seconds": stats["wall_seconds"],
+            "requests": stats["requests"],
+            "errors": stats["errors"],
+            "retries": stats["retries"],
+            "parse_seconds": stats["parse_seconds"],
+        }
+    merged = ps.merge_and_validate(source_lists)
+    return {"wall_seconds": round(total_wall, 3), "merged": len(merged), "sources": sources}
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Median timings over *runs*; counts and fingerprints from the first."""
+    first = runs[0]
+    summary = {
+        "wall_seconds": round(statistics.median(r["wall_seconds"] for r in runs), 3),
+        "merged": first["merged"],
+        "sources": {},
+    }
+    for name, src in first["sources"].items():
+        summary["sources"][name] = {
+            **src,
+            "wall_seconds": round(statistics.median(r["sources"][name]["wall_seconds"] for r in runs), 3),
+            "parse_seconds": round(statistics.median(r["sources"][name]["parse_seconds"] for r in runs), 3),
+        }
+    return summary
+
+
+def print_report(summary: Dict[str, Any]) -> None:
+    print(f"{'source':<22}{'wall s':>8}{'parse s':>9}{'req':>6}{'err':>5}{'retry':>7}{'records':>9}  fingerprint")
+    for name, src in summary["sources"].items():
+        print(f"{name:<22}{src['wall_seconds']:>8.2f}{src['parse_seconds']:>9.3f}{src['requests']:>6}"
+              f"{src['errors']:>5}{src['retries']:>7}{src['records']:>9}  {src['fingerprint']}")
+    print(f"all sources: {summary['wall_seconds']:.2f}s wall, {summary['merged']} pharmacies after merge")
+
+
+def check(summary: Dict[str, Any], expected: Dict[str, Any], args) -> List[str]:
+    problems = []
+    compare_records = not (args.fail_rate or args.fail_pattern)
+    for name, ref in expected["sources"].items():
+        got = summary["sources"].get(name)
+        if got is None:
+            problems.append(f"{name}: source missing")
+            continue
+        if compare_records and (got["records"], got["fingerprint"]) != (ref["records"], ref["fingerprint"]):
+            problems.append(f"{name}: parser output changed ({ref['records']} records {ref['fingerprint']} "
+                            f"-> {got['records']} records {got['fingerprint']})")
+        if compare_records and got["requests"] > ref["requests"]:
+            problems.append(f"{name}: {got['requests']} requests (reference {ref['requests']})")
+        limit = ref["wall_seconds"] * args.max_slowdown + args.slack
+        if not args.latency and got["wall_seconds"] > limit:
+            problems.append(f"{name}: {got['wall_seconds']:.2f}s wall (reference {ref['wall_seconds']:.2f}s, "
+                            f"limit {limit:.2f}s)")
+    if compare_records and summary["merged"] != expected["merged"]:
+        problems.append(f"merge: {summary['merged']} pharmacies (reference {expected['merged']})")
+    return problems
+
+
+def record_fixtures(args) -> int:
+    """Run every source against the live sites and store each fetched page."""
+    cache_dir = Path(tempfile.mkdtemp(prefix="pharmacy-record-"))
+    os.environ["PHARMACY_CACHE_DIR"] = str(cache_dir)
+    import pharmacies_scraper as ps
+
+    for src in FIXTURE_SOURCES.values():
+        shutil.rmtree(args.fixtures / src.directory, ignore_errors=True)
+        (args.fixtures / src.directory).mkdir(parents=True)
+
+    live_get = ps.get_with_retry
+    saved = [0]
+
+    def recording_get(url, **kwargs):
+        resp = live_get(url, **kwargs)
+        for src in FIXTURE_SOURCES.values():
+            if url.startswith(src.live_base):
+                # Absolute links back to the site become relative, so replays stay local
+                text = resp.text.replace(src.live_base, "")
+                page = args.fixtures / src.directory / fixture_name(url[len(src.live_base):])
+                page.write_text(text, encoding="utf-8")
+                saved[0] += 1
+                break
+        return resp
+
+    ps.get_with_retry = recording_get
+    try:
+        ps.run_sources(ps.make_engine(), ps.source_scrapers())
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    manifest = {"date": ps.TODAY, "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    (args.fixtures / "manifest.json").write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+    print(f"Recorded {saved[0]} pages for duty date {ps.TODAY} into {args.fixtures}")
+    print("Run with --update-expected to refresh the reference.")
+    return 0
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Replay the pharmacy source fixtures and time every source")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR, help="Fixture directory")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs to take the median of (default 1)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--fail-pattern", help="Regex: paths matching it always get 503")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="Exit 1 on regressions against expected.json")
+    parser.add_argument("--max-slowdown", type=float, default=1.5, help="--check: allowed wall time factor")
+    parser.add_argument("--slack", type=float, default=1.0, help="--check: extra seconds allowed")
+    parser.add_argument("--update-expected", action="store_true", help="Write this run as the new reference")
+    parser.add_argument("--trace", type=Path, help="Append the runs' NDJSON trace spans to this file")
+    parser.add_argument("--record", action="store_true", help="Re-record the fixtures from the live sites")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the scraper's log")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    if args.record:
+        return record_fixtures(args)
+
+    manifest = load_manifest(args.fixtures)
+    servers = start_standins(
+        args.fixtures, latency=args.latency, jitter=args.jitter,
+        fail_rate=args.fail_rate, fail_pattern=args.fail_pattern, seed=args.seed,
+    )
+    cache_dir = Path(tempfile.mkdtemp(prefix="pharmacy-bench-"))
+    try:
+        # Before the import: the scraper reads its base URLs and cache dir once
+        os.environ.update(standin_env(servers))
+        os.environ["PHARMACY_CACHE_DIR"] = str(cache_dir)
+        os.environ["NO_PROXY"] = ",".join(filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1"]))
+        import pharmacies_scraper as ps
+
+        ps.TODAY = manifest["date"]
+        tracing.configure(args.trace)
+        runs = [run_once(ps, cache_dir) for _ in range(max(1, args.repeat))]
+    finally:
+        tracing.close()
+        for server in servers.values():
+            server.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    print(f"Fixtures for {manifest['date']}, {len(runs)} run(s), latency {args.latency}s "
+          f"+ jitter {args.jitter}s, fail rate {args.fail_rate}")
+    print_report(summary)
+
+    expected_json = args.fixtures / "expected.json"
+    if args.update_expected:
+        expected_json.write_text(json.dumps(summary, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Reference written to {expected_json}")
+    if args.check:
+        problems = check(summary, json.loads(expected_json.read_text(encoding="utf-8")), args)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            return 1
+        print("No regression against expected.json")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Peak-memory benchmark for the medicaments updater merge modes.
+
+Builds a synthetic dataset (existing JSON + state file + sitemap listing)
+in a temporary directory, then runs `medicaments_updater.main()` once in
+the default in-memory mode and once with `--streaming`, each in its own
+subprocess with the network layer replaced by synthetic responses.
+Reports wall time and peak RSS, and checks both modes wrote the same
+records and state entries.
+
+Usage:
+    python scripts/bench_updater_memory.py
+    python scripts/bench_updater_memory.py --records 200000 --changed 0.02
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+_FORMS = ["Comprimé", "Comprimé pelliculé", "Gélule", "Sirop", "Solution injectable", "Crème"]
+_LABS = ["LAPROPHAN", "SOTHEMA", "COOPER PHARMA", "PHARMA5", "GALENICA", "PROMOPHARM (HIKMA)"]
+
+
+def synthetic_record(i: int, rng: random.Random, revision: int = 0) -> Dict[str, Any]:
+    form = rng.choice(_FORMS)
+    strength = f"{rng.choice([5, 10, 20, 50, 100, 250, 500])} MG"
+    return {
+        "@context": "https://schema.org",
+        "@type": "Drug",
+        "id": f"synthetic-{i:06d}",
+        "name": f"SYNTH {i:06d} {strength}, {form}",
+        "description": f"Fiche medicament synthetique {i} (revision {revision}). " + "x" * rng.randint(40, 400),
+        "activeIngredient": [f"Molecule {i % 977}", f"Excipient {i % 13}"][: rng.randint(1, 2)],
+        "dosageForm": form,
+        "strength": strength,
+        "presentation": f"Boite de {rng.choice([10, 20, 30])}",
+        "therapeuticClass": [f"Classe {i % 120}"],
+        "atcCode": f"A{i % 16:02d}BC{i % 100:02d}",
+        "status": "Commercialisé",
+        "productType": "Drug",
+        "manufacturer": rng.choice(_LABS),
+        "price": {"currency": "MAD", "public": round(rng.uniform(10, 900), 2)},
+        "updatedAt": "2026-01-01",
+    }
+
+
+def build_dataset(workdir: Path, count: int, changed: float, seed: int) -> None:
+    rng = random.Random(seed)
+    records = [synthetic_record(i, rng) for i in range(count)]
+    records.sort(key=lambda r: (r["name"].lower(), r["id"].lower()))
+    (workdir / "existing.json").write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    state = {
+        "records": {
+            r["id"]: {
+                "url": f"https://medicament.ma/medicament/{r['id']}/",
+                "lastmod": "2026-01-01T00:00:00+00:00",
+                "status": "ok",
+                "missingStreak": 0,
+                "absentStreak": 0,
+                "lastSeenAt": "2026-01-01T00:00:00Z",
+                "lastFetchedAt": "2026-01-01T00:00:00Z",
+                "lastMessage": "",
+            }
+            for r in records
+        }
+    }
+    (workdir / "state.json").write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    # Sitemap: most slugs unchanged, a fraction with a new lastmod, a few
+    # new slugs, and a few existing slugs absent from the sitemap.
+    entries: List[Dict[str, Any]] = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.005:
+            continue  # absent
+        lastmod = "2026-02-01T00:00:00+00:00" if roll < changed + 0.005 else "2026-01-01T00:00:00+00:00"
+        entries.append({"slug": f"synthetic-{i:06d}", "lastmod": lastmod})
+    for i in range(count, count + max(1, count // 200)):
+        entries.append({"slug": f"synthetic-{i:06d}", "lastmod": "2026-02-01T00:00:00+00:00"})
+    (workdir / "sitemap.json").write_text(json.dumps(entries), encoding="utf-8")
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process. VmHWM is preferred over ru_maxrss, which
+    Linux carries over from the parent across fork/exec."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode: str, workdir: Path) -> None:
+    import medicaments_updater as mu
+
+    out_json = workdir / f"out-{mode}.json"
+    shutil.copyfile(workdir / "existing.json", out_json)
+    state_json = workdir / f"state-{mode}.json"
+    shutil.copyfile(workdir / "state.json", state_json)
+
+    mu.OUTPUT_JSON = out_json
+    mu.STATE_JSON = state_json
+    mu.ROOT_DIR = workdir
+    mu.parse_sitemap_index = lambda: ["synthetic"]
+
+    def fake_entries(_url: str) -> List[Any]:
+        listing = json.loads((workdir / "sitemap.json").read_text(encoding="utf-8"))
+        return [
+            mu.SitemapEntry(url=f"https://medicament.ma/medicament/{e['slug']}/", slug=e["slug"], lastmod=e["lastmod"])
+            for e in listing
+        ]
+
+    def fake_fetch(entry: Any, **_kwargs: Any) -> Any:
+        i = int(entry.slug.rsplit("-", 1)[1])
+        return entry.slug, "ok", synthetic_record(i, random.Random(i), revision=1), ""
+
+    mu.parse_sitemap_entries = fake_entries
+    mu.fetch_and_parse_medicament = fake_fetch
+
+    sys.argv = [
+        "medicaments_updater.py", "--skip-dedup", "--skip-facets", "--no-snapshots",
+        "--request-delay", "0", "--request-jitter", "0",
+    ]
+    if mode == "streaming":
+        sys.argv.append("--streaming")
+
+    started = time.perf_counter()
+    code = mu.main()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"mode": mode, "exit": code, "seconds": round(elapsed, 2), "peakRssMb": round(peak_rss_mb(), 1)}))
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Compare updater peak memory: in-memory vs streaming merge")
+    parser.add_argument("--records", type=int, default=100_000, help="Synthetic dataset size (default 100000)")
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of records with a new lastmod (default 0.01)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "WORKDIR"), help=argparse.SUPPRESS)
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    if args.child:
+        run_child(args.child[0], Path(args.child[1]))
+        return 0
+
+    with tempfile.TemporaryDirectory(prefix="updater-bench-") as tmp:
+        workdir = Path(tmp)
+        print(f"Building {args.records} synthetic records in {workdir} ...")
+        build_dataset(workdir, args.records, args.changed, args.seed)
+        size_mb = (workdir / "existing.json").stat().st_size / 1e6
+        print(f"Existing dataset: {size_mb:.1f} MB")
+
+        results = []
+        for mode in ("memory", "streaming"):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child", mode, str(workdir)],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            if proc.returncode != 0:
+                print(proc.stderr, file=sys.stderr)
+                return 1
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:>9}: exit={result['exit']} {result['seconds']:>6.2f}s  peak RSS {result['peakRssMb']:>7.1f} MB")
+
+        same = (workdir / "out-memory.json").read_bytes() == (workdir / "out-streaming.json").read_bytes()
+        print(f"Outputs identical: {same}")
+        # State headers (generatedAt, memory figures) and the run timestamps
+        # of the entries differ between the runs; the rest must not
+        states = [
+            [(slug, {k: v for k, v in entry.items() if k not in ("lastSeenAt", "lastFetchedAt")})
+             for slug, entry in json.loads((workdir / f"state-{mode}.json").read_text(encoding="utf-8"))["records"].items()]
+            for mode in ("memory", "streaming")
+        ]
+        same_state = states[0] == states[1]
+        print(f"State records identical: {same_state}")
+        same = same and same_state
+        if results[0]["peakRssMb"]:
+            print(f"Peak RSS reduction: {100 * (1 - results[1]['peakRssMb'] / results[0]['peakRssMb']):.0f}%")
+        return 0 if same else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,156 @@
+"""Persistent TTL cache for parsed pharmacy detail pages.
+
+A pharmacy's name, address and phone almost never change, yet the
+annuaire-gratuit.ma scraper used to fetch one detail page per listing card
+on every run. This cache keeps the parsed fields per detail URL:
+
+- fresh entries (younger than the TTL) are used without any request;
+- stale entries are revalidated with a conditional GET (If-None-Match /
+  If-Modified-Since) when the server sent validators; a 304 refreshes the
+  entry, a 200 replaces it;
+- if a refetch fails, the stale entry is still used (stale-if-error).
+
+Entries not used for `ttl * PRUNE_AFTER_TTLS` are dropped when saving.
+
+The cache file (`.cache/pharmacies/<name>.json`, or under
+PHARMACY_CACHE_DIR) is not published; CI persists it between runs with
+actions/cache.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+CACHE_DIR = Path(os.getenv("PHARMACY_CACHE_DIR") or BASE_DIR / ".cache" / "pharmacies")
+
+DEFAULT_TTL_DAYS = 30.0
+PRUNE_AFTER_TTLS = 3
+
+logger = logging.getLogger("detail_cache")
+
+
+class DetailCache:
+    """URL → parsed fields, with fetch time and HTTP validators."""
+
+    def __init__(self, path: Path, ttl_days: float = DEFAULT_TTL_DAYS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stale_used": 0, "errors": 0}
+        self._load()
+
+    @classmethod
+    def for_source(cls, name: str, ttl_env: str) -> "DetailCache":
+        """Cache file `.cache/pharmacies/<name>.json`, TTL in days from *ttl_env*."""
+        try:
+            ttl_days = float(os.getenv(ttl_env, str(DEFAULT_TTL_DAYS)))
+        except ValueError:
+            logger.warning("Invalid %s, using %s days", ttl_env, DEFAULT_TTL_DAYS)
+            ttl_days = DEFAULT_TTL_DAYS
+        return cls(CACHE_DIR / f"{name}.json", ttl_days)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable cache %s: %s", self.path, exc)
+            return
+        entries = payload.get("entries") if isinstance(payload, dict) else None
+        if isinstance(entries, dict):
+            self._entries = {
+                url: entry for url, entry in entries.items()
+                if isinstance(entry, dict) and isinstance(entry.get("data"), dict)
+            }
+
+    def lookup(self, url: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+        """Return (fresh data or None, conditional request headers for a refetch)."""
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return None, {}
+        if time.time() - float(entry.get("fetched_at", 0)) < self.ttl:
+            with self._lock:
+                self.stats["hits"] += 1
+                entry["used_at"] = time.time()
+            return dict(entry["data"]), {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return None, headers
+
+    def store(self, url: str, data: Dict[str, Any], etag: str = "", last_modified: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self.stats["misses"] += 1
+            self._entries[url] = {
+                "data": data,
+                "fetched_at": now,
+                "used_at": now,
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+
+    def revalidated(self, url: str) -> Optional[Dict[str, Any]]:
+        """Record a 304 for *url*; returns the cached data."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            self.stats["revalidated"] += 1
+            entry["fetched_at"] = now
+            entry["used_at"] = now
+            return dict(entry["data"])
+
+    def stale(self, url: str) -> Optional[Dict[str, Any]]:
+        """Cached data regardless of age (used when a refetch failed)."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.stats["errors"] += 1
+                return None
+            self.stats["stale_used"] += 1
+            entry["used_at"] = time.time()
+            return dict(entry["data"])
+
+    def reset_stats(self) -> None:
+        """Zero the counters (a long-running process reuses one instance per run)."""
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counters plus hit rate (fresh hits and 304s over all lookups)."""
+        with self._lock:
+            stats = dict(self.stats)
+            size = len(self._entries)
+        lookups = sum(stats.values())
+        stats["entries"] = size
+        stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else None
+        return stats
+
+    def save(self) -> None:
+        cutoff = time.time() - self.ttl * PRUNE_AFTER_TTLS
+        with self._lock:
+            entries = {
+                url: entry for url, entry in sorted(self._entries.items())
+                if float(entry.get("used_at", entry.get("fetched_at", 0))) >= cutoff
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({"version": 1, "ttl_days": self.ttl / 86400, "entries": entries}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
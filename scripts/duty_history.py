@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Append-only archive of the published duty pharmacies, one segment per day.
+
+pharmacies.json only holds the current list; every run also appends its
+rows here, so which pharmacy was on duty when is kept (rotation analysis,
+filling in for a source that is down).
+
+Layout (default `data/pharmacy_history/`, committed by the workflow;
+PHARMACY_HISTORY_DIR overrides it):
+    pharmacies.json                  interned pharmacies: id = position,
+                                     {"city", "name", "phone", "address"}
+    segments/2026-02-24.ndjson.zst   duty rows of one day, one compact JSON
+                                     object per line: {"p": id, "area",
+                                     "duty", "sources_count", "at"}
+    index.json                       day -> {"file", "rows", "cities"} and
+                                     pharmacy id -> days with a row
+
+Rows are only ever added: a run appends the (pharmacy, duty) pairs its
+day's segment does not have yet, and segments of past days are left as
+they are unless a late run adds to them. A segment is rewritten atomically
+with its old rows first, so a crash never leaves a truncated file.
+Segments are compressed with zstd when `zstandard` is installed, gzip
+otherwise (see medicament_snapshots.py); each keeps the codec it was
+written with.
+
+Pharmacies are interned by city and name (accents, case and the
+"Pharmacie" prefix ignored); ids never change once given. The index
+answers both queries without scanning the archive: a pharmacy's history
+reads only the segments of its days, a city's duty list reads one segment.
+
+Usage:
+    python scripts/duty_history.py                                  # archive statistics
+    python scripts/duty_history.py --city Rabat --date 2026-02-24    # who was on duty
+    python scripts/duty_history.py --city Rabat --pharmacy "Pharmacie Al Amal"
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from medicament_snapshots import DEFAULT_CODEC, compress, decompress
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+HISTORY_DIR = Path(os.getenv("PHARMACY_HISTORY_DIR") or ROOT_DIR / "data" / "pharmacy_history")
+
+logger = logging.getLogger("duty_history")
+
+_PREFIX_RE = re.compile(r"^pharmacie\s+(de\s+|du\s+|des\s+)?")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def city_key(city: str) -> str:
+    return _NON_ALNUM_RE.sub("", _fold(city))
+
+
+def identity_key(city: str, name: str) -> str:
+    """Interning key of a pharmacy: folded city and name without the prefix."""
+    return f"{city_key(city)}|{_NON_ALNUM_RE.sub('', _PREFIX_RE.sub('', _fold(name)))}"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def _json_lines(payload: Dict[str, Any], expand: Tuple[str, ...]) -> bytes:
+    """Compact JSON with one line per entry of the *expand* mappings/lists,
+    so a run that touches a few entries makes a small diff."""
+    parts = []
+    for key, value in payload.items():
+        if key in expand and isinstance(value, dict):
+            body = ",\n".join(f"{json.dumps(k)}:{json.dumps(v, ensure_ascii=False, separators=(',', ':'))}"
+                              for k, v in value.items())
+            parts.append(f"{json.dumps(key)}:{{\n{body}\n}}" if body else f"{json.dumps(key)}:{{}}")
+        elif key in expand and isinstance(value, list):
+            body = ",\n".join(json.dumps(v, ensure_ascii=False, separators=(",", ":")) for v in value)
+            parts.append(f"{json.dumps(key)}:[\n{body}\n]" if body else f"{json.dumps(key)}:[]")
+        else:
+            parts.append(f"{json.dumps(key)}:{json.dumps(value, ensure_ascii=False)}")
+    return ("{" + ",\n".join(parts) + "}\n").encode("utf-8")
+
+
+class DutyHistory:
+    """The archive: interned pharmacies, day segments and their index."""
+
+    def __init__(self, root: Path = HISTORY_DIR, codec: str = DEFAULT_CODEC):
+        self.root = root
+        self.codec = codec
+        self.segments_dir = root / "segments"
+        self.pharmacies_path = root / "pharmacies.json"
+        self.index_path = root / "index.json"
+        self._pharmacies: List[Dict[str, str]] = []
+        self._ids: Dict[str, int] = {}
+        self._days: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[int, List[str]] = {}
+        self._dirty = False
+        self.stats = {"rows_appended": 0, "pharmacies_added": 0, "segments_written": 0}
+        self._load()
+
+    @classmethod
+    def default(cls) -> "DutyHistory":
+        return cls(HISTORY_DIR)
+
+    def _load(self) -> None:
+        try:
+            if self.pharmacies_path.exists():
+                table = json.loads(self.pharmacies_path.read_text(encoding="utf-8"))
+                self._pharmacies = list(table.get("pharmacies", []))
+            if self.index_path.exists():
+                index = json.loads(self.index_path.read_text(encoding="utf-8"))
+                self._days = dict(index.get("days", {}))
+                self._postings = {int(pid): list(days) for pid, days in index.get("pharmacy_days", {}).items()}
+        except Exception as exc:  # noqa: BLE001
+            # Never append to an archive that cannot be read back: ids would clash
+            raise RuntimeError(f"unreadable duty history in {self.root}: {exc}") from exc
+        self._ids = {identity_key(ph["city"], ph["name"]): pid for pid, ph in enumerate(self._pharmacies)}
+
+    def reset_stats(self) -> None:
+        for key in self.stats:
+            self.stats[key] = 0
+
+    # -- pharmacies -------------------------------------------------------
+    def pharmacy_id(self, city: str, name: str) -> Optional[int]:
+        return self._ids.get(identity_key(city, name))
+
+    def pharmacy(self, pid: int) -> Dict[str, str]:
+        return self._pharmacies[pid]
+
+    def _intern(self, record: Dict[str, Any]) -> int:
+        key = identity_key(record["city"], record["name"])
+        pid = self._ids.get(key)
+        if pid is None:
+            pid = self._ids[key] = len(self._pharmacies)
+            self._pharmacies.append({"city": record["city"], "name": record["name"], "phone": "", "address": ""})
+            self.stats["pharmacies_added"] += 1
+            self._dirty = True
+        entry = self._pharmacies[pid]
+        # Contact fields follow the latest non-empty values; the id stays
+        for field in ("phone", "address"):
+            if record.get(field) and record[field] != entry[field]:
+                entry[field] = record[field]
+                self._dirty = True
+        return pid
+
+    # -- segments ---------------------------------------------------------
+    def days(self) -> List[str]:
+        return sorted(self._days)
+
+    def _segment_path(self, day: str) -> Path:
+        entry = self._days.get(day)
+        if entry:
+            return self.segments_dir / entry["file"]
+        return self.segments_dir / f"{day}.ndjson.{self.codec}"
+
+    def _read_segment(self, day: str) -> List[Dict[str, Any]]:
+        if day not in self._days:
+            return []
+        path = self._segment_path(day)
+        codec = path.suffix.lstrip(".")
+        text = decompress(path.read_bytes(), codec).decode("utf-8")
+        return [json.loads(line) for line in text.splitlines() if line]
+
+    def append(self, records: Iterable[Dict[str, Any]], at: Optional[str] = None) -> int:
+        """Add the rows of *records* (published pharmacy dicts with city,
+        name, date, area, duty, ...) missing from their day's segment.
+        Returns the number of rows added."""
+        at = at or datetime.now(timezone.utc).isoformat(timespec="seconds")
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for rec in records:
+            if rec.get("date") and rec.get("name") and rec.get("city"):
+                by_day.setdefault(rec["date"], []).append(rec)
+
+        added = 0
+        for day, day_records in sorted(by_day.items()):
+            rows = self._read_segment(day)
+            seen = {(row["p"], row.get("duty", "")) for row in rows}
+            new_rows = []
+            for rec in day_records:
+                pid = self._intern(rec)
+                if (pid, rec.get("duty", "")) in seen:
+                    continue
+                seen.add((pid, rec.get("duty", "")))
+                new_rows.append({
+                    "p": pid, "area": rec.get("area", ""), "duty": rec.get("duty", ""),
+                    "sources_count": rec.get("sources_count", 1), "at": at,
+                })
+            if not new_rows:
+                continue
+
+            rows.extend(new_rows)
+            path = self._segment_path(day)
+            codec = path.suffix.lstrip(".")
+            data = "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows)
+            _write_atomic(path, compress(data.encode("utf-8"), codec))
+            self.stats["segments_written"] += 1
+
+            cities = Counter(self._pharmacies[row["p"]]["city"] for row in rows)
+            self._days[day] = {"file": path.name, "rows": len(rows), "cities": dict(sorted(cities.items()))}
+            for pid in {row["p"] for row in new_rows}:
+                days = self._postings.setdefault(pid, [])
+                if day not in days:
+                    days.append(day)
+                    days.sort()
+            added += len(new_rows)
+            self._dirty = True
+        self.stats["rows_appended"] += added
+        return added
+
+    # -- queries ----------------------------------------------------------
+    def _row(self, day: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        ph = self._pharmacies[row["p"]]
+        return {"date": day, "id": row["p"], "city": ph["city"], "name": ph["name"], "phone": ph["phone"],
+                "area": row.get("area", ""), "duty": row.get("duty", ""),
+                "sources_count": row.get("sources_count", 1)}
+
+    def on_duty(self, city: str, day: str) -> List[Dict[str, Any]]:
+        """Pharmacies on duty in *city* on *day* (reads one segment)."""
+        entry = self._days.get(day)
+        wanted = city_key(city)
+        if not entry or not any(city_key(name) == wanted for name in entry.get("cities", {})):
+            return []
+        return [
+            self._row(day, row) for row in self._read_segment(day)
+            if city_key(self._pharmacies[row["p"]]["city"]) == wanted
+        ]
+
+    def pharmacy_history(self, pid: int, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Duty rows of pharmacy *pid*, oldest first (reads only its days)."""
+        rows = []
+        for day in self._postings.get(pid, []):
+            if (since and day < since) or (until and day > until):
+                continue
+            rows.extend(self._row(day, row) for row in self._read_segment(day) if row["p"] == pid)
+        return rows
+
+    def day_cities(self, day: str) -> Dict[str, int]:
+        """Rows per city on *day*, from the index alone."""
+        return dict(self._days.get(day, {}).get("cities", {}))
+
+    def duty_days(self, pid: int) -> List[str]:
+        """Days pharmacy *pid* was on duty, from the index alone."""
+        return list(self._postings.get(pid, []))
+
+    def city_pharmacies(self, city: str) -> List[int]:
+        wanted = city_key(city)
+        return [pid for pid, ph in enumerate(self._pharmacies) if city_key(ph["city"]) == wanted]
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        _write_atomic(self.pharmacies_path, _json_lines({"version": 1, "pharmacies": self._pharmacies}, ("pharmacies",)))
+        index = {
+            "version": 1,
+            "days": dict(sorted(self._days.items())),
+            "pharmacy_days": {str(pid): days for pid, days in sorted(self._postings.items())},
+        }
+        _write_atomic(self.index_path, _json_lines(index, ("days", "pharmacy_days")))
+        self._dirty = False
+
+    def summary(self) -> Dict[str, Any]:
+        size = sum(p.stat().st_size for p in self.segments_dir.glob("*") if p.is_file()) if self.segments_dir.exists() else 0
+        days = self.days()
+        return {
+            "days": len(days),
+            "first_day": days[0] if days else None,
+            "last_day": days[-1] if days else None,
+            "rows": sum(entry["rows"] for entry in self._days.values()),
+            "pharmacies": len(self._pharmacies),
+            "segment_bytes": size,
+        }
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Query the duty pharmacy history archive")
+    parser.add_argument("--dir", type=Path, default=HISTORY_DIR, help="Archive directory")
+    parser.add_argument("--city", help="City of the query")
+    parser.add_argument("--date", help="With --city: pharmacies on duty that day (YYYY-MM-DD)")
+    parser.add_argument("--pharmacy", help="With --city: duty history of this pharmacy")
+    parser.add_argument("--since", help="With --pharmacy: first day (YYYY-MM-DD)")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    history = DutyHistory(args.dir)
+
+    if args.city and args.date:
+        for row in history.on_duty(args.city, args.date):
+            print(f"{row['name']:<40} {row['area']:<28} {row['duty']}")
+        return 0
+    if args.city and args.pharmacy:
+        pid = history.pharmacy_id(args.city, args.pharmacy)
+        if pid is None:
+            logger.error("No pharmacy %r in %s in the archive", args.pharmacy, args.city)
+            return 1
+        for row in history.pharmacy_history(pid, since=args.since):
+            print(f"{row['date']}  {row['duty']:<16} {row['area']}")
+        return 0
+    if args.date or args.pharmacy:
+        logger.error("--date and --pharmacy need --city")
+        return 2
+
+    summary = history.summary()
+    logger.info("%s: %d days (%s .. %s), %d rows, %d pharmacies, %.1f KB of segments",
+                args.dir, summary["days"], summary["first_day"], summary["last_day"],
+                summary["rows"], summary["pharmacies"], summary["segment_bytes"] / 1e3)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Predict a city's duty pharmacies from its recorded rotation.
+
+Duty pharmacies take turns: within an area, each pharmacy comes back on
+duty every `period` days, for a stint of one or more consecutive days. The
+duty history (duty_history.py) holds enough past days to recover that
+cycle, so when a source fails and a city is missing from a run, its list
+can be predicted instead of dropped or re-scraped under time pressure.
+
+For every pharmacy of the city seen in the last `lookback_days`:
+- its duty days are grouped into stints (runs of consecutive days);
+- its period is the most common gap between stint starts — its own when it
+  has at least two gaps, otherwise the one pooled over its area;
+- it is predicted on duty on *day* when *day* falls inside a stint
+  projected from its last one.
+
+Confidence = regularity (share of its gaps within a day of the period)
+x support (grows to 1 with three observed gaps) x 0.9 per extra cycle
+projected. Predictions below `min_confidence` are dropped, and a city keeps
+at most its usual number of rows (median of the days it was archived),
+most confident first.
+
+A city is missing when it was archived on at least half of the last
+`EXPECTED_WINDOW_DAYS` archived days but has no record in the run.
+
+Usage:
+    python scripts/duty_rotation.py --city Rabat --date 2026-03-02
+    python scripts/duty_rotation.py --missing Casablanca,Rabat --date 2026-03-02
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from duty_history import HISTORY_DIR, DutyHistory, city_key
+
+logger = logging.getLogger("duty_rotation")
+
+LOOKBACK_DAYS = 120          # history used to learn the rotation
+EXPECTED_WINDOW_DAYS = 7     # recent archived days deciding which cities are expected
+MIN_CONFIDENCE = 0.5
+FULL_SUPPORT_GAPS = 3        # observed gaps for full support
+CYCLE_DECAY = 0.9            # confidence factor per extra projected cycle
+
+
+@dataclass
+class Prediction:
+    pharmacy_id: int
+    city: str
+    name: str
+    phone: str
+    address: str
+    area: str
+    duty: str
+    confidence: float
+    period: int
+    last_seen: str
+
+
+def _stints(days: List[date]) -> List[Tuple[date, int]]:
+    """(start, length) of each run of consecutive *days* (sorted)."""
+    stints: List[Tuple[date, int]] = []
+    for day in days:
+        if stints and day == stints[-1][0] + timedelta(days=stints[-1][1]):
+            stints[-1] = (stints[-1][0], stints[-1][1] + 1)
+        else:
+            stints.append((day, 1))
+    return stints
+
+
+def _gaps(stints: List[Tuple[date, int]]) -> List[int]:
+    return [(b[0] - a[0]).days for a, b in zip(stints, stints[1:])]
+
+
+def _mode(values: Iterable[int]) -> Optional[int]:
+    counts = Counter(values)
+    if not counts:
+        return None
+    # Most common; the shorter period on ties
+    return min(counts, key=lambda v: (-counts[v], v))
+
+
+def _regularity(gaps: List[int], period: int) -> float:
+    return sum(1 for gap in gaps if abs(gap - period) <= 1) / len(gaps) if gaps else 0.0
+
+
+class RotationPredictor:
+    """Rotation-based duty predictions over a `DutyHistory`."""
+
+    def __init__(
+        self,
+        history: DutyHistory,
+        lookback_days: int = LOOKBACK_DAYS,
+        min_confidence: float = MIN_CONFIDENCE,
+    ):
+        self.history = history
+        self.lookback_days = lookback_days
+        self.min_confidence = min_confidence
+
+    def expected_cities(self, day: str) -> Dict[str, int]:
+        """Cities archived on at least half of the recent archived days
+        before *day*, with their usual (median) row count."""
+        recent = [d for d in self.history.days() if d < day][-EXPECTED_WINDOW_DAYS:]
+        counts: Dict[str, List[int]] = {}
+        for d in recent:
+            for city, rows in self.history.day_cities(d).items():
+                counts.setdefault(city, []).append(rows)
+        return {
+            city: int(statistics.median(rows))
+            for city, rows in counts.items()
+            if len(rows) * 2 >= len(recent)
+        }
+
+    def predict_city(self, city: str, day: str, limit: Optional[int] = None) -> List[Prediction]:
+        """Pharmacies predicted on duty in *city* on *day*, most confident first."""
+        target = date.fromisoformat(day)
+        since = (target - timedelta(days=self.lookback_days)).isoformat()
+        days_by_pid: Dict[int, List[date]] = {}
+        areas: Dict[int, Counter] = {}
+        duties: Dict[int, Counter] = {}
+        for d in self.history.days():
+            if not since <= d < day:
+                continue
+            for row in self.history.on_duty(city, d):
+                pid = row["id"]
+                days_by_pid.setdefault(pid, []).append(date.fromisoformat(d))
+                areas.setdefault(pid, Counter())[row["area"]] += 1
+                duties.setdefault(pid, Counter())[row["duty"]] += 1
+
+        stints = {pid: _stints(sorted(set(days))) for pid, days in days_by_pid.items()}
+        area_of = {pid: counter.most_common(1)[0][0] for pid, counter in areas.items()}
+        area_gaps: Dict[str, List[int]] = {}
+        for pid, pid_stints in stints.items():
+            area_gaps.setdefault(area_of[pid], []).extend(_gaps(pid_stints))
+
+        predictions = []
+        for pid, pid_stints in stints.items():
+            gaps = _gaps(pid_stints)
+            pooled = area_gaps[area_of[pid]]
+            if len(gaps) >= 2:
+                period = _mode(gaps)
+                regularity = _regularity(gaps, period)
+            else:
+                period = _mode(pooled)
+                # Borrowed from the area: trusted less
+                regularity = _regularity(pooled, period) * 0.8 if period else 0.0
+            if not period:
+                continue
+
+            start, _ = pid_stints[-1]
+            length = _mode(n for _, n in pid_stints) or 1
+            elapsed = (target - start).days
+            if elapsed % period >= length:
+                continue
+            cycles = max(1, -(-elapsed // period))
+            support = min(1.0, max(len(gaps), 1) / FULL_SUPPORT_GAPS)
+            confidence = round(regularity * support * CYCLE_DECAY ** (cycles - 1), 2)
+            if confidence < self.min_confidence:
+                continue
+            ph = self.history.pharmacy(pid)
+            predictions.append(Prediction(
+                pharmacy_id=pid, city=ph["city"], name=ph["name"], phone=ph["phone"],
+                address=ph["address"], area=area_of[pid], duty=duties[pid].most_common(1)[0][0],
+                confidence=confidence, period=period, last_seen=max(days_by_pid[pid]).isoformat(),
+            ))
+
+        predictions.sort(key=lambda p: (-p.confidence, p.name))
+        return predictions[:limit] if limit is not None else predictions
+
+    def fill_missing(self, present_cities: Iterable[str], day: str) -> Dict[str, List[Prediction]]:
+        """Predictions for the expected cities absent from *present_cities*:
+        {city: predictions} (cities without a confident prediction left out)."""
+        present = {city_key(city) for city in present_cities}
+        filled = {}
+        for city, usual in sorted(self.expected_cities(day).items()):
+            if city_key(city) in present:
+                continue
+            predictions = self.predict_city(city, day, limit=usual)
+            if predictions:
+                filled[city] = predictions
+        return filled
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Predict duty pharmacies from the recorded rotation")
+    parser.add_argument("--dir", type=Path, default=HISTORY_DIR, help="Duty history directory")
+    parser.add_argument("--date", required=True, help="Day to predict (YYYY-MM-DD)")
+    parser.add_argument("--city", help="Predict this city")
+    parser.add_argument("--missing", help="Comma-separated cities present in a run: predict the other expected ones")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    predictor = RotationPredictor(DutyHistory(args.dir), min_confidence=args.min_confidence)
+    if args.city:
+        results = {args.city: predictor.predict_city(args.city, args.date)}
+    elif args.missing is not None:
+        results = predictor.fill_missing(filter(None, args.missing.split(",")), args.date)
+    else:
+        logger.error("Give --city or --missing")
+        return 2
+    for city, predictions in results.items():
+        print(f"{city}: {len(predictions)} predicted")
+        for p in predictions:
+            print(f"  {p.confidence:.2f}  {p.name:<40} {p.area:<28} every {p.period}d, last {p.last_seen}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
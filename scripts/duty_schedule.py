@@ -0,0 +1,172 @@
+"""Dated duty-schedule store for sources that publish a whole week at once.
+
+guidepharmacies.ma shows the full weekly rota on each city page. The
+scraper parses every day of it into this store so that later runs in the
+same week (the 20:30 evening run, a midnight pre-publish run) can be
+answered without downloading the page again.
+
+Layout (`.cache/pharmacies/<name>.json`, not published):
+    {"cities": {"Rabat": {"url": ..., "fetched_at": 1730000000.0,
+                          "etag": ..., "last_modified": ...,
+                          "days": {"2026-02-23": [{pharmacy fields}, ...]}}}}
+
+Freshness: stored rows for a date are served as-is while the city page is
+younger than `max_age_hours`; after that the page is revalidated with a
+conditional GET (304 keeps the rows) or refetched. Days older than
+`KEEP_PAST_DAYS` are dropped when saving.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from detail_cache import CACHE_DIR
+
+DEFAULT_MAX_AGE_HOURS = 13.0
+KEEP_PAST_DAYS = 7
+
+logger = logging.getLogger("duty_schedule")
+
+
+class ScheduleStore:
+    """City → {ISO date → rows}, with fetch time and HTTP validators."""
+
+    def __init__(self, path: Path, max_age_hours: float = DEFAULT_MAX_AGE_HOURS):
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+        self._cities: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stale_used": 0, "errors": 0}
+        self._load()
+
+    @classmethod
+    def for_source(cls, name: str, max_age_env: str) -> "ScheduleStore":
+        """Store file `.cache/pharmacies/<name>.json`, max age in hours from *max_age_env*."""
+        try:
+            max_age = float(os.getenv(max_age_env, str(DEFAULT_MAX_AGE_HOURS)))
+        except ValueError:
+            logger.warning("Invalid %s, using %s hours", max_age_env, DEFAULT_MAX_AGE_HOURS)
+            max_age = DEFAULT_MAX_AGE_HOURS
+        return cls(CACHE_DIR / f"{name}.json", max_age)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable schedule store %s: %s", self.path, exc)
+            return
+        cities = payload.get("cities") if isinstance(payload, dict) else None
+        if isinstance(cities, dict):
+            self._cities = {
+                city: entry for city, entry in cities.items()
+                if isinstance(entry, dict) and isinstance(entry.get("days"), dict)
+            }
+
+    def _entry(self, city: str, url: str) -> Optional[Dict[str, Any]]:
+        entry = self._cities.get(city)
+        if entry is None or entry.get("url") != url:
+            return None
+        return entry
+
+    def lookup(self, city: str, url: str, date: str) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, str]]:
+        """Return (rows for *date* if fresh, conditional headers for a refetch).
+
+        Validators are only offered when the stored week covers *date*, so
+        a 304 always leaves usable rows behind.
+        """
+        with self._lock:
+            entry = self._entry(city, url)
+            if entry is None or date not in entry["days"]:
+                return None, {}
+            if time.time() - float(entry.get("fetched_at", 0)) < self.max_age:
+                self.stats["hits"] += 1
+                return list(entry["days"][date]), {}
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return None, headers
+
+    def put(
+        self,
+        city: str,
+        url: str,
+        days: Dict[str, List[Dict[str, Any]]],
+        etag: str = "",
+        last_modified: str = "",
+    ) -> None:
+        with self._lock:
+            self.stats["misses"] += 1
+            previous = self._entry(city, url)
+            merged = dict(previous["days"]) if previous else {}
+            merged.update(days)
+            self._cities[city] = {
+                "url": url,
+                "fetched_at": time.time(),
+                "etag": etag,
+                "last_modified": last_modified,
+                "days": merged,
+            }
+
+    def revalidated(self, city: str, url: str, date: str) -> Optional[List[Dict[str, Any]]]:
+        """Record a 304 for *city*; returns the stored rows for *date*."""
+        with self._lock:
+            entry = self._entry(city, url)
+            if entry is None or date not in entry["days"]:
+                return None
+            self.stats["revalidated"] += 1
+            entry["fetched_at"] = time.time()
+            return list(entry["days"][date])
+
+    def stale(self, city: str, url: str, date: str) -> Optional[List[Dict[str, Any]]]:
+        """Stored rows for *date* regardless of age (used when a refetch failed)."""
+        with self._lock:
+            entry = self._entry(city, url)
+            if entry is None or date not in entry["days"]:
+                self.stats["errors"] += 1
+                return None
+            self.stats["stale_used"] += 1
+            return list(entry["days"][date])
+
+    def dates(self, city: str) -> List[str]:
+        with self._lock:
+            entry = self._cities.get(city)
+            return sorted(entry["days"]) if entry else []
+
+    def reset_stats(self) -> None:
+        """Zero the counters (a long-running process reuses one instance per run)."""
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counters plus hit rate (store hits and 304s over all lookups)."""
+        with self._lock:
+            stats = dict(self.stats)
+            days = sorted({d for entry in self._cities.values() for d in entry["days"]})
+        lookups = sum(stats.values())
+        stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else None
+        stats["dates"] = [days[0], days[-1]] if days else []
+        return stats
+
+    def save(self, today: str) -> None:
+        cutoff = (dt.date.fromisoformat(today) - dt.timedelta(days=KEEP_PAST_DAYS)).isoformat()
+        with self._lock:
+            cities = {}
+            for city, entry in sorted(self._cities.items()):
+                days = {d: rows for d, rows in sorted(entry["days"].items()) if d >= cutoff}
+                if days:
+                    cities[city] = {**entry, "days": days}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"version": 1, "cities": cities}, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
@@ -0,0 +1,257 @@
+"""asyncio fetch scheduler shared by the pharmacy sources.
+
+Each source is a coroutine that awaits `engine.get(url)`. Requests are
+grouped by host; every host has its own politeness policy:
+
+- `concurrency`  — requests in flight at once;
+- `min_interval` — minimum spacing between request starts.
+
+The blocking HTTP call itself (`requests` + retries) runs in a thread pool
+sized to the sum of the host budgets, so sources no longer sleep between
+pages and the wall time is bounded by the slowest host's budget instead of
+the sum of every source's sleeps.
+
+Sources can be given deadlines (`gather_sources(..., deadlines=...)`).
+Past its deadline a source's `engine.get` calls raise `DeadlineExceeded`
+— queued requests are skipped and in-flight ones abandoned (their host
+slot stays taken until the request thread ends) — so the source's own
+error handling ends it early with the records it already has. A source still running `DEADLINE_GRACE` seconds later is cancelled.
+
+`gather_sources` runs each source under its own `SourceTelemetry`
+(source_telemetry.py); the engine records requests, bytes, fetch time and
+pacing waits into it, and fetch threads run in the source's context.
+With tracing on (tracing.py) each source is a span holding its requests'
+spans, ending with its telemetry as attributes.
+
+Usage:
+    engine = FetchEngine(get_with_retry, {"lematin.ma": HostPolicy(4, 0.3)})
+    results = run_sources(engine, {"lematin.ma": scrape_lematin})
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import tracing
+from source_telemetry import SourceTelemetry, collecting, record
+
+logger = logging.getLogger("fetch_engine")
+
+DEADLINE_GRACE = 5.0  # seconds a source gets to wrap up after its deadline
+
+
+class DeadlineExceeded(TimeoutError):
+    """The current source's deadline has passed."""
+
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("source_deadline", default=None)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current source's deadline (`time.monotonic` based),
+    or None without a deadline. Negative once it has passed."""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _check_deadline(url: str) -> Optional[float]:
+    left = time_left()
+    if left is not None and left <= 0:
+        record(deadline_skips=1)
+        raise DeadlineExceeded(f"source deadline passed, skipped {url}")
+    return left
+
+
+@dataclass(frozen=True)
+class HostPolicy:
+    concurrency: int = 1
+    min_interval: float = 0.5
+
+
+class _HostSlot:
+    """Per-host semaphore, pacing state and counters (event-loop thread only)."""
+
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.semaphore = asyncio.Semaphore(max(1, policy.concurrency))
+        self.next_allowed = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.fetch_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def release_when_done(self, future: "asyncio.Future[Any]") -> None:
+        """Free the concurrency slot once *future*'s request thread is done,
+        even if the task that started it gave up waiting for it."""
+        def done(fut: "asyncio.Future[Any]") -> None:
+            self.semaphore.release()
+            if not fut.cancelled():
+                fut.exception()  # an abandoned request's error is not "never retrieved"
+
+        future.add_done_callback(done)
+
+    async def pace(self) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        wait_until = self.next_allowed
+        self.next_allowed = max(now, wait_until) + self.policy.min_interval
+        delay = wait_until - now
+        if delay > 0:
+            self.wait_seconds += delay
+            record(wait_seconds=delay)
+            await asyncio.sleep(delay)
+
+
+def host_of(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class FetchEngine:
+    """Schedules blocking fetches under per-host concurrency and pacing limits."""
+
+    def __init__(
+        self,
+        fetch: Callable[..., Any],
+        policies: Optional[Dict[str, HostPolicy]] = None,
+        default_policy: HostPolicy = HostPolicy(),
+    ):
+        self._fetch = fetch
+        self._policies = {host.lower(): p for host, p in (policies or {}).items()}
+        self._default = default_policy
+        self._slots: Dict[str, _HostSlot] = {}
+        workers = sum(max(1, p.concurrency) for p in self._policies.values()) + max(1, default_policy.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+
+    def _slot(self, host: str) -> _HostSlot:
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = _HostSlot(self._policies.get(host, self._default))
+        return slot
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Any:
+        """Run `fetch(url[, headers=...])` once the host budget allows it."""
+        slot = self._slot(host_of(url))
+        _check_deadline(url)
+        # The slot is held until the request thread ends, not until this task
+        # stops waiting for it: an abandoned request still counts against the
+        # host's concurrency, whichever source queues there next.
+        await slot.semaphore.acquire()
+        future: Optional["asyncio.Future[Any]"] = None
+        try:
+            _check_deadline(url)
+            await slot.pace()
+            left = _check_deadline(url)
+            loop = asyncio.get_running_loop()
+            started = time.monotonic()
+            slot.requests += 1
+            record(requests=1)
+            # The worker thread runs in this task's context (telemetry, deadline)
+            context = contextvars.copy_context()
+            try:
+                if headers:
+                    future = loop.run_in_executor(self._executor, lambda: context.run(self._fetch, url, headers=headers))
+                else:
+                    future = loop.run_in_executor(self._executor, context.run, self._fetch, url)
+                try:
+                    # shield: timing out (or being cancelled) must not mark the
+                    # future done while its thread is still fetching
+                    resp = await asyncio.wait_for(asyncio.shield(future), timeout=left)
+                except asyncio.TimeoutError:
+                    # The thread finishes on its own; its result is dropped
+                    record(deadline_skips=1)
+                    raise DeadlineExceeded(f"source deadline passed, abandoned {url}") from None
+            except Exception:
+                slot.errors += 1
+                record(errors=1)
+                raise
+            finally:
+                elapsed = time.monotonic() - started
+                slot.fetch_seconds += elapsed
+                record(fetch_seconds=elapsed)
+            record(bytes=len(getattr(resp, "content", b"") or b""))
+            return resp
+        finally:
+            if future is None:
+                slot.semaphore.release()
+            else:
+                slot.release_when_done(future)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            host: {
+                "requests": slot.requests,
+                "errors": slot.errors,
+                "fetch_seconds": round(slot.fetch_seconds, 3),
+                "wait_seconds": round(slot.wait_seconds, 3),
+                "concurrency": slot.policy.concurrency,
+                "min_interval": slot.policy.min_interval,
+            }
+            for host, slot in sorted(self._slots.items())
+        }
+
+    def close(self, wait: bool = True) -> None:
+        """Shut the thread pool down; `wait=False` leaves abandoned requests
+        to finish in the background."""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+async def gather_sources(
+    engine: FetchEngine,
+    sources: Dict[str, Callable[[FetchEngine], Awaitable[Any]]],
+    telemetry: Optional[Dict[str, SourceTelemetry]] = None,
+    deadlines: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Await every source coroutine concurrently on *engine* (running loop).
+
+    Returns {name: result}, or {name: exception} for a source that raised
+    (`DeadlineExceeded` for one cancelled after its deadline). If
+    *telemetry* is given it receives each source's `SourceTelemetry`.
+    *deadlines* maps source names to `time.monotonic()` deadlines.
+    """
+    async def run_one(name: str, fn: Callable[[FetchEngine], Awaitable[Any]]) -> Any:
+        source_telemetry = SourceTelemetry()
+        if telemetry is not None:
+            telemetry[name] = source_telemetry
+        deadline = (deadlines or {}).get(name)
+        with collecting(source_telemetry), tracing.span(f"source {name}", source=name) as span:
+            token = _DEADLINE.set(deadline)
+            try:
+                if deadline is None:
+                    return await fn(engine)
+                timeout = max(deadline - time.monotonic(), 0.0) + DEADLINE_GRACE
+                try:
+                    return await asyncio.wait_for(fn(engine), timeout=timeout)
+                except DeadlineExceeded:
+                    raise
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded(f"{name} cancelled {DEADLINE_GRACE:.0f}s after its deadline") from None
+            finally:
+                _DEADLINE.reset(token)
+                if span is not None:
+                    # The span's own duration is the wall time
+                    span.set(**{k: v for k, v in source_telemetry.as_dict().items() if k != "wall_seconds"})
+
+    outcomes = await asyncio.gather(*(run_one(name, fn) for name, fn in sources.items()), return_exceptions=True)
+    return dict(zip(sources, outcomes))
+
+
+def run_sources(
+    engine: FetchEngine,
+    sources: Dict[str, Callable[[FetchEngine], Awaitable[Any]]],
+    telemetry: Optional[Dict[str, SourceTelemetry]] = None,
+    deadlines: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """One-shot `gather_sources` on a fresh event loop; closes *engine*
+    (without waiting for requests abandoned at a deadline)."""
+    try:
+        return asyncio.run(gather_sources(engine, sources, telemetry, deadlines))
+    finally:
+        engine.close(wait=not deadlines)
@@ -2,7 +2,7 @@
 """One-time script to normalize therapeutic classes in existing data.
 
 Reads medicament_ma_optimized.json, applies the normalization function
-from medicaments_updater.py, writes back cleaned data, then regenerates
+from medicament_text.py, writes back cleaned data, then regenerates
 the search index.
 
 Usage:
@@ -14,10 +14,7 @@ import json
 import sys
 from pathlib import Path
 
-# Add scripts dir to path so we can import from medicaments_updater
-sys.path.insert(0, str(Path(__file__).resolve().parent))
-
-from medicaments_updater import normalize_therapeutic_classes  # noqa: E402
+from medicament_text import normalize_therapeutic_classes
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 OPTIMIZED_JSON = ROOT_DIR / "public" / "data" / "medicament_ma_optimized.json"
@@ -0,0 +1,317 @@
+"""Shared HTTP client of the scrapers: pooled session, retries, circuit breakers.
+
+`HttpClient.get` is the one retrying GET used by pharmacies_scraper.py and
+medicaments_updater.py:
+
+- one `requests.Session` with a connection pool sized for the callers'
+  worker threads, so keep-alive connections are reused;
+- retries on connection errors and on 429/5xx answers, waiting either what
+  the server's `Retry-After` asks for (capped) or an exponential backoff
+  with full jitter (uniform in [0, min(max_delay, base_delay x 2^attempt)]);
+- a circuit breaker per host: after `breaker_threshold` consecutive
+  failures the host is "open" and every request to it fails at once with
+  `CircuitOpen` for `breaker_cooldown` seconds; then one trial request is
+  let through, closing the breaker on success and reopening it on failure.
+  A dead host therefore costs a few timeouts, not retries x timeout for
+  every URL;
+- per-host counters (`stats()`, `log_stats()`): requests, responses,
+  errors, retryable statuses, retries, backoff seconds, Retry-After waits,
+  breaker trips and requests failed fast;
+- with tracing on (tracing.py), one "client" span per `get()` — retries
+  included — with host, status, body size, resend count and cache status
+  (`revalidated` for a 304 to a conditional GET, `miss` for a conditional
+  GET answered in full, `none` otherwise).
+
+Non-retryable statuses (404, ...) count as a live host. With
+`raise_for_status=False` they are returned as they are, and so is the last
+retryable answer once retries are exhausted.
+
+Hooks keep the client free of scraper specifics: `time_left()` caps
+timeouts and stops retrying past a deadline, and `on_retry(wait)` is called
+before each backoff (telemetry).
+
+Usage:
+    client = HttpClient(headers=HEADERS, raise_for_status=False)
+    resp = client.get("https://medicament.ma/wp-sitemap.xml")
+    client.log_stats(logger)
+"""
+
+from __future__ import annotations
+
+import email.utils
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+logger = logging.getLogger("http_client")
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_COUNTERS = ("requests", "responses", "errors", "retry_statuses", "retries", "backoff_seconds",
+             "retry_after_waits", "breaker_trips", "fast_failures")
+
+
+class CircuitOpen(requests.ConnectionError):
+    """The host's circuit breaker is open: the request was not sent."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = 3           # attempts, the first one included
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    max_retry_after: float = 120.0  # longest Retry-After honoured (seconds)
+    statuses: Tuple[int, ...] = RETRY_STATUSES
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open
+    (one trial request) after `cooldown` seconds."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self._clock() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial = False
+
+    def failure(self) -> bool:
+        """Record a failure; True when it opens the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened_at = self._clock()
+                self._trial = False
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(0.0, self.opened_at + self.cooldown - self._clock()) if self.state == "open" else 0.0
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Seconds asked for by a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+def _host(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class HttpClient:
+    """Retrying GET with per-host circuit breakers; safe to share between threads."""
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0,
+        retry: RetryPolicy = RetryPolicy(),
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 60.0,
+        pool_size: int = 16,
+        raise_for_status: bool = True,
+        time_left: Optional[Callable[[], Optional[float]]] = None,
+        on_retry: Optional[Callable[[float], None]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.retry = retry
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.raise_for_status = raise_for_status
+        self._time_left = time_left
+        self._on_retry = on_retry
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counts: Dict[str, Dict[str, float]] = {}
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+                self._counts[host] = dict.fromkeys(_COUNTERS, 0)
+            return breaker
+
+    def _count(self, host: str, **deltas: float) -> None:
+        with self._lock:
+            counts = self._counts[host]
+            for name, value in deltas.items():
+                counts[name] += value
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number *attempt* (0-based)."""
+        ceiling = min(self.retry.max_delay, self.retry.base_delay * 2 ** attempt)
+        with self._lock:
+            return self._rng.uniform(0, ceiling)
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> requests.Response:
+        host = _host(url)
+        if not tracing.enabled():
+            return self._get(url, host, headers, timeout, max_retries)
+        conditional = bool(headers and ("If-None-Match" in headers or "If-Modified-Since" in headers))
+        with tracing.span(f"GET {host}", kind="client", **{
+            "http.request.method": "GET", "server.address": host, "url.full": url,
+        }) as span:
+            try:
+                resp = self._get(url, host, headers, timeout, max_retries, span)
+            except CircuitOpen:
+                span.set(**{"error.type": "circuit_open"})
+                raise
+            except requests.RequestException as exc:
+                status = getattr(exc.response, "status_code", None)
+                span.set(**{"error.type": str(status) if status else type(exc).__name__})
+                if status:
+                    span.set(**{"http.response.status_code": status})
+                raise
+            if resp.status_code == 304 and conditional:
+                cache = "revalidated"
+            else:
+                cache = "miss" if conditional else "none"
+            span.set(**{
+                "http.response.status_code": resp.status_code,
+                "http.response.body.size": len(resp.content or b""),
+                "cache.status": cache,
+            })
+            return resp
+
+    def _get(
+        self,
+        url: str,
+        host: str,
+        headers: Optional[Dict[str, str]],
+        timeout: Optional[float],
+        max_retries: Optional[int],
+        span: Optional[tracing.Span] = None,
+    ) -> requests.Response:
+        breaker = self._breaker(host)
+        attempts = max(1, max_retries or self.retry.max_retries)
+        timeout = timeout or self.timeout
+        merged_headers = {**self.headers, **(headers or {})}
+
+        for attempt in range(attempts):
+            if span is not None and attempt:
+                span.set(**{"http.request.resend_count": attempt})
+            if not breaker.allow():
+                self._count(host, fast_failures=1)
+                raise CircuitOpen(f"circuit open for {host} (retry in {breaker.retry_in():.0f}s), skipped {url}")
+            left = self._time_left() if self._time_left else None
+            self._count(host, requests=1)
+            resp: Optional[requests.Response] = None
+            try:
+                resp = self.session.get(
+                    url, headers=merged_headers,
+                    timeout=timeout if left is None else max(min(timeout, left), 1.0),
+                )
+            except requests.RequestException as exc:
+                error: Exception = exc
+                self._count(host, errors=1)
+            else:
+                self._count(host, responses=1)
+                if resp.status_code not in self.retry.statuses:
+                    breaker.success()
+                    if self.raise_for_status:
+                        resp.raise_for_status()
+                    return resp
+                error = requests.HTTPError(f"{resp.status_code} for {url}", response=resp)
+                self._count(host, retry_statuses=1)
+
+            if breaker.failure():
+                self._count(host, breaker_trips=1)
+                logger.warning("Circuit breaker open for %s after %d consecutive failures (%s); "
+                               "failing fast for %.0fs", host, breaker.failures, error, self.breaker_cooldown)
+            wait = None
+            if resp is not None:
+                wait = parse_retry_after(resp.headers.get("Retry-After"))
+                if wait is not None:
+                    wait = min(wait, self.retry.max_retry_after)
+            retry_after = wait is not None
+            if wait is None:
+                wait = self.backoff(attempt)
+            left = self._time_left() if self._time_left else None
+            if attempt == attempts - 1 or breaker.state == "open" or (left is not None and left < wait):
+                if resp is not None and not self.raise_for_status:
+                    return resp
+                raise error
+            logger.warning("Attempt %d failed for %s: %s. Retry in %.1fs", attempt + 1, url, error, wait)
+            self._count(host, retries=1, backoff_seconds=wait, retry_after_waits=int(retry_after))
+            if self._on_retry:
+                self._on_retry(wait)
+            if span is not None:
+                span.set(backoff_seconds=round(span.attributes.get("backoff_seconds", 0) + wait, 3))
+            self._sleep(wait)
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            counts = {host: dict(c) for host, c in self._counts.items()}
+        return {
+            host: {
+                **{name: int(value) for name, value in c.items() if name != "backoff_seconds"},
+                "backoff_seconds": round(c["backoff_seconds"], 3),
+                "breaker": self._breakers[host].state,
+            }
+            for host, c in sorted(counts.items())
+        }
+
+    def log_stats(self, log: logging.Logger = logger) -> None:
+        for host, stats in self.stats().items():
+            log.info("HTTP %s: %s", host, stats)
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""Near-duplicate detection for the medicament dataset (MinHash + LSH).
+
+medicament.ma publishes some products under several slugs (e.g. the two
+"A.V.T. , Comprimé effervescent" pages), and the updater keeps historical
+duplicate rows on purpose. This module finds those clusters without an
+O(n²) pairwise comparison:
+
+- each record is turned into a set of shingles built from its name,
+  active ingredients, normalised strength and manufacturer
+- a MinHash signature is computed per record (one SHAKE-128 digest per
+  distinct shingle, cached, gives all permutations at once)
+- LSH banding buckets signatures so only records sharing a band are compared
+- candidate pairs are confirmed on exact Jaccard similarity; pairs whose
+  dosage form, manufacturer, product-name words or strengths differ are
+  rejected (ECOCLAV / NEOCLAV, INSULET N / R, a gel and a cream of one
+  brand, 5 MG / 10 MG of one combination)
+- clusters are built around a canonical record: every member meets the
+  threshold against the canonical record itself, so similar pairs cannot
+  chain different products into one cluster
+
+Outputs:
+  public/data/medicament_duplicates.json    — duplicate clusters report
+  public/data/medicament_canonical_ids.json — optional id → canonical id map
+
+Usage:
+    python scripts/medicament_dedup.py
+    python scripts/medicament_dedup.py --threshold 0.85 --canonical-map
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import json
+import logging
+import re
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from medicament_text import strip_accents
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT_DIR / "public" / "data"
+INPUT_JSON = DATA_DIR / "medicament_ma_optimized.json"
+DUPLICATES_JSON = DATA_DIR / "medicament_duplicates.json"
+CANONICAL_JSON = DATA_DIR / "medicament_canonical_ids.json"
+
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+DEFAULT_THRESHOLD = 0.75
+# Buckets larger than this are dominated by generic shingles and would make
+# candidate generation quadratic; they are skipped (and counted in the report).
+MAX_BUCKET_SIZE = 200
+# Strength tokens are repeated so a different dosage (10 MG vs 15 MG of the
+# same brand) weighs more than a typo in the ingredient list.
+STRENGTH_WEIGHT = 3
+
+logger = logging.getLogger("medicament_dedup")
+
+_UNIT_TO_MG = {
+    "g": 1000.0,
+    "mg": 1.0,
+    "mcg": 0.001,
+    "µg": 0.001,
+    "ug": 0.001,
+}
+
+_STRENGTH_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(mcg|µg|ug|mg|g|ml|ui|%)?", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Unit words are dropped from the product-name words compared by `_compatible`
+# ("1G" and "1 G" are the same product)
+_UNIT_WORDS = {"g", "mg", "mcg", "ug", "ml", "ui", "l"}
+
+
+def _norm_text(value: Any) -> str:
+    return strip_accents(str(value or "")).lower()
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(v) for v in value if v]
+    if isinstance(value, str) and value:
+        return [value]
+    return []
+
+
+def _char_ngrams(text: str, n: int = 3) -> Iterable[str]:
+    compact = " ".join(_WORD_RE.findall(text))
+    if len(compact) <= n:
+        if compact:
+            yield compact
+        return
+    for i in range(len(compact) - n + 1):
+        yield compact[i:i + n]
+
+
+def normalize_strength(raw: str) -> List[str]:
+    """Turn "500 MG | 0.02 G" into canonical tokens ["500mg", "20mg"]."""
+    tokens: List[str] = []
+    for number, unit in _STRENGTH_RE.findall(_norm_text(raw)):
+        try:
+            amount = float(number.replace(",", "."))
+        except ValueError:
+            continue
+        unit = (unit or "").lower()
+        if unit in _UNIT_TO_MG:
+            amount *= _UNIT_TO_MG[unit]
+            unit = "mg"
+        tokens.append(f"{amount:g}{unit}")
+    return tokens
+
+
+def record_shingles(record: Dict[str, Any]) -> Set[str]:
+    """Build the feature set compared between two records."""
+    shingles: Set[str] = set()
+
+    name = _norm_text(record.get("name"))
+    # Character n-grams only cover the product part of the name; the dosage
+    # form after the comma is shared by thousands of records and is kept as
+    # a single token (a cream and an ointment are different products).
+    product, _, form = name.partition(",")
+    shingles.update(f"n:{g}" for g in _char_ngrams(product))
+    shingles.update(f"nw:{w}" for w in _WORD_RE.findall(product))
+    form_words = _WORD_RE.findall(form)
+    if form_words:
+        shingles.add("f:" + " ".join(form_words[:2]))
+
+    # Ingredients contribute whole words only: generics of the same molecule
+    # share them, so they must not outweigh the product name.
+    for ingredient in _as_list(record.get("activeIngredient")):
+        shingles.update(f"i:{w}" for w in _WORD_RE.findall(_norm_text(ingredient)))
+
+    for token in normalize_strength(str(record.get("strength") or "")):
+        shingles.update(f"s:{token}#{k}" for k in range(STRENGTH_WEIGHT))
+
+    manufacturer = _norm_text(record.get("manufacturer"))
+    words = _WORD_RE.findall(manufacturer)
+    if words:
+        shingles.add("m:" + " ".join(words[:2]))
+
+    return shingles
+
+
+_Key = Tuple[str, str, Tuple[str, ...], Tuple[str, ...]]
+
+
+def compatibility_key(record: Dict[str, Any]) -> _Key:
+    """(dosage form, manufacturer, product-name words, strengths) of
+    *record*; two records with a different key are never duplicates. The
+    form is the first two words after the comma of the name, as the "f:"
+    shingle, or of `dosageForm`; strengths are the sorted `strength` tokens
+    ("160 MG | 5 MG" and "5 MG | 160 MG" match). An empty form, manufacturer
+    or strength matches any."""
+    product, _, form = _norm_text(record.get("name")).partition(",")
+    form_words = _WORD_RE.findall(form) or _WORD_RE.findall(_norm_text(record.get("dosageForm")))
+    manufacturer = _WORD_RE.findall(_norm_text(record.get("manufacturer")))
+    name_words = sorted({w for w in _WORD_RE.findall(product) if w.isalpha() and w not in _UNIT_WORDS})
+    strengths = sorted(set(normalize_strength(str(record.get("strength") or ""))))
+    return " ".join(form_words[:2]), " ".join(manufacturer[:2]), tuple(name_words), tuple(strengths)
+
+
+def _compatible(a: _Key, b: _Key) -> bool:
+    return (
+        (not a[0] or not b[0] or a[0] == b[0])
+        and (not a[1] or not b[1] or a[1] == b[1])
+        and a[2] == b[2]
+        and (not a[3] or not b[3] or a[3] == b[3])
+    )
+
+
+class MinHasher:
+    """MinHash signatures over string shingles.
+
+    Each distinct shingle is hashed once with SHAKE-128 into NUM_PERM
+    independent 32-bit values; the signature is the element-wise minimum.
+    Shingle digests are cached because most shingles repeat across records.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM):
+        self.num_perm = num_perm
+        self._cache: Dict[str, array] = {}
+
+    def _hash(self, shingle: str) -> array:
+        cached = self._cache.get(shingle)
+        if cached is None:
+            cached = array("I", hashlib.shake_128(shingle.encode("utf-8")).digest(4 * self.num_perm))
+            self._cache[shingle] = cached
+        return cached
+
+    def signature(self, shingles: Iterable[str]) -> Tuple[int, ...]:
+        rows = [self._hash(s) for s in shingles]
+        if not rows:
+            return ()
+        if len(rows) == 1:
+            return tuple(rows[0])
+        return tuple(map(min, zip(*rows)))
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+def _summary(record: Any) -> Dict[str, Any]:
+    """The few fields the report needs, so records can be streamed."""
+    if not isinstance(record, dict):
+        return {"completeness": 0}
+    return {
+        "id": record.get("id"),
+        "name": record.get("name"),
+        "manufacturer": record.get("manufacturer"),
+        "strength": record.get("strength"),
+        "updatedAt": record.get("updatedAt"),
+        "completeness": sum(1 for v in record.values() if v not in (None, "", [], {})),
+    }
+
+
+def _order_cluster(summaries: Sequence[Dict[str, Any]], members: List[int]) -> List[int]:
+    """Canonical record first: most complete, then most recently updated,
+    then the shortest (least suffixed, e.g. "-2") slug."""
+    ordered = sorted(members, key=lambda i: (len(str(summaries[i].get("id", ""))), str(summaries[i].get("id", ""))))
+    ordered.sort(key=lambda i: str(summaries[i].get("updatedAt") or ""), reverse=True)
+    ordered.sort(key=lambda i: summaries[i]["completeness"], reverse=True)
+    return ordered
+
+
+def find_duplicate_clusters(
+    records: Iterable[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> Dict[str, Any]:
+    """Return the duplicate report for *records* (see module docstring)."""
+    started = time.perf_counter()
+    hasher = MinHasher()
+    summaries: List[Dict[str, Any]] = []
+    shingle_sets: List[Set[str]] = []
+    signatures: List[Tuple[int, ...]] = []
+    keys: List[_Key] = []
+    for record in records:
+        shingles = record_shingles(record) if isinstance(record, dict) else set()
+        summaries.append(_summary(record))
+        keys.append(compatibility_key(record) if isinstance(record, dict) else ("", "", (), ()))
+        shingle_sets.append(shingles)
+        signatures.append(hasher.signature(shingles))
+
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    for idx, sig in enumerate(signatures):
+        if not sig:
+            continue
+        for band in range(NUM_BANDS):
+            start = band * ROWS_PER_BAND
+            buckets.setdefault((band, sig[start:start + ROWS_PER_BAND]), []).append(idx)
+
+    uf = _UnionFind(len(summaries))
+    linked: Set[int] = set()
+    compared: Set[Tuple[int, int]] = set()
+    linked_pairs = 0
+    rejected_pairs = 0
+    skipped_buckets = 0
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        if len(members) > MAX_BUCKET_SIZE:
+            skipped_buckets += 1
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pair = (a, b)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                if jaccard(shingle_sets[a], shingle_sets[b]) < threshold:
+                    continue
+                if not _compatible(keys[a], keys[b]):
+                    rejected_pairs += 1
+                    continue
+                linked_pairs += 1
+                uf.union(a, b)
+                linked.add(a)
+                linked.add(b)
+
+    groups: Dict[int, List[int]] = {}
+    for idx in sorted(linked):
+        groups.setdefault(uf.find(idx), []).append(idx)
+
+    # Connected components only bound the search: within one, the preferred
+    # remaining record becomes a canonical and takes the records that match
+    # it directly; the rest start further clusters.
+    star_clusters: List[List[int]] = []
+    for members in groups.values():
+        remaining = _order_cluster(summaries, members)
+        while len(remaining) > 1:
+            canonical, rest = remaining[0], remaining[1:]
+            taken = [
+                i for i in rest
+                if _compatible(keys[canonical], keys[i])
+                and jaccard(shingle_sets[canonical], shingle_sets[i]) >= threshold
+            ]
+            if taken:
+                star_clusters.append([canonical] + taken)
+            taken_set = set(taken)
+            remaining = [i for i in rest if i not in taken_set]
+
+    clusters: List[Dict[str, Any]] = []
+    for ordered in star_clusters:
+        canonical = ordered[0]
+        cluster_members = []
+        for i in ordered:
+            info = summaries[i]
+            cluster_members.append({
+                "id": info.get("id"),
+                "name": info.get("name"),
+                "manufacturer": info.get("manufacturer"),
+                "strength": info.get("strength"),
+                "similarity": round(jaccard(shingle_sets[canonical], shingle_sets[i]), 3),
+            })
+        clusters.append({
+            "canonical": summaries[canonical].get("id"),
+            "size": len(cluster_members),
+            "members": cluster_members,
+        })
+    clusters.sort(key=lambda c: (-c["size"], str(c["canonical"])))
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Dedup: %d records, %d candidate pairs, %d clusters (%d duplicate rows) in %.2fs",
+        len(summaries),
+        len(compared),
+        len(clusters),
+        sum(c["size"] - 1 for c in clusters),
+        elapsed,
+    )
+
+    return {
+        "generatedAt": dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "method": {
+            "numPerm": NUM_PERM,
+            "bands": NUM_BANDS,
+            "rowsPerBand": ROWS_PER_BAND,
+            "threshold": threshold,
+            "fields": ["name", "activeIngredient", "strength", "manufacturer"],
+            "sameKey": ["dosageForm", "manufacturer", "productNameWords", "strength"],
+            "linkage": "canonical",
+        },
+        "totalRecords": len(summaries),
+        "candidatePairs": len(compared),
+        "linkedPairs": linked_pairs,
+        "rejectedPairs": rejected_pairs,
+        "skippedBuckets": skipped_buckets,
+        "clusterCount": len(clusters),
+        "duplicateRecords": sum(c["size"] - 1 for c in clusters),
+        "elapsedSec": round(elapsed, 3),
+        "clusters": clusters,
+    }
+
+
+def build_canonical_map(report: Dict[str, Any]) -> Dict[str, str]:
+    """Map every non-canonical id of a cluster to its canonical id."""
+    mapping: Dict[str, str] = {}
+    for cluster in report.get("clusters", []):
+        canonical = cluster.get("canonical")
+        for member in cluster.get("members", []):
+            rid = member.get("id")
+            if rid and canonical and rid != canonical:
+                mapping[str(rid)] = str(canonical)
+    return dict(sorted(mapping.items()))
+
+
+def write_duplicates_report(
+    records: Iterable[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD,
+    report_path: Path = DUPLICATES_JSON,
+    canonical_path: Optional[Path] = None,
+) -> Dict[str, Any]:
+    report = find_duplicate_clusters(records, threshold=threshold)
+    _write_json(report_path, report)
+    if canonical_path is not None:
+        _write_json(canonical_path, build_canonical_map(report))
+    return report
+
+
+def _write_json(path: Path, payload: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Detect near-duplicate medicament records (MinHash/LSH)")
+    parser.add_argument("--input", type=Path, default=INPUT_JSON, help="Dataset JSON (list of records)")
+    parser.add_argument("--output", type=Path, default=DUPLICATES_JSON, help="Duplicates report path")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimum Jaccard similarity (default 0.75)")
+    parser.add_argument("--canonical-map", action="store_true", help=f"Also write {CANONICAL_JSON.name}")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logs")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    try:
+        records = json.loads(args.input.read_text(encoding="utf-8"))
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Cannot read %s: %s", args.input, exc)
+        return 1
+    if not isinstance(records, list):
+        logger.error("Invalid format for %s (expected list)", args.input)
+        return 1
+
+    report = write_duplicates_report(
+        records,
+        threshold=args.threshold,
+        report_path=args.output,
+        canonical_path=CANONICAL_JSON if args.canonical_map else None,
+    )
+    logger.info("Wrote %s (%d clusters)", args.output, report["clusterCount"])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
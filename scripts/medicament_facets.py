@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""Precomputed facet indexes for the medicament dataset.
+
+The catalogue page currently derives its filter options by scanning every
+drug on the client (`getUniqueManufacturers`, `getUniqueTherapeuticClasses`).
+This module computes, once per update, a posting list per facet value so
+that filtering becomes an intersection of id sets.
+
+Facets:
+- therapeuticClass — detailed classes as stored on each record
+- category         — broad categories, using the keyword rules of
+                     `lib/therapeutic-class-categories.ts` (parsed, not copied)
+- atc              — every prefix level of `atcCode` (A, A02, A02B, A02BC, A02BC05)
+- manufacturer
+- dosageForm
+
+Output format (`public/data/medicament_facets.json`, compact JSON):
+    {
+      "total": 8569,
+      "ids": ["a-v-t-500-mg-comprime-effervescent", ...],
+      "facets": {
+        "manufacturer": {"LAPROPHAN": {"count": 312, "ids": [0, 1, 57, ...]}, ...},
+        ...
+      }
+    }
+Posting lists hold sorted positions into `ids`, which follows the dataset
+order (and therefore `medicament_list_index.json`).
+
+Usage:
+    python scripts/medicament_facets.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from medicament_text import strip_accents
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT_DIR / "public" / "data"
+INPUT_JSON = DATA_DIR / "medicament_ma_optimized.json"
+FACETS_JSON = DATA_DIR / "medicament_facets.json"
+CATEGORY_RULES_TS = ROOT_DIR / "lib" / "therapeutic-class-categories.ts"
+
+FALLBACK_CATEGORY = "Autres médicaments"
+ATC_LEVELS = (1, 3, 4, 5, 7)
+# Values the UI never offers as filters
+_IGNORED_VALUES = {"non renseigne"}
+
+logger = logging.getLogger("medicament_facets")
+
+_RULE_RE = re.compile(r"\[\[([^\]]*)\],\s*\"([^\"]+)\"\]")
+_RULES_BLOCK_RE = re.compile(r"const RULES[^=]*=\s*\[(.*?)\n\]", re.DOTALL)
+_ATC_RE = re.compile(r"^[A-Z]\d{2}(?:[A-Z](?:[A-Z](?:\d{2})?)?)?$")
+
+
+def load_category_rules(path: Path = CATEGORY_RULES_TS) -> List[Tuple[List[str], str]]:
+    """Parse the `RULES` table from the TypeScript module.
+
+    The frontend remains the single source of truth for the category
+    mapping; this only reads its `[[keywords...], "Category"]` entries.
+    """
+    try:
+        source = path.read_text(encoding="utf-8")
+    except OSError as exc:
+        logger.warning("Cannot read %s: %s (category facet disabled)", path, exc)
+        return []
+    block = _RULES_BLOCK_RE.search(source)
+    if not block:
+        logger.warning("No RULES table found in %s (category facet disabled)", path)
+        return []
+    rules: List[Tuple[List[str], str]] = []
+    for keywords_raw, category in _RULE_RE.findall(block.group(1)):
+        keywords = re.findall(r"\"([^\"]*)\"", keywords_raw)
+        if keywords:
+            rules.append((keywords, category))
+    return rules
+
+
+class CategoryMapper:
+    """Python twin of `mapToCategory` (first matching keyword rule wins)."""
+
+    def __init__(self, rules: Sequence[Tuple[List[str], str]]):
+        self._rules = rules
+        self._cache: Dict[str, str] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def map(self, detailed_class: str) -> str:
+        cached = self._cache.get(detailed_class)
+        if cached is not None:
+            return cached
+        normalized = strip_accents(detailed_class).lower()
+        category = FALLBACK_CATEGORY
+        for keywords, candidate in self._rules:
+            if any(kw in normalized for kw in keywords):
+                category = candidate
+                break
+        self._cache[detailed_class] = category
+        return category
+
+
+def atc_prefixes(code: str) -> List[str]:
+    """Return the ATC hierarchy of *code*, e.g. A02BC05 → [A, A02, A02B, A02BC, A02BC05]."""
+    code = re.sub(r"\s+", "", code or "").upper()
+    if not _ATC_RE.match(code):
+        return []
+    return [code[:level] for level in ATC_LEVELS if len(code) >= level]
+
+
+def _str_values(value: Any) -> List[str]:
+    if isinstance(value, list):
+        items = value
+    elif value is None:
+        items = []
+    else:
+        items = [value]
+    out: List[str] = []
+    for item in items:
+        if not isinstance(item, str):
+            continue
+        text = item.strip()
+        if text and strip_accents(text).lower() not in _IGNORED_VALUES:
+            out.append(text)
+    return out
+
+
+def _add(postings: Dict[str, List[int]], values: Iterable[str], position: int) -> None:
+    for value in values:
+        bucket = postings.setdefault(value, [])
+        # A record lists each value at most once in a posting list
+        if not bucket or bucket[-1] != position:
+            bucket.append(position)
+
+
+def build_facets(
+    records: Iterable[Dict[str, Any]],
+    category_mapper: Optional[CategoryMapper] = None,
+) -> Dict[str, Any]:
+    if category_mapper is None:
+        category_mapper = CategoryMapper(load_category_rules())
+
+    ids: List[str] = []
+    postings: Dict[str, Dict[str, List[int]]] = {
+        "therapeuticClass": {},
+        "category": {},
+        "atc": {},
+        "manufacturer": {},
+        "dosageForm": {},
+    }
+
+    for position, record in enumerate(records):
+        if not isinstance(record, dict):
+            ids.append("")
+            continue
+        ids.append(str(record.get("id", "")))
+
+        classes = _str_values(record.get("therapeuticClass"))
+        _add(postings["therapeuticClass"], classes, position)
+        if category_mapper:
+            _add(postings["category"], sorted({category_mapper.map(tc) for tc in classes}), position)
+        _add(postings["atc"], atc_prefixes(str(record.get("atcCode") or "")), position)
+        _add(postings["manufacturer"], _str_values(record.get("manufacturer")), position)
+        _add(postings["dosageForm"], _str_values(record.get("dosageForm")), position)
+
+    facets: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for facet, values in postings.items():
+        if facet == "category" and not category_mapper:
+            continue
+        facets[facet] = {
+            value: {"count": len(positions), "ids": positions}
+            for value, positions in sorted(values.items(), key=lambda kv: kv[0].lower())
+        }
+
+    return {
+        "version": 1,
+        "generatedAt": dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "total": len(ids),
+        "atcLevels": list(ATC_LEVELS),
+        "ids": ids,
+        "facets": facets,
+    }
+
+
+def write_facets(records: Iterable[Dict[str, Any]], path: Path = FACETS_JSON) -> Dict[str, Any]:
+    payload = build_facets(records)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    tmp.replace(path)
+    return payload
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Precompute medicament facet indexes")
+    parser.add_argument("--input", type=Path, default=INPUT_JSON, help="Dataset JSON (list of records)")
+    parser.add_argument("--output", type=Path, default=FACETS_JSON, help="Facets output path")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logs")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    try:
+        records = json.loads(args.input.read_text(encoding="utf-8"))
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Cannot read %s: %s", args.input, exc)
+        return 1
+    if not isinstance(records, list):
+        logger.error("Invalid format for %s (expected list)", args.input)
+        return 1
+
+    payload = write_facets(records, args.output)
+    logger.info(
+        "Wrote %s (%s)",
+        args.output,
+        ", ".join(f"{name}={len(values)}" for name, values in payload["facets"].items()),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
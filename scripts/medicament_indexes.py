@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Client-side indexes and shards of the medicament dataset.
+
+Python port of `generate-drug-search-index.mjs`, so that the pipeline
+(medicament_pipeline.py) can build the indexes from records it already
+holds in memory. The output is byte-identical to the Node script's
+(`JSON.stringify` without spaces): the string helpers below follow the
+JavaScript semantics of `String()`, `trim()`, `\\s` and `\\b`, not Python's.
+
+Outputs (`public/data/`):
+- medicament_list_index.json   — catalogue rows (id, name, ingredients,
+                                 form, strength, manufacturer, classes, types)
+- medicament_search_index.json — search rows with a normalised `searchKey`
+- medicaments/<key>.json       — full records sharded by the first character
+                                 of their id (a-z, "0-9" for digits, "autres"),
+                                 one compact record per line
+- medicaments/index.json       — shard index: key -> {file, count, hash}
+
+`index_rows()` builds the shared per-record view (the "normalise" stage of
+the pipeline) once; both indexes are projections of it.
+
+Usage:
+    python scripts/medicament_indexes.py
+    python scripts/medicament_indexes.py --input /tmp/dataset.json --shards
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT_DIR / "public" / "data"
+INPUT_JSON = DATA_DIR / "medicament_ma_optimized.json"
+LIST_INDEX_JSON = DATA_DIR / "medicament_list_index.json"
+SEARCH_INDEX_JSON = DATA_DIR / "medicament_search_index.json"
+SHARDS_DIR = DATA_DIR / "medicaments"
+SHARD_INDEX_JSON = SHARDS_DIR / "index.json"
+
+LIST_FIELDS = ("id", "name", "activeIngredient", "dosageForm", "strength", "manufacturer",
+               "therapeuticClass", "@type", "productType")
+SEARCH_FIELDS = ("id", "name", "activeIngredient", "dosageForm", "strength", "manufacturer", "searchKey")
+
+logger = logging.getLogger("medicament_indexes")
+
+# JavaScript's \s (and the characters String.prototype.trim() removes)
+_JS_SPACE_CHARS = "".join(
+    chr(c) for c in (9, 10, 11, 12, 13, 32, 0xA0, 0x1680, *range(0x2000, 0x200B), 0x2028, 0x2029,
+                     0x202F, 0x205F, 0x3000, 0xFEFF)
+)
+_JS_SPACE = re.escape(_JS_SPACE_CHARS)
+_COMBINING_RE = re.compile("[\u0300-\u036f]")
+_NON_KEY_RE = re.compile(f"[^a-z0-9{_JS_SPACE}]")
+_SPACES_RE = re.compile(f"[{_JS_SPACE}]+")
+# re.ASCII: JavaScript's \b only knows [A-Za-z0-9_] as word characters
+_INGREDIENT_SPLIT_RE = re.compile(f"[{_JS_SPACE}]*(?:\\||/|;|\\+|,|\\bet\\b)[{_JS_SPACE}]*", re.IGNORECASE | re.ASCII)
+
+
+def _js_string(value: Any) -> str:
+    """`String(value)` for the JSON types a record can hold."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        return ",".join("" if item is None else _js_string(item) for item in value)
+    if isinstance(value, dict):
+        return "[object Object]"
+    return str(value)
+
+
+def _js_trim(value: str) -> str:
+    return value.strip(_JS_SPACE_CHARS)
+
+
+def normalize(value: Any = "") -> str:
+    text = unicodedata.normalize("NFD", _js_string(value).lower())
+    text = _NON_KEY_RE.sub(" ", _COMBINING_RE.sub("", text))
+    return _js_trim(_SPACES_RE.sub(" ", text))
+
+
+def to_string_array(value: Any) -> List[str]:
+    if not isinstance(value, list):
+        return []
+    return [item for item in (_js_trim(_js_string(raw)) for raw in value) if item]
+
+
+def expand_ingredients(values: Any) -> List[str]:
+    """Ingredients split on "|", "/", ";", "+", "," and "et", deduplicated
+    on their normalised form."""
+    out: List[str] = []
+    seen = set()
+    for raw in to_string_array(values):
+        parts = [part for part in (_js_trim(p) for p in _INGREDIENT_SPLIT_RE.split(raw)) if part]
+        for item in parts if len(parts) > 1 else [raw]:
+            key = normalize(item)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            out.append(item)
+    return out
+
+
+def normalize_drug_type(value: Any) -> str:
+    return "MedicalDevice" if value == "MedicalDevice" else "Drug"
+
+
+def index_rows(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """One row per record with every field of both indexes (optional string
+    fields are left out when absent, as `JSON.stringify` drops undefined)."""
+    rows: List[Dict[str, Any]] = []
+    for drug in records:
+        if not isinstance(drug, dict):
+            drug = {}
+        name = drug.get("name")
+        ingredients = to_string_array(drug.get("activeIngredient"))
+        expanded = expand_ingredients(drug.get("activeIngredient"))
+        row: Dict[str, Any] = {
+            "id": _js_string(drug.get("id") if drug.get("id") is not None else ""),
+            "name": _js_string(name if name is not None else ""),
+            "activeIngredient": ingredients,
+        }
+        for field in ("dosageForm", "strength", "manufacturer"):
+            if isinstance(drug.get(field), str):
+                row[field] = drug[field]
+        row["therapeuticClass"] = to_string_array(drug.get("therapeuticClass"))
+        row["@type"] = normalize_drug_type(drug.get("@type"))
+        row["productType"] = normalize_drug_type(drug.get("productType"))
+        row["searchKey"] = normalize(
+            f"{_js_string(name if name is not None else '')} {' '.join(ingredients)} {' '.join(expanded)}"
+        )
+        rows.append(row)
+    return rows
+
+
+def _project(rows: List[Dict[str, Any]], fields: Iterable[str]) -> List[Dict[str, Any]]:
+    fields = tuple(fields)
+    return [{field: row[field] for field in fields if field in row} for row in rows]
+
+
+def _compact(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """Atomically write *data* to *path* unless it already holds it."""
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+    return True
+
+
+def write_list_index(rows: List[Dict[str, Any]], path: Path = LIST_INDEX_JSON) -> bool:
+    return write_if_changed(path, _compact(_project(rows, LIST_FIELDS)))
+
+
+def write_search_index(rows: List[Dict[str, Any]], path: Path = SEARCH_INDEX_JSON) -> bool:
+    return write_if_changed(path, _compact(_project(rows, SEARCH_FIELDS)))
+
+
+def shard_key(record_id: str) -> str:
+    """Shard of a record id: "doliprane-1000" -> "d", "3tc-150" -> "0-9"."""
+    first = normalize(record_id)[:1]
+    if first.isdigit():
+        return "0-9"
+    return first if "a" <= first <= "z" else "autres"
+
+
+def records_bytes(records: List[Dict[str, Any]]) -> bytes:
+    """A JSON array with one compact record per line: small files,
+    readable line diffs (medicament and pharmacy shards)."""
+    lines = [json.dumps(rec, ensure_ascii=False, separators=(",", ":")) for rec in records]
+    return ("[\n" + ",\n".join(lines) + "\n]\n" if lines else "[]\n").encode("utf-8")
+
+
+def write_shards(records: Iterable[Dict[str, Any]], shards_dir: Path = SHARDS_DIR) -> Dict[str, Any]:
+    """Write the dataset as per-key shards plus their index, rewriting only
+    shards whose content changed and deleting shards of vanished keys.
+    Returns the shard index."""
+    by_key: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        if isinstance(record, dict):
+            by_key.setdefault(shard_key(_js_string(record.get("id") or "")), []).append(record)
+
+    shards: Dict[str, Dict[str, Any]] = {}
+    written = 0
+    for key in sorted(by_key):
+        data = records_bytes(by_key[key])
+        written += write_if_changed(shards_dir / f"{key}.json", data)
+        shards[key] = {
+            "file": f"{shards_dir.name}/{key}.json",
+            "count": len(by_key[key]),
+            "hash": hashlib.sha256(data).hexdigest()[:16],
+        }
+    removed = 0
+    for path in shards_dir.glob("*.json"):
+        if path.stem not in shards and path.name != SHARD_INDEX_JSON.name:
+            path.unlink()
+            removed += 1
+    index = {"version": 1, "total": sum(shard["count"] for shard in shards.values()), "shards": shards}
+    write_if_changed(shards_dir / SHARD_INDEX_JSON.name, _compact(index))
+    logger.info("Shards: %d keys, %d rewritten, %d unchanged, %d removed",
+                len(shards), written, len(shards) - written, removed)
+    return index
+
+
+def shard_files(shards_dir: Path = SHARDS_DIR) -> List[Path]:
+    """Shard files currently on disk, index last."""
+    return sorted(p for p in shards_dir.glob("*.json") if p.name != SHARD_INDEX_JSON.name) + [
+        p for p in [shards_dir / SHARD_INDEX_JSON.name] if p.exists()
+    ]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Build the medicament list/search indexes (and shards)")
+    parser.add_argument("--input", type=Path, default=INPUT_JSON, help="Dataset JSON (list of records)")
+    parser.add_argument("--list-output", type=Path, default=LIST_INDEX_JSON, help="List index output path")
+    parser.add_argument("--search-output", type=Path, default=SEARCH_INDEX_JSON, help="Search index output path")
+    parser.add_argument("--shards", action="store_true", help=f"Also write the dataset shards under {SHARDS_DIR.name}/")
+    parser.add_argument("--shards-dir", type=Path, default=SHARDS_DIR, help="Shard directory")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logs")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    try:
+        records = json.loads(args.input.read_text(encoding="utf-8"))
+    except Exception as exc:  # noqa: BLE001
+        logger.error("Cannot read %s: %s", args.input, exc)
+        return 1
+    if not isinstance(records, list):
+        logger.error("Invalid format for %s (expected list)", args.input)
+        return 1
+
+    rows = index_rows(records)
+    for path, changed in (
+        (args.list_output, write_list_index(rows, args.list_output)),
+        (args.search_output, write_search_index(rows, args.search_output)),
+    ):
+        logger.info("%s %s (%d records)", "Wrote" if changed else "Unchanged", path, len(rows))
+    if args.shards:
+        write_shards(records, args.shards_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""Medicament data pipeline: update, normalise, index, shard and compress in one process.
+
+Replaces the workflow's chain of steps (medicaments_updater.py, then
+`node generate-drug-search-index.mjs`, each re-reading the dataset from
+disk) with a DAG of stages run in one process:
+
+    update ─┬─> normalise ─┬─> list index ───┐
+            │              └─> search index ─┼─> compress
+            ├─> shard ───────────────────────┘
+            ├─> duplicates
+            └─> facets
+
+- update runs `medicaments_updater.run_update` in-process and accepts all
+  of the updater's options. The records it wrote are handed to the other
+  stages in memory (re-read from the file in --streaming runs). A non-zero
+  updater exit code (2 drop guard, 3 memory budget) stops the pipeline and
+  is returned unchanged. --skip-update starts from the dataset on disk.
+- normalise builds the shared index rows (medicament_indexes.py) once; the
+  list and search indexes are projections of them. shard writes the
+  per-letter dataset shards, compress their `.gz` siblings and those of the
+  indexes (deterministic gzip, for static hosts serving precompressed files).
+- every stage has a key: the SHA-256 of its name, version, extra input
+  files and its dependencies' keys, rooted at the dataset file's hash. A
+  stage whose key and output files match the manifest
+  (`data/medicament_pipeline.json`) is skipped, so an unchanged dataset
+  costs one file hash and no JSON parse, and timestamped outputs (facets,
+  duplicates) are not rewritten for nothing. In-memory stages (normalise)
+  run only when a stage that needs their result does. --force runs all.
+- stages whose dependencies are done run concurrently in a thread pool
+  (--jobs). They are mostly pure Python, so threads mainly overlap file
+  writes and hashing; --jobs 1 runs them one at a time.
+- each stage's status and wall time is logged as a table, kept in the
+  manifest and, with --trace, recorded as a span (see trace_report.py).
+
+Usage:
+    python scripts/medicament_pipeline.py
+    python scripts/medicament_pipeline.py --skip-update
+    python scripts/medicament_pipeline.py --skip-update --force --jobs 1
+    python scripts/medicament_pipeline.py --full-refresh --trace /tmp/pipeline.trace.ndjson
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import medicaments_updater as mu
+import tracing
+from medicament_dedup import DUPLICATES_JSON, write_duplicates_report
+from medicament_facets import CATEGORY_RULES_TS, FACETS_JSON, write_facets
+from medicament_indexes import (
+    LIST_INDEX_JSON,
+    SEARCH_INDEX_JSON,
+    SHARDS_DIR,
+    index_rows,
+    shard_files,
+    write_if_changed,
+    write_list_index,
+    write_search_index,
+    write_shards,
+)
+from medicament_snapshots import compress, file_sha256
+from memory_monitor import MemoryBudgetExceeded
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+MANIFEST_JSON = ROOT_DIR / "data" / "medicament_pipeline.json"
+DEFAULT_JOBS = min(4, os.cpu_count() or 1)
+
+logger = logging.getLogger("medicament_pipeline")
+
+Records = Callable[[], Iterable[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One pipeline stage. *run* gets the results of *deps* by name ("dataset"
+    is the records provider). *outputs* lists the files it writes; None marks
+    an in-memory stage, whose result only feeds other stages. Bump *version*
+    when the stage's output format changes, so it is not skipped."""
+
+    name: str
+    run: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ("dataset",)
+    outputs: Optional[Callable[[], List[Path]]] = None
+    inputs: Tuple[Path, ...] = ()
+    version: int = 1
+    # A failure is logged and the run goes on, as the updater always did
+    # for its duplicates report and facets
+    optional: bool = False
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+def _gz_path(path: Path) -> Path:
+    return path.with_name(path.name + ".gz")
+
+
+def _compressed_sources() -> List[Path]:
+    return [path for path in (LIST_INDEX_JSON, SEARCH_INDEX_JSON) if path.exists()] + shard_files(SHARDS_DIR)
+
+
+def _normalise(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return index_rows(results["dataset"]())
+
+
+def _list_index(results: Dict[str, Any]) -> None:
+    rows = results["normalise"]
+    changed = write_list_index(rows, LIST_INDEX_JSON)
+    logger.info("%s %s (%d records)", "Wrote" if changed else "Unchanged", LIST_INDEX_JSON.name, len(rows))
+
+
+def _search_index(results: Dict[str, Any]) -> None:
+    rows = results["normalise"]
+    changed = write_search_index(rows, SEARCH_INDEX_JSON)
+    logger.info("%s %s (%d records)", "Wrote" if changed else "Unchanged", SEARCH_INDEX_JSON.name, len(rows))
+
+
+def _shard(results: Dict[str, Any]) -> None:
+    write_shards(results["dataset"](), SHARDS_DIR)
+
+
+def _duplicates(results: Dict[str, Any]) -> None:
+    report = write_duplicates_report(results["dataset"](), report_path=DUPLICATES_JSON)
+    logger.info("Wrote %s (%d clusters, %d duplicate rows)", DUPLICATES_JSON.name, report["clusterCount"],
+                report["duplicateRecords"])
+
+
+def _facets(results: Dict[str, Any]) -> None:
+    facets = write_facets(results["dataset"](), FACETS_JSON)
+    logger.info("Wrote %s (%s)", FACETS_JSON.name,
+                ", ".join(f"{name}={len(values)}" for name, values in facets["facets"].items()))
+
+
+def _compress(results: Dict[str, Any]) -> None:
+    sources = _compressed_sources()
+    written = sum(write_if_changed(_gz_path(path), compress(path.read_bytes(), "gz")) for path in sources)
+    removed = 0
+    for path in SHARDS_DIR.glob("*.json.gz"):
+        if not path.with_suffix("").exists():
+            path.unlink()
+            removed += 1
+    logger.info("Compressed: %d files, %d rewritten, %d removed", len(sources), written, removed)
+
+
+STAGES: Tuple[Stage, ...] = (
+    Stage("normalise", _normalise),
+    Stage("list index", _list_index, deps=("normalise",), outputs=lambda: [LIST_INDEX_JSON]),
+    Stage("search index", _search_index, deps=("normalise",), outputs=lambda: [SEARCH_INDEX_JSON]),
+    Stage("shard", _shard, outputs=lambda: shard_files(SHARDS_DIR)),
+    Stage("duplicates", _duplicates, outputs=lambda: [DUPLICATES_JSON], optional=True),
+    Stage("facets", _facets, outputs=lambda: [FACETS_JSON], inputs=(CATEGORY_RULES_TS,), optional=True),
+    Stage(
+        "compress",
+        _compress,
+        deps=("list index", "search index", "shard"),
+        outputs=lambda: [_gz_path(path) for path in _compressed_sources()],
+    ),
+)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _rel(path: Path) -> str:
+    try:
+        return str(path.relative_to(ROOT_DIR))
+    except ValueError:
+        return str(path)
+
+
+def _load_once(path: Path) -> Records:
+    """Records provider reading *path* on first use only (shared by threads)."""
+    lock = threading.Lock()
+    cache: List[List[Dict[str, Any]]] = []
+
+    def records() -> List[Dict[str, Any]]:
+        with lock:
+            if not cache:
+                payload = json.loads(path.read_text(encoding="utf-8"))
+                if not isinstance(payload, list):
+                    raise ValueError(f"Invalid format for {path} (expected list)")
+                cache.append(payload)
+        return cache[0]
+
+    return records
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # "ran", "skipped", "failed" or "blocked"
+    seconds: float = 0.0
+    error: str = ""
+
+
+class Pipeline:
+    def __init__(self, stages: Iterable[Stage], manifest_path: Path = MANIFEST_JSON, jobs: int = DEFAULT_JOBS,
+                 force: bool = False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.manifest_path = manifest_path
+        self.jobs = max(1, jobs)
+        self.force = force
+        self.manifest: Dict[str, Any] = mu.read_json(manifest_path, fallback={})
+        if not isinstance(self.manifest.get("stages"), dict):
+            self.manifest["stages"] = {}
+
+    def keys(self, dataset_hash: str) -> Dict[str, str]:
+        keys = {"dataset": dataset_hash}
+        for stage in self.stages.values():  # declared in dependency order
+            material = [stage.name, stage.version, [keys.get(dep, dep) for dep in stage.deps],
+                        [[_rel(path), file_sha256(path)] for path in stage.inputs]]
+            keys[stage.name] = hashlib.sha256(json.dumps(material).encode("utf-8")).hexdigest()
+        return keys
+
+    def is_fresh(self, stage: Stage, key: str) -> bool:
+        """Whether *stage* already produced its outputs for *key*, untouched since."""
+        entry = self.manifest["stages"].get(stage.name) or {}
+        if self.force or stage.outputs is None or entry.get("key") != key:
+            return False
+        recorded = entry.get("outputs") or {}
+        current = {_rel(path): path for path in stage.outputs()}
+        return bool(recorded) and set(recorded) == set(current) and all(
+            file_sha256(current[name]) == digest for name, digest in recorded.items()
+        )
+
+    def plan(self, keys: Dict[str, str]) -> Set[str]:
+        """Stages to run: stale ones, plus the in-memory stages they need."""
+        to_run = {name for name, stage in self.stages.items()
+                  if stage.outputs is not None and not self.is_fresh(stage, keys[name])}
+        pending = list(to_run)
+        while pending:
+            for dep in self.stages[pending.pop()].deps:
+                if dep in self.stages and self.stages[dep].outputs is None and dep not in to_run:
+                    to_run.add(dep)
+                    pending.append(dep)
+        return to_run
+
+    def _run_stage(self, stage: Stage, results: Dict[str, Any], key: str) -> Tuple[Any, float]:
+        started = time.monotonic()
+        with tracing.span(f"stage {stage.name}", stage=True, key=key[:16]):
+            value = stage.run(results)
+        return value, time.monotonic() - started
+
+    def run(self, dataset: Path, records: Records) -> List[StageResult]:
+        dataset_hash = file_sha256(dataset)
+        if dataset_hash is None:
+            raise FileNotFoundError(dataset)
+        keys = self.keys(dataset_hash)
+        to_run = self.plan(keys)
+        results: Dict[str, Any] = {"dataset": records}
+        report: Dict[str, StageResult] = {}
+        for name in self.stages:
+            if name not in to_run:
+                report[name] = StageResult(name, "skipped")
+                tracing.event(f"stage {name}", skipped=True)
+
+        done: Set[str] = set(report)
+        running: Dict[concurrent.futures.Future, Stage] = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="stage") as pool:
+            while len(done) < len(self.stages):
+                for name, stage in self.stages.items():
+                    if name in done or stage in running.values():
+                        continue
+                    blocked = [dep for dep in stage.deps if dep in report and report[dep].status in ("failed", "blocked")]
+                    if blocked:
+                        report[name] = StageResult(name, "blocked", error=f"{', '.join(blocked)} failed")
+                        done.add(name)
+                    elif all(dep in done or dep not in self.stages for dep in stage.deps):
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._run_stage, stage, results, keys[name])] = stage
+                if not running:
+                    continue
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        results[stage.name], seconds = future.result()
+                        report[stage.name] = StageResult(stage.name, "ran", seconds)
+                    except Exception as exc:  # noqa: BLE001
+                        log = logger.warning if stage.optional else logger.error
+                        log("Stage %s failed: %s", stage.name, exc)
+                        report[stage.name] = StageResult(stage.name, "failed", error=str(exc))
+                    done.add(stage.name)
+
+        self._save_manifest(dataset, dataset_hash, keys, report)
+        return [report[name] for name in self.stages]
+
+    def _save_manifest(self, dataset: Path, dataset_hash: str, keys: Dict[str, str],
+                       report: Dict[str, StageResult]) -> None:
+        stages = self.manifest["stages"]
+        for name, result in report.items():
+            stage = self.stages[name]
+            if result.status == "ran" and stage.outputs is not None:
+                stages[name] = {
+                    "key": keys[name],
+                    "outputs": {_rel(path): file_sha256(path) for path in stage.outputs()},
+                    "seconds": round(result.seconds, 3),
+                    "builtAt": mu.now_iso(),
+                }
+            elif result.status != "skipped":
+                stages.pop(name, None)
+        self.manifest.update(
+            version=1,
+            dataset={"path": _rel(dataset), "sha256": dataset_hash},
+            stages=dict(sorted(stages.items())),
+        )
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        mu.write_json(self.manifest_path, self.manifest)
+
+
+def log_timings(results: Iterable[StageResult]) -> None:
+    logger.info("%-14s %-8s %9s", "Stage", "Status", "Seconds")
+    for result in results:
+        logger.info("%-14s %-8s %9.2f%s", result.name, result.status, result.seconds,
+                    f"  ({result.error})" if result.error else "")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Update the medicament dataset and rebuild its derived files in one process",
+        epilog="Any other option is passed to medicaments_updater.py (see its --help).",
+    )
+    parser.add_argument("--skip-update", action="store_true", help="Start from the dataset on disk (no network)")
+    parser.add_argument("--force", action="store_true", help="Run every stage, even when its inputs are unchanged")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"Concurrent stages (default {DEFAULT_JOBS})")
+    parser.add_argument("--manifest", type=Path, default=MANIFEST_JSON, help="Stage keys and output hashes")
+    return parser
+
+
+def main() -> int:
+    args, rest = build_arg_parser().parse_known_args()
+    update_args = mu.build_arg_parser().parse_args(rest)
+    mu.configure_logging(update_args.verbose)
+    tracing.configure(update_args.trace)
+    mu.MEMORY.start(report=update_args.memory_report, max_rss_mb=update_args.max_rss)
+    try:
+        with tracing.span("medicament_pipeline", skip_update=args.skip_update) as span:
+            try:
+                code = run_pipeline(args, update_args)
+            except MemoryBudgetExceeded as exc:
+                logger.error("Stopped: %s. No file was written.", exc)
+                code = 3
+            if span is not None:
+                span.set(exit_code=code)
+            return code
+    finally:
+        mu.MEMORY.stop()
+        if mu.MEMORY.report or mu.MEMORY.max_rss_mb:
+            mu.MEMORY.log_report(logger)
+        tracing.close()
+
+
+def run_pipeline(args: argparse.Namespace, update_args: argparse.Namespace) -> int:
+    timings: List[StageResult] = []
+    if args.skip_update:
+        if not mu.OUTPUT_JSON.exists():
+            logger.error("%s does not exist: run without --skip-update first", mu.OUTPUT_JSON)
+            return 1
+        records = _load_once(mu.OUTPUT_JSON)
+    else:
+        captured: List[Records] = []
+        started = time.monotonic()
+        with tracing.span("stage update", stage=True):
+            code = mu.run_update(update_args, derived=lambda _args, provider: captured.append(provider))
+        timings.append(StageResult("update", "ran" if code == 0 else "failed", time.monotonic() - started))
+        if code != 0:
+            log_timings(timings)
+            return code
+        if not captured:
+            logger.info("Dataset not written (dry run): nothing to rebuild")
+            return 0
+        records = captured[0]
+
+    skipped = {"duplicates"} if update_args.skip_dedup else set()
+    if update_args.skip_facets:
+        skipped.add("facets")
+    mu.MEMORY.phase("derived stages")
+    pipeline = Pipeline((stage for stage in STAGES if stage.name not in skipped), args.manifest, args.jobs, args.force)
+    timings += pipeline.run(mu.OUTPUT_JSON, records)
+    log_timings(timings)
+    failed = [result.name for result in timings
+              if result.status in ("failed", "blocked") and not pipeline.stages[result.name].optional]
+    if failed:
+        logger.error("Pipeline failed: %s", ", ".join(failed))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Content-addressed store of the last fetched HTML page per medicament slug.
+
+The updater saves every page it downloads here so that parser changes
+(`map_details_to_record`, the therapeutic-class normaliser, ...) can be
+applied to the whole dataset with `medicaments_updater.py --reparse`
+instead of a multi-hour `--full-refresh` crawl.
+
+Layout (default `.cache/medicament_html/`, not published):
+    index.json                    slug -> {sha256, url, fetchedAt, codec}
+    objects/ab/ab12....html.zst   one compressed object per distinct page
+
+Objects are named by the SHA-256 of the raw HTML, so identical pages are
+stored once. They are compressed with zstd when the optional `zstandard`
+package is installed, gzip otherwise; both codecs are readable back as
+long as the library that wrote them is available.
+
+Usage:
+    python scripts/medicament_snapshots.py            # store statistics
+    python scripts/medicament_snapshots.py --prune    # drop unreferenced objects
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+try:  # optional: better ratio and much faster than gzip
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None  # type: ignore[assignment]
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+SNAPSHOT_DIR = ROOT_DIR / ".cache" / "medicament_html"
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+DEFAULT_CODEC = "zst" if zstandard is not None else "gz"
+
+logger = logging.getLogger("medicament_snapshots")
+
+
+def now_iso() -> str:
+    return dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def file_sha256(path: Path) -> Optional[str]:
+    """SHA-256 of a file's content, or None when it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with path.open("rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == "gz":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (needed to read .zst snapshots)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "gz":
+        return gzip.decompress(data)
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def read_object(path: Path) -> str:
+    """Return the HTML stored at *path* (codec taken from the suffix)."""
+    codec = path.suffix.lstrip(".")
+    return decompress(path.read_bytes(), codec).decode("utf-8")
+
+
+class SnapshotStore:
+    """Thread-safe HTML snapshot store.
+
+    `put` may be called from fetch worker threads; the index is only
+    persisted by `save`.
+    """
+
+    def __init__(self, root: Path = SNAPSHOT_DIR, codec: str = DEFAULT_CODEC):
+        self.root = root
+        self.codec = codec
+        self.objects_dir = root / "objects"
+        self.index_path = root / "index.json"
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.stored = 0
+        self.deduplicated = 0
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not self.index_path.exists():
+            return
+        try:
+            payload = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable snapshot index %s: %s", self.index_path, exc)
+            return
+        slugs = payload.get("slugs") if isinstance(payload, dict) else None
+        if isinstance(slugs, dict):
+            self.entries = {k: v for k, v in slugs.items() if isinstance(v, dict) and v.get("sha256")}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, slug: str) -> bool:
+        return slug in self.entries
+
+    def object_path(self, digest: str, codec: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}.html.{codec}"
+
+    def path_for(self, slug: str) -> Optional[Path]:
+        entry = self.entries.get(slug)
+        if not entry:
+            return None
+        return self.object_path(entry["sha256"], entry.get("codec", "gz"))
+
+    def put(self, slug: str, url: str, html: str) -> str:
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.object_path(digest, self.codec)
+        if path.exists():
+            created = False
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(compress(raw, self.codec))
+                os.replace(tmp_name, path)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+            created = True
+
+        with self._lock:
+            if created:
+                self.stored += 1
+            else:
+                self.deduplicated += 1
+            self.entries[slug] = {"sha256": digest, "codec": self.codec, "url": url, "fetchedAt": now_iso()}
+            self._dirty = True
+        return digest
+
+    def get(self, slug: str) -> Optional[str]:
+        path = self.path_for(slug)
+        if path is None:
+            return None
+        try:
+            return read_object(path)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Cannot read snapshot for %s (%s): %s", slug, path, exc)
+            return None
+
+    def retain(self, slugs: Iterable[str]) -> int:
+        """Forget slugs not in *slugs*; returns the number removed."""
+        keep = set(slugs)
+        with self._lock:
+            stale = [slug for slug in self.entries if slug not in keep]
+            for slug in stale:
+                del self.entries[slug]
+            if stale:
+                self._dirty = True
+        return len(stale)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {
+                "version": 1,
+                "generatedAt": now_iso(),
+                "slugs": dict(sorted(self.entries.items())),
+            }
+            self._dirty = False
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.index_path)
+
+    def prune(self) -> int:
+        """Delete objects no slug refers to; returns the number deleted."""
+        if not self.objects_dir.exists():
+            return 0
+        referenced = {self.path_for(slug) for slug in self.entries}
+        removed = 0
+        for path in self.objects_dir.glob("*/*"):
+            if path not in referenced:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        paths = {self.path_for(slug) for slug in self.entries}
+        size = sum(p.stat().st_size for p in paths if p is not None and p.exists())
+        return {"slugs": len(self.entries), "objects": len(paths), "bytes": size}
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Inspect or prune the medicament HTML snapshot store")
+    parser.add_argument("--dir", type=Path, default=SNAPSHOT_DIR, help="Snapshot store directory")
+    parser.add_argument("--prune", action="store_true", help="Delete objects not referenced by the index")
+    parser.add_argument("--verbose", action="store_true", help="Verbose logs")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    store = SnapshotStore(args.dir)
+    if args.prune:
+        logger.info("Pruned %d unreferenced objects", store.prune())
+    stats = store.stats()
+    logger.info(
+        "%s: %d slugs, %d distinct pages, %.1f MB compressed (default codec: %s)",
+        args.dir,
+        stats["slugs"],
+        stats["objects"],
+        stats["bytes"] / 1e6,
+        DEFAULT_CODEC,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""Dependency-free text normalisation for the medicament dataset.
+
+Holds the French-text helpers used by the medicaments updater (accent
+stripping, value splitting, price and date parsing, therapeutic-class
+cleanup) so that one-off scripts and notebooks can import them without
+pulling in `requests`, BeautifulSoup or the updater's network code.
+
+Only the standard library is used. Regex tables are compiled on first
+use rather than at import time.
+
+Usage:
+    from medicament_text import normalize_therapeutic_classes
+    normalize_therapeutic_classes(["ANTIBIOTIQUE", "Antibiotiques."])
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Tuple
+
+
+FR_MONTHS = {
+    "janvier": 1,
+    "fevrier": 2,
+    "février": 2,
+    "mars": 3,
+    "avril": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "aout": 8,
+    "août": 8,
+    "septembre": 9,
+    "octobre": 10,
+    "novembre": 11,
+    "decembre": 12,
+    "décembre": 12,
+}
+
+
+def strip_accents(s: str) -> str:
+    """Remove combining diacritics (é → e) for accent-insensitive matching."""
+    nfkd = unicodedata.normalize("NFD", s)
+    return "".join(ch for ch in nfkd if unicodedata.category(ch) != "Mn")
+
+
+def parse_float(value: str) -> Optional[float]:
+    if not value:
+        return None
+    cleaned = value.replace("dhs", "").replace("dh", "").replace("MAD", "")
+    cleaned = cleaned.replace("\xa0", " ").strip()
+    # keep digits, comma, dot
+    cleaned = re.sub(r"[^0-9,\.]", "", cleaned)
+    cleaned = cleaned.replace(",", ".")
+    if cleaned.count(".") > 1:
+        parts = cleaned.split(".")
+        cleaned = "".join(parts[:-1]) + "." + parts[-1]
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def split_values(value: str) -> List[str]:
+    if not value:
+        return []
+    parts = re.split(r"\s*(?:\||;|,|/|\+|\bet\b)\s*", value, flags=re.IGNORECASE)
+    out: List[str] = []
+    seen = set()
+    for part in parts:
+        p = part.strip(" -\n\t")
+        if not p:
+            continue
+        p = re.sub(r"\s+", " ", p)
+        key = p.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        out.append(p)
+    return out
+
+
+def parse_fr_date(raw: str) -> Optional[str]:
+    # examples: "5 novembre 2024"
+    raw_norm = strip_accents(raw.strip().lower())
+    m = re.search(r"(\d{1,2})\s+([a-z]+)\s+(\d{4})", raw_norm)
+    if not m:
+        return None
+    day = int(m.group(1))
+    month = FR_MONTHS.get(m.group(2))
+    year = int(m.group(3))
+    if not month:
+        return None
+    try:
+        return dt.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Therapeutic-class normalisation
+# ---------------------------------------------------------------------------
+
+# Accent-stripped word → properly accented word (for French pharma terms)
+_ACCENT_FIX: Dict[str, str] = {
+    "antidepresseur": "antidépresseur",
+    "antidepresseurs": "antidépresseurs",
+    "antiemetique": "antiémétique",
+    "antiemetiques": "antiémétiques",
+    "antianemique": "antianémique",
+    "antiasthenique": "antiasthénique",
+    "antibacterien": "antibactérien",
+    "antibacteriens": "antibactériens",
+    "antiagregant": "antiagrégant",
+    "antiacneique": "antiacnéique",
+    "periphérique": "périphérique",
+    "peripherique": "périphérique",
+    "opioide": "opioïde",
+    "opioides": "opioïdes",
+    "steroidien": "stéroïdien",
+    "steroidiens": "stéroïdiens",
+    "steroide": "stéroïde",
+    "steroides": "stéroïdes",
+    "steroidienne": "stéroïdienne",
+    "corticosteroide": "corticostéroïde",
+    "corticosteroides": "corticostéroïdes",
+    "antipyretique": "antipyrétique",
+    "antipyretiques": "antipyrétiques",
+    "analgesique": "analgésique",
+    "analgesiques": "analgésiques",
+    "antiulcereux": "antiulcéreux",
+    "antispasmodique": "antispasmodique",
+    "antihypertenseur": "antihypertenseur",
+    "antiparasitaire": "antiparasitaire",
+    "antineoplasique": "antinéoplasique",
+    "antineoplasiques": "antinéoplasiques",
+    "antiepileptique": "antiépileptique",
+    "antiepileptiques": "antiépileptiques",
+    "hypoglycemiant": "hypoglycémiant",
+    "hypolipidemiant": "hypolipidémiant",
+    "hypolipemiant": "hypolipémiant",
+    "hypolipemiants": "hypolipémiants",
+    "diuretique": "diurétique",
+    "diuretiques": "diurétiques",
+    "antitetanique": "antitétanique",
+    "cephalosporine": "céphalosporine",
+    "cephalosporines": "céphalosporines",
+    "generation": "génération",
+    "adrenergiques": "adrénergiques",
+    "dopaminergiques": "dopaminergiques",
+    "homeopathique": "homéopathique",
+    "homeopathiques": "homéopathiques",
+    "betabloquant": "bêtabloquant",
+    "betabloquants": "bêtabloquants",
+    "beta-bloquant": "bêta-bloquant",
+    "beta-bloquants": "bêta-bloquants",
+    "complement": "complément",
+    "corticoide": "corticoïde",
+    "corticoides": "corticoïdes",
+    "thyroidienne": "thyroïdienne",
+    "thyroidiennes": "thyroïdiennes",
+    "phosphodiesterase": "phosphodiestérase",
+    "mineraux": "minéraux",
+    "mineral": "minéral",
+    "oligoelements": "oligoéléments",
+    "oligoelement": "oligoélément",
+    "penicilline": "pénicilline",
+    "penicillines": "pénicillines",
+    "erectile": "érectile",
+    "antineoplasique": "antinéoplasique",
+    "antineoplasiques": "antinéoplasiques",
+}
+
+
+def _fix_accents(text: str) -> str:
+    """Fix missing/wrong accents in French pharmaceutical terms."""
+    words = text.split()
+    fixed = []
+    for w in words:
+        # Separate trailing punctuation
+        trail = ""
+        core = w
+        while core and core[-1] in ".,;:)":
+            trail = core[-1] + trail
+            core = core[:-1]
+        if not core:
+            fixed.append(w)
+            continue
+        stripped = strip_accents(core.lower())
+        if stripped in _ACCENT_FIX:
+            target = _ACCENT_FIX[stripped]
+            if core[0].isupper():
+                target = target[0].upper() + target[1:]
+            if core == core.upper() and len(core) > 3:
+                target = target.upper()
+            fixed.append(target + trail)
+        else:
+            fixed.append(w)
+    return " ".join(fixed)
+
+
+# Known acronyms preserved by case normalisation
+_ACRONYMS = frozenset({
+    "AINS", "IPP", "IEC", "ISRS", "IRSNa", "IRDN", "GnRH",
+    "DPP-4", "ECA", "IRSN", "ISRSN", "PDE5", "ADN", "HMG",
+    "CoA", "MAO", "ARA", "II", "III", "IV", "XA", "Xa",
+    "H1", "H2", "B1", "B2", "B6", "B9", "B12", "D3", "K",
+    "SGLT2", "DHA", "EPA", "RGO",
+})
+
+
+def _normalize_case(text: str) -> str:
+    """Normalize case: sentence case, preserving acronyms."""
+    if not text:
+        return text
+    words = text.split()
+    result = []
+    for i, w in enumerate(words):
+        # Keep acronyms as-is
+        if w in _ACRONYMS or w.rstrip(".,;:)") in _ACRONYMS:
+            result.append(w)
+        # Keep words with intentional mid-caps (e.g. "CoA")
+        elif any(c.isupper() for c in w[1:]) and not w.isupper():
+            result.append(w)
+        # First word: capitalize
+        elif i == 0:
+            result.append(w[0].upper() + w[1:].lower() if len(w) > 1 else w.upper())
+        # ALL-CAPS word (not acronym): lowercase
+        elif w == w.upper() and len(w) > 4:
+            result.append(w.lower())
+        # Short all-caps that aren't known acronyms: lowercase unless ≤2 chars
+        elif w == w.upper() and len(w) <= 4 and len(w) > 2:
+            result.append(w.lower())
+        else:
+            result.append(w.lower() if w[0].isupper() and i > 0 and len(w) > 1 else w)
+
+    return " ".join(result)
+
+
+# Explicit typo → correction map (lowercased keys, preferred-case values)
+_TYPO_MAP: Dict[str, str] = {
+    "abtibactérien": "Antibactérien",
+    "ais": "AINS",
+    "ant-inflammatoire non stéroïdien": "Anti-inflammatoire non stéroïdien",
+    "ant-inflammatoire stéroïdien": "Anti-inflammatoire stéroïdien",
+    "antagioniste": "Antagoniste",
+    "anti-inflammatoire non stroïdien": "Anti-inflammatoire non stéroïdien",
+    "anti-inflammatoire non stéroidien": "Anti-inflammatoire non stéroïdien",
+    "anti-inflammatoire stéroidien": "Anti-inflammatoire stéroïdien",
+    "anti-inflammatoires non stéroïdes": "Anti-inflammatoires non stéroïdiens",
+    "antimycosique a usage systemiqu": "Antimycosique à usage systémique",
+    "antaengoreux": "Antiangoreux",
+    "anytipyrétique": "antipyrétique",
+    "antbiotique": "Antibiotique",
+    "macropodes": "macrolides",
+    "fluoquinolone": "fluoroquinolone",
+    "fluoquinolones": "fluoroquinolones",
+    "plaguettaire": "plaquettaire",
+    "antihistamique": "Antihistaminique",
+    "musculoptrope": "musculotrope",
+    "musculotrpe": "musculotrope",
+    "anasthésique": "Anesthésique",
+    "anxolytique": "Anxiolytique",
+    "hynotique": "Hypnotique",
+    "hypolémiant": "Hypolipémiant",
+    "neuroleptiaue": "Neuroleptique",
+    "neuroléptique": "Neuroleptique",
+    "corticostroïde": "Corticostéroïde",
+    "glucostéroïdes": "Glucocorticoïdes",
+    "biphosphonate": "Bisphosphonate",
+    "immunosuppreseur": "Immunosuppresseur",
+    "immunosuppreseurs": "Immunosuppresseurs",
+    "antidiabètique": "Antidiabétique",
+    "mycolytique": "Mucolytique",
+    "votamines": "Vitamines",
+    "chelateur": "Chélateur",
+    "hypolipidemiant": "Hypolipémiant",
+    "cytologique": "cytotoxique",
+    "occulaire": "oculaire",
+    "veinotoniqueique": "veinotonique",
+    "duirétique": "diurétique",
+    "complémént": "Complément",
+    "allimentaire": "alimentaire",
+    "hypolémiants": "hypolipémiants",
+    "probiotics": "Probiotiques",
+    "emoliant": "Émollient",
+    "emolients": "Émollients",
+    "analoque": "analogue",
+    "antidiarrheique": "Antidiarrhéique",
+    "acétylchlinestérase": "acétylcholinestérase",
+    "sooscié": "associé",
+    "systèmique": "systémique",
+    "phosphodiésterase": "phosphodiestérase",
+    "eréctile": "érectile",
+    "hypertenseurs": "antihypertenseurs",
+    "facteur xa": "facteur Xa",
+}
+
+# Regex patterns that mark a value as junk (not a real therapeutic class)
+_JUNK_PATTERN_SOURCES: Tuple[Tuple[str, int], ...] = (
+    (r"^\d{5,}$", 0),                          # barcodes
+    (r"^[A-Z]\d{2}[A-Z]{0,2}\d{0,2}$", 0),    # ATC codes (e.g. A02BC05)
+    (r"Statut\s*:", re.IGNORECASE),          # "Statut :" appended
+    (r"\b(?:cpr|caps|pell)\s+\d", re.IGNORECASE),  # dosage forms
+    (r"\bDIOVAN\b|\bREVATIO\b|\bDEMETRIN\b|\bHYCAMTIN\b", 0),  # brand names
+    (r"\bUROMI\b", 0),                          # product name
+    (r"^(?:CalmTu|ReConnect|Vitadigest)\b", 0),  # product descriptions
+    (r"^Ce complément alimentaire", re.IGNORECASE),
+    (r"^Agalsidase bêta \(produite", re.IGNORECASE),
+    (r"est un cytostatique", re.IGNORECASE),
+    (r"^Traitement des infections suivantes", re.IGNORECASE),
+    (r"\bATC\s+[A-Z]\d{2}", re.IGNORECASE),  # inline ATC refs
+    (r"\bliste\s+\d", re.IGNORECASE),        # "liste 2" appended
+    (r"\bDCI\s*:", re.IGNORECASE),            # DCI refs
+    (r"^flacon compte goutte", re.IGNORECASE),
+    (r"^20 ML$", re.IGNORECASE),
+    (r"^ÉDICAMENTS?\b", 0),                      # truncated MÉDICAMENTS
+)
+
+# Fragment patterns: values from incorrect splitting that aren't real classes
+_FRAGMENT_PATTERN_SOURCES: Tuple[Tuple[str, int], ...] = (
+    (r"^(?:cystite|pyélonéphrite|otite moyenne aiguë|pneumonie aiguë communautaire)$", re.IGNORECASE),
+    (r"^(?:infections de la peau|infections des os|morsures animales)$", re.IGNORECASE),
+    (r"^(?:abcès dentaire|exacerbations aiguës|sinusite bactérienne)", re.IGNORECASE),
+    (r"^en particulier (?:ostéomyélite|cellulite)", re.IGNORECASE),
+    (r"^les enfants", re.IGNORECASE),
+    (r"ayant un effet bénéfique", re.IGNORECASE),
+    (r"^(?:CD3\)|CDK6|D3\)|EPA\)|III|dose réduite\))$", 0),
+    (r"^(?:alpha|puissant|monovalent|recombinant|sélectif|non fractionnée|non ionique|prolongée\.?)$", re.IGNORECASE),
+    (r"^(?:apparentés|associations\.?\s*(?:IEC)?|autres combinaisons|incluant les associations)$", re.IGNORECASE),
+    (r"^(?:de basse osmolarité|des propriétés vasoconstrictrices|à élimination rénale)$", re.IGNORECASE),
+    (r"^(?:la coqueluche|la diphtérie|la poliomyélite|la vitamine|le sommeil|le reflux)$", re.IGNORECASE),
+    (r"^de (?:la noradrénaline|l'hypothalamus|Antagoniste|bronchodilatateur)$", re.IGNORECASE),
+    (r"^(?:des articulations|des tissus mous|des fissures anales|scabicides inclus)$", re.IGNORECASE),
+    (r"^(?:non stéroïdiens|immunomodulateurs\)|anti-IL-23\)|diurétique \))$", re.IGNORECASE),
+    (r"^(?:LE REFLUX GASTRO|DES FISSURES ANALES|SCABICIDES INCLUS)", re.IGNORECASE),
+    (r"^(?:rhCG|rhFSH|rhLH|époétine alfa|époétine bêta|insuline glargine|lixisénatide|somatropine)$", re.IGNORECASE),
+)
+
+# Active ingredients misclassified as therapeutic classes
+_NOT_A_CLASS = {
+    "fer", "iode", "zinc", "sélénium", "lévodopa", "métformine",
+    "repaglinide", "prégabaline", "cyclophosphamide", "follitropine alfa",
+}
+
+
+@lru_cache(maxsize=None)
+def _junk_patterns() -> Tuple[Pattern[str], ...]:
+    return tuple(
+        re.compile(source, flags)
+        for source, flags in _JUNK_PATTERN_SOURCES + _FRAGMENT_PATTERN_SOURCES
+    )
+
+
+@lru_cache(maxsize=None)
+def _typo_patterns() -> Tuple[Tuple[Pattern[str], str], ...]:
+    return tuple((re.compile(re.escape(typo), re.IGNORECASE), fix) for typo, fix in _TYPO_MAP.items())
+
+
+def _apply_typo_fixes(text: str) -> str:
+    """Apply word-level typo corrections."""
+    lower = text.lower()
+    # Try full-string match first
+    if lower in _TYPO_MAP:
+        return _TYPO_MAP[lower]
+    # Try word-level replacements
+    result = text
+    for pattern, fix in _typo_patterns():
+        if pattern.search(result):
+            result = pattern.sub(fix, result)
+    return result
+
+
+def _is_junk(value: str) -> bool:
+    """Check if a value should be discarded entirely."""
+    stripped = value.strip()
+    if not stripped or len(stripped) < 2:
+        return True
+    if len(stripped) > 120:
+        return True
+    if stripped.lower() in _NOT_A_CLASS:
+        return True
+    for pat in _junk_patterns():
+        if pat.search(stripped):
+            return True
+    return False
+
+
+def normalize_therapeutic_classes(values: List[str]) -> List[str]:
+    """Normalize a list of therapeutic class strings.
+
+    Applies: junk removal, typo fixes, punctuation cleanup,
+    whitespace normalization, case normalization, deduplication.
+    """
+    result: List[str] = []
+    seen: set = set()
+
+    for raw in values:
+        v = raw.strip()
+        if not v:
+            continue
+
+        # 1. Discard junk
+        if _is_junk(v):
+            continue
+
+        # 2. Fix concatenation errors (missing spaces)
+        v = re.sub(r"([a-zé])([A-Z])", r"\1, \2", v)  # "AntiacideAntiulcéreux"
+        v = re.sub(r"Anti-inAnti-", "Anti-", v)  # stuttered prefix
+
+        # 3. Strip trailing punctuation
+        v = re.sub(r"[.,;:]+\s*$", "", v)
+
+        # 4. Fix double spaces
+        v = re.sub(r"\s{2,}", " ", v).strip()
+
+        # 5. Fix unbalanced parentheses (missing closing)
+        open_count = v.count("(")
+        close_count = v.count(")")
+        if open_count > close_count:
+            v += ")" * (open_count - close_count)
+
+        # 6. Apply typo corrections
+        v = _apply_typo_fixes(v)
+
+        # 7. Fix accents (missing/wrong diacritics)
+        v = _fix_accents(v)
+
+        # 8. Case normalization
+        v = _normalize_case(v)
+
+        # 9. Ensure first letter is uppercase
+        if v and v[0].islower():
+            v = v[0].upper() + v[1:]
+
+        # 10. Second junk check after transformations (e.g. concatenation fixes)
+        if _is_junk(v):
+            continue
+
+        # 11. Deduplicate (case-insensitive, accent-insensitive)
+        key = strip_accents(v.lower().strip())
+        # Also strip trailing 's' for dedup
+        dedup_key = key.rstrip("s") if len(key) > 3 else key
+        if dedup_key in seen:
+            continue
+        seen.add(dedup_key)
+        seen.add(key)
+
+        if v.strip():
+            result.append(v.strip())
+
+    return result
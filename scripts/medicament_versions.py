@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""Versioned deltas of the medicament dataset for incremental client sync.
+
+Every updater write that changes `medicament_ma_optimized.json` becomes a
+new dataset version. The last N versions are listed in a version index,
+and each of them but the oldest has a delta file from the version before
+it, so a client holding version V downloads the deltas V+1..latest
+instead of the whole corpus. A client on a version no longer listed (or
+on none) downloads the full dataset.
+
+Layout (`public/data/medicament_versions/`):
+    index.json    {"format": "json-patch", "latest": 42, "versions": [
+                     {"version": 40, "generatedAt", "records", "sha256"},
+                     {"version": 41, ..., "delta": {"file": "medicament_versions/41.json",
+                                                    "bytes", "adds", "updates", "deletes"}},
+                     ...]}
+    41.json       {"format": "json-patch", "from": 40, "to": 41, "generatedAt", "patch": [...]}
+
+A patch is an RFC 6902 JSON Patch over the dataset seen as an object keyed
+by record: the record id ("%" and "#" in it escaped as "%25" and "%23"),
+with "#2", "#3", ... appended for further rows sharing an id (in dataset
+order). Operations:
+    {"op": "add",     "path": "/<key>", "value": {record}}     new record
+    {"op": "replace", "path": "/<key>", "value": {record}}     reshaped record
+    {"op": "replace", "path": "/<key>/<field>", "value": ...}  changed field
+    {"op": "remove",  "path": "/<key>/<field>"}                dropped field
+    {"op": "remove",  "path": "/<key>"}                        deleted record
+(keys and fields are JSON Pointer escaped: "~" -> "~0", "/" -> "~1").
+Changed records carry only their changed fields, unless a whole-record
+replace is shorter or the record's field order changed. After applying,
+the dataset array is the records sorted by (name lowercased, id
+lowercased, occurrence) — the updater's output order — which
+`apply_patch` reproduces exactly; `sha256` in the index is the hash of
+the dataset file written with the updater's formatting (`dataset_bytes`).
+
+The diff streams: the previous version is read twice (record digests,
+then the changed records' fields) and the new one once, so only changed
+records are held in memory.
+
+Usage:
+    python scripts/medicament_versions.py                       # index summary
+    python scripts/medicament_versions.py --apply old.json --from-version 40 --output new.json
+    python scripts/medicament_versions.py --verify               # round-trip check on the dataset
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from medicament_snapshots import file_sha256, now_iso
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT_DIR / "public" / "data"
+DATASET_JSON = DATA_DIR / "medicament_ma_optimized.json"
+VERSIONS_DIR = DATA_DIR / "medicament_versions"
+DEFAULT_KEEP = 30
+FORMAT = "json-patch"
+
+logger = logging.getLogger("medicament_versions")
+
+Records = Callable[[], Iterable[Dict[str, Any]]]
+Patch = List[Dict[str, Any]]
+
+
+def _read_json_array(path: Path) -> List[Dict[str, Any]]:
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(payload, list):
+        raise ValueError(f"Invalid format for {path} (expected list)")
+    return payload
+
+
+def dataset_bytes(records: List[Dict[str, Any]]) -> bytes:
+    """The dataset file as the updater writes it (`write_json`)."""
+    return json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Record keys and order
+# ---------------------------------------------------------------------------
+
+def _key_id(record: Dict[str, Any]) -> str:
+    # "%" and "#" are percent-escaped so "#n" only ever marks an occurrence
+    # ("a#2" as an id must not collide with the second "a" row)
+    return str(record.get("id", "")).replace("%", "%25").replace("#", "%23")
+
+
+def record_keys(records: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(key, record) in dataset order: the escaped id, "#n" for its n-th row."""
+    seen: Dict[str, int] = {}
+    for record in records:
+        rid = _key_id(record)
+        seen[rid] = seen.get(rid, 0) + 1
+        yield (rid if seen[rid] == 1 else f"{rid}#{seen[rid]}"), record
+
+
+def _occurrence(key: str) -> int:
+    _, sep, n = key.rpartition("#")
+    return int(n) if sep else 1
+
+
+def _order_key(record: Dict[str, Any]) -> Tuple[str, str]:
+    # medicaments_updater.output_sort_key
+    return (str(record.get("name", "")).lower(), str(record.get("id", "")).lower())
+
+
+def sort_records(keyed: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [record for key, record in sorted(keyed.items(), key=lambda kv: (*_order_key(kv[1]), _occurrence(kv[0])))]
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _digest(record: Dict[str, Any]) -> bytes:
+    # Field order is part of the record: the dataset file must round-trip
+    return hashlib.sha1(json.dumps(record, ensure_ascii=False).encode("utf-8")).digest()
+
+
+def _same(a: Any, b: Any) -> bool:
+    # 1 == 1.0 == True in Python, not in the JSON file
+    return json.dumps(a, ensure_ascii=False) == json.dumps(b, ensure_ascii=False)
+
+
+# ---------------------------------------------------------------------------
+# Diff and apply
+# ---------------------------------------------------------------------------
+
+def record_ops(key: str, old: Dict[str, Any], new: Dict[str, Any]) -> Patch:
+    """Operations turning *old* into *new*: changed fields only, or a whole
+    record replace when fields were added or reordered, or when shorter."""
+    whole = [{"op": "replace", "path": f"/{_escape(key)}", "value": new}]
+    if [field for field in old if field in new] != list(new):
+        return whole
+    ops: Patch = []
+    for field, value in old.items():
+        path = f"/{_escape(key)}/{_escape(field)}"
+        if field not in new:
+            ops.append({"op": "remove", "path": path})
+        elif not _same(value, new[field]):
+            ops.append({"op": "replace", "path": path, "value": new[field]})
+    if len(json.dumps(ops, ensure_ascii=False)) >= len(json.dumps(whole, ensure_ascii=False)):
+        return whole
+    return ops
+
+
+def diff_datasets(previous: Records, current: Records) -> Tuple[Patch, bool, int]:
+    """JSON Patch from *previous* to *current* (providers called once or
+    twice each). Returns (patch, ordered, record count of *current*);
+    ordered=False means *current* is not in the updater's output order, so
+    `apply_patch` could not reproduce it."""
+    digests = {key: _digest(record) for key, record in record_keys(previous())}
+
+    added: Patch = []
+    changed: Dict[str, Dict[str, Any]] = {}
+    order: List[str] = []
+    ordered = True
+    last: Optional[Tuple[str, str]] = None
+    last_id = None
+    count = 0
+    for key, record in record_keys(current()):
+        count += 1
+        sort_key = _order_key(record)
+        if last is not None and (sort_key < last or (sort_key == last and record.get("id") != last_id)):
+            ordered = False
+        last, last_id = sort_key, record.get("id")
+        digest = digests.pop(key, None)
+        if digest is None:
+            added.append({"op": "add", "path": f"/{_escape(key)}", "value": record})
+            order.append(key)
+        elif digest != _digest(record):
+            changed[key] = record
+            order.append(key)
+
+    updates: Dict[str, Patch] = {}
+    if changed:
+        for key, record in record_keys(previous()):
+            if key in changed:
+                updates[key] = record_ops(key, record, changed[key])
+
+    patch: Patch = [{"op": "remove", "path": f"/{_escape(key)}"} for key in digests]
+    added_by_key = {_unescape(op["path"][1:]): op for op in added}
+    for key in order:
+        patch.extend([added_by_key[key]] if key in added_by_key else updates[key])
+    return patch, ordered, count
+
+
+def patch_stats(patch: Patch) -> Dict[str, int]:
+    adds = sum(1 for op in patch if op["op"] == "add" and op["path"].count("/") == 1)
+    deletes = sum(1 for op in patch if op["op"] == "remove" and op["path"].count("/") == 1)
+    updates = len({op["path"].split("/")[1] for op in patch if op["path"].count("/") == 2}
+                  | {op["path"] for op in patch if op["op"] == "replace" and op["path"].count("/") == 1})
+    return {"adds": adds, "updates": updates, "deletes": deletes}
+
+
+def apply_patch(records: Iterable[Dict[str, Any]], patch: Patch) -> List[Dict[str, Any]]:
+    """Reference applier: *records* (one dataset version) with *patch*
+    applied, in dataset order. Raises ValueError on a patch that does not
+    fit the records."""
+    keyed = {key: copy.deepcopy(record) for key, record in record_keys(records)}
+    for op in patch:
+        tokens = [_unescape(token) for token in str(op.get("path", "")).split("/")[1:]]
+        kind = op.get("op")
+        if len(tokens) == 1:
+            key = tokens[0]
+            if kind == "add":
+                keyed[key] = copy.deepcopy(op["value"])
+            elif kind in ("replace", "remove") and key in keyed:
+                if kind == "replace":
+                    keyed[key] = copy.deepcopy(op["value"])
+                else:
+                    del keyed[key]
+            else:
+                raise ValueError(f"cannot {kind} record {key!r}")
+        elif len(tokens) == 2 and tokens[0] in keyed:
+            record, field = keyed[tokens[0]], tokens[1]
+            if kind == "add" or (kind == "replace" and field in record):
+                record[field] = copy.deepcopy(op["value"])
+            elif kind == "remove" and field in record:
+                del record[field]
+            else:
+                raise ValueError(f"cannot {kind} {op.get('path')}")
+        else:
+            raise ValueError(f"unsupported operation {op!r}")
+    return sort_records(keyed)
+
+
+# ---------------------------------------------------------------------------
+# Version index
+# ---------------------------------------------------------------------------
+
+def load_index(versions_dir: Path = VERSIONS_DIR) -> Dict[str, Any]:
+    try:
+        index = json.loads((versions_dir / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        index = {}
+    if not isinstance(index.get("versions"), list):
+        index["versions"] = []
+    return index
+
+
+def _write_text(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+
+def _delta_text(from_version: int, to_version: int, patch: Patch) -> str:
+    # One operation per line: readable diffs of the published files
+    head = json.dumps({"format": FORMAT, "from": from_version, "to": to_version, "generatedAt": now_iso()},
+                      ensure_ascii=False, separators=(",", ":"))
+    ops = ",\n".join(json.dumps(op, ensure_ascii=False, separators=(",", ":")) for op in patch)
+    return f'{head[:-1]},"patch":[\n{ops}\n]}}\n' if patch else f'{head[:-1]},"patch":[]}}\n'
+
+
+def snapshot_previous(path: Path) -> Optional[Path]:
+    """Keep the current content of *path* at `<path>.prev` (a hard link when
+    possible) before it is replaced; None if there is nothing to keep."""
+    if not path.exists():
+        return None
+    previous = path.with_name(path.name + ".prev")
+    previous.unlink(missing_ok=True)
+    try:
+        os.link(path, previous)
+    except OSError:
+        shutil.copyfile(path, previous)
+    return previous
+
+
+def publish_version(
+    previous_path: Optional[Path],
+    current_path: Path = DATASET_JSON,
+    versions_dir: Path = VERSIONS_DIR,
+    keep: int = DEFAULT_KEEP,
+    read: Callable[[Path], Iterable[Dict[str, Any]]] = _read_json_array,
+) -> Optional[Dict[str, Any]]:
+    """Record *current_path* as a new version, with a delta from
+    *previous_path* when that file is the latest listed version. Keeps the
+    last *keep* versions. Returns the new index entry (None if unchanged)."""
+    index = load_index(versions_dir)
+    versions: List[Dict[str, Any]] = index["versions"]
+    current_sha = file_sha256(current_path)
+    latest = versions[-1] if versions else None
+    if current_sha is None or (latest is not None and latest.get("sha256") == current_sha):
+        return None
+
+    version = int(latest["version"]) + 1 if latest else 1
+    entry: Dict[str, Any] = {"version": version, "generatedAt": now_iso(), "records": 0, "sha256": current_sha}
+    previous_sha = file_sha256(previous_path) if previous_path is not None else None
+    if latest is not None and previous_sha == latest.get("sha256"):
+        patch, ordered, entry["records"] = diff_datasets(lambda: read(previous_path), lambda: read(current_path))
+        if ordered:
+            text = _delta_text(int(latest["version"]), version, patch)
+            _write_text(versions_dir / f"{version}.json", text)
+            entry["delta"] = {"file": f"{versions_dir.name}/{version}.json", "bytes": len(text.encode("utf-8")),
+                              **patch_stats(patch)}
+        else:
+            logger.warning("Versions: %s is not in output order, starting a new version chain", current_path.name)
+    else:
+        if latest is not None:
+            logger.info("Versions: previous dataset is not version %s, starting a new version chain", latest["version"])
+        entry["records"] = sum(1 for _ in read(current_path))
+    if "delta" not in entry:
+        versions = []  # no listed version leads to this one any more
+
+    versions = (versions + [entry])[-max(1, keep):]
+    versions[0].pop("delta", None)  # its base is no longer listed
+    kept = {f"{item['version']}.json" for item in versions if "delta" in item}
+    for path in versions_dir.glob("*.json"):
+        if path.name != "index.json" and path.name not in kept:
+            path.unlink()
+    index = {
+        "format": FORMAT,
+        "dataset": current_path.name,
+        "recordKey": "id, then id#2, id#3... for further rows with the same id",
+        "order": ["name (lowercase)", "id (lowercase)", "occurrence"],
+        "latest": version,
+        "versions": versions,
+    }
+    _write_text(versions_dir / "index.json", json.dumps(index, ensure_ascii=False, indent=2) + "\n")
+    return entry
+
+
+def apply_chain(records: Iterable[Dict[str, Any]], from_version: int,
+                versions_dir: Path = VERSIONS_DIR) -> Tuple[List[Dict[str, Any]], int]:
+    """*records* at *from_version* brought to the latest version with the
+    published deltas. Returns (records, latest version)."""
+    index = load_index(versions_dir)
+    listed = [int(item["version"]) for item in index["versions"]]
+    if from_version not in listed:
+        raise ValueError(f"version {from_version} is not listed (available: {listed or 'none'}): "
+                         "download the full dataset")
+    result = list(records)
+    for item in index["versions"][listed.index(from_version) + 1:]:
+        delta = json.loads((versions_dir.parent / item["delta"]["file"]).read_text(encoding="utf-8"))
+        result = apply_patch(result, delta["patch"])
+    return result, listed[-1]
+
+
+# ---------------------------------------------------------------------------
+# Round-trip check
+# ---------------------------------------------------------------------------
+
+def mutate(records: List[Dict[str, Any]], rng: random.Random) -> List[Dict[str, Any]]:
+    """A plausible next version of *records*: deleted, added, duplicated and
+    edited rows (changed, dropped, added and reordered fields)."""
+    out = [copy.deepcopy(record) for record in records if rng.random() > 0.02]
+    for record in rng.sample(out, min(len(out), max(1, len(out) // 20))):
+        fields = [field for field in record if field != "id"]
+        roll = rng.random()
+        if roll < 0.4 and fields:
+            record[rng.choice(fields)] = f"changed {rng.random():.6f}"
+        elif roll < 0.55 and fields:
+            del record[rng.choice(fields)]
+        elif roll < 0.7:
+            record[f"extra{rng.randint(0, 3)}"] = [rng.randint(0, 9), None, True]
+        elif roll < 0.8:
+            items = list(record.items())
+            rng.shuffle(items)
+            record.clear()
+            record.update(items)
+        elif roll < 0.9 and "name" in record:
+            record["name"] = f"{rng.choice('ABZ')} {record['name']}"
+        else:
+            out.append(copy.deepcopy(record))  # a second row with the same id
+    for i in range(max(1, len(records) // 100)):
+        out.append({"id": f"new-{rng.randint(0, 10**6)}-{i}", "name": f"NEW {i} ~/ é", "activeIngredient": ["x"]})
+    out.sort(key=_order_key)
+    return out
+
+
+def verify_round_trip(records: List[Dict[str, Any]], rounds: int = 5, seed: int = 0) -> bool:
+    """Diff *records* against successive mutations and check that applying
+    each patch rebuilds the mutated dataset byte for byte."""
+    rng = random.Random(seed)
+    ok = True
+    current = records
+    for round_no in range(1, rounds + 1):
+        following = mutate(current, rng)
+        patch, ordered, count = diff_datasets(lambda: current, lambda: following)
+        rebuilt = apply_patch(current, patch)
+        same = ordered and dataset_bytes(rebuilt) == dataset_bytes(following)
+        stats = patch_stats(patch)
+        logger.info("Round %d: %d records, %d ops (%s), delta %.1f KB vs %.1f KB full: %s", round_no, count,
+                    len(patch), ", ".join(f"{k}={v}" for k, v in stats.items()),
+                    len(_delta_text(0, 1, patch).encode("utf-8")) / 1024, len(dataset_bytes(following)) / 1024,
+                    "OK" if same else "MISMATCH")
+        ok = ok and same
+        current = following
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Medicament dataset versions and deltas")
+    parser.add_argument("--versions-dir", type=Path, default=VERSIONS_DIR, help="Version index directory")
+    parser.add_argument("--apply", type=Path, metavar="DATASET", help="Bring DATASET (at --from-version) to the latest version")
+    parser.add_argument("--from-version", type=int, help="Version of the --apply dataset")
+    parser.add_argument("--output", type=Path, help="Write the --apply result here")
+    parser.add_argument("--verify", action="store_true", help="Round-trip check of diff + apply on --input")
+    parser.add_argument("--input", type=Path, default=DATASET_JSON, help="Dataset for --verify")
+    parser.add_argument("--rounds", type=int, default=5, help="Successive versions checked by --verify")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Verbose logs")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    try:
+        if args.verify:
+            return 0 if verify_round_trip(_read_json_array(args.input), args.rounds, args.seed) else 1
+        if args.apply:
+            if args.from_version is None:
+                logger.error("--apply needs --from-version")
+                return 1
+            records, latest = apply_chain(_read_json_array(args.apply), args.from_version, args.versions_dir)
+            data = dataset_bytes(records)
+            expected = load_index(args.versions_dir)["versions"][-1]["sha256"]
+            if hashlib.sha256(data).hexdigest() != expected:
+                logger.error("Version %d rebuilt from %s does not match the published hash", latest, args.apply)
+                return 1
+            if args.output:
+                args.output.write_bytes(data)
+            logger.info("Rebuilt version %d (%d records)%s", latest, len(records),
+                        f" into {args.output}" if args.output else "")
+            return 0
+    except Exception as exc:  # noqa: BLE001
+        logger.error("%s", exc)
+        return 1
+
+    index = load_index(args.versions_dir)
+    if not index["versions"]:
+        logger.info("No versions in %s", args.versions_dir)
+        return 0
+    for item in index["versions"]:
+        delta = item.get("delta")
+        logger.info("v%-5d %s %6d records%s", item["version"], item["generatedAt"], item["records"],
+                    f"  delta {delta['bytes'] / 1024:.1f} KB (+{delta['adds']} ~{delta['updates']} -{delta['deletes']})"
+                    if delta else "")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
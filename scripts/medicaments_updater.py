@@ -9,34 +9,68 @@ Highlights:
 - Bootstrap mode from existing local JSON (no expensive full crawl on first run)
 - Grace periods for missing/disappearing pages (avoid abrupt data drops)
 - Safety guard against large accidental drops
+- Near-duplicate report (MinHash/LSH, see medicament_dedup.py) on every run
+- Precomputed facet posting lists (see medicament_facets.py) on every run
+- Fetched HTML kept in a content-addressed snapshot store, so `--reparse`
+  can apply parser changes to every record without re-downloading
+- Optional NDJSON trace (`--trace`, see tracing.py): a span per pipeline
+  stage and per HTTP request, readable with trace_report.py
+- Optional per-stage memory report (`--memory-report`: peak RSS and
+  tracemalloc top allocators) and RSS budget (`--max-rss`): a dataset too
+  big for the budget is merged with `--streaming`, and a run going over it
+  stops before writing anything (exit code 3). See memory_monitor.py; the
+  figures are kept in the state file's "memory"
+- Every write that changes the dataset is published as a new version with
+  a JSON Patch delta from the previous one (`--keep-versions`, see
+  medicament_versions.py), so clients can sync incrementally
 
 Usage:
     python scripts/medicaments_updater.py
     python scripts/medicaments_updater.py --full-refresh
     python scripts/medicaments_updater.py --limit 50 --verbose
+    python scripts/medicaments_updater.py --reparse
+    python scripts/medicaments_updater.py --limit 50 --trace /tmp/updater.trace.ndjson
+    python scripts/medicaments_updater.py --memory-report --max-rss 1024
 """
 
 from __future__ import annotations
 
 import argparse
 import concurrent.futures
+import contextvars
 import datetime as dt
+import heapq
 import json
 import logging
 import os
 import random
 import re
+import tempfile
 import threading
 import time
-import unicodedata
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import requests
 from bs4 import BeautifulSoup
 
+import tracing
+from http_client import HttpClient, RetryPolicy
+from medicament_dedup import DUPLICATES_JSON, write_duplicates_report
+from medicament_facets import FACETS_JSON, write_facets
+from medicament_snapshots import SNAPSHOT_DIR, SnapshotStore, read_object
+from medicament_versions import DEFAULT_KEEP, VERSIONS_DIR, publish_version, snapshot_previous
+from memory_monitor import MemoryBudgetExceeded, MemoryMonitor
+from medicament_text import (
+    normalize_therapeutic_classes,
+    parse_float,
+    parse_fr_date,
+    split_values,
+    strip_accents,
+)
+
 
 BASE_URL = "https://medicament.ma"
 SITEMAP_INDEX_URL = f"{BASE_URL}/wp-sitemap.xml"
@@ -56,29 +90,13 @@ ABSENT_GRACE_RUNS = 7
 DEFAULT_REQUEST_DELAY = 0.35
 DEFAULT_REQUEST_JITTER = 0.08
 DEFAULT_CONCURRENCY = 1
+# RSS of the in-memory merge per byte of dataset + state JSON (several
+# copies of the records; measured with bench_updater_memory.py)
+IN_MEMORY_RSS_FACTOR = 6
 
 logger = logging.getLogger("medicaments_updater")
 
 
-FR_MONTHS = {
-    "janvier": 1,
-    "fevrier": 2,
-    "février": 2,
-    "mars": 3,
-    "avril": 4,
-    "mai": 5,
-    "juin": 6,
-    "juillet": 7,
-    "aout": 8,
-    "août": 8,
-    "septembre": 9,
-    "octobre": 10,
-    "novembre": 11,
-    "decembre": 12,
-    "décembre": 12,
-}
-
-
 @dataclass
 class SitemapEntry:
     url: str
@@ -114,422 +132,14 @@ def now_iso() -> str:
 
 
 def to_ascii_slug(value: str) -> str:
-    value = unicodedata.normalize("NFD", value)
-    value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
-    value = value.lower()
+    value = strip_accents(value).lower()
     value = re.sub(r"[^a-z0-9]+", "-", value)
     value = re.sub(r"-+", "-", value).strip("-")
     return value
 
 
-def parse_float(value: str) -> Optional[float]:
-    if not value:
-        return None
-    cleaned = value.replace("dhs", "").replace("dh", "").replace("MAD", "")
-    cleaned = cleaned.replace("\xa0", " ").strip()
-    # keep digits, comma, dot
-    cleaned = re.sub(r"[^0-9,\.]", "", cleaned)
-    cleaned = cleaned.replace(",", ".")
-    if cleaned.count(".") > 1:
-        parts = cleaned.split(".")
-        cleaned = "".join(parts[:-1]) + "." + parts[-1]
-    try:
-        return float(cleaned)
-    except ValueError:
-        return None
-
-
-def split_values(value: str) -> List[str]:
-    if not value:
-        return []
-    parts = re.split(r"\s*(?:\||;|,|/|\+|\bet\b)\s*", value, flags=re.IGNORECASE)
-    out: List[str] = []
-    seen = set()
-    for part in parts:
-        p = part.strip(" -\n\t")
-        if not p:
-            continue
-        p = re.sub(r"\s+", " ", p)
-        key = p.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(p)
-    return out
-
-
-# ---------------------------------------------------------------------------
-# Therapeutic-class normalisation
-# ---------------------------------------------------------------------------
-
-def _tc_strip_accents(s: str) -> str:
-    """Remove combining diacritics for fuzzy matching."""
-    nfkd = unicodedata.normalize("NFD", s)
-    return "".join(ch for ch in nfkd if unicodedata.category(ch) != "Mn")
-
-
-# Accent-stripped word → properly accented word (for French pharma terms)
-_ACCENT_FIX: Dict[str, str] = {
-    "antidepresseur": "antidépresseur",
-    "antidepresseurs": "antidépresseurs",
-    "antiemetique": "antiémétique",
-    "antiemetiques": "antiémétiques",
-    "antianemique": "antianémique",
-    "antiasthenique": "antiasthénique",
-    "antibacterien": "antibactérien",
-    "antibacteriens": "antibactériens",
-    "antiagregant": "antiagrégant",
-    "antiacneique": "antiacnéique",
-    "periphérique": "périphérique",
-    "peripherique": "périphérique",
-    "opioide": "opioïde",
-    "opioides": "opioïdes",
-    "steroidien": "stéroïdien",
-    "steroidiens": "stéroïdiens",
-    "steroide": "stéroïde",
-    "steroides": "stéroïdes",
-    "steroidienne": "stéroïdienne",
-    "corticosteroide": "corticostéroïde",
-    "corticosteroides": "corticostéroïdes",
-    "antipyretique": "antipyrétique",
-    "antipyretiques": "antipyrétiques",
-    "analgesique": "analgésique",
-    "analgesiques": "analgésiques",
-    "antiulcereux": "antiulcéreux",
-    "antispasmodique": "antispasmodique",
-    "antihypertenseur": "antihypertenseur",
-    "antiparasitaire": "antiparasitaire",
-    "antineoplasique": "antinéoplasique",
-    "antineoplasiques": "antinéoplasiques",
-    "antiepileptique": "antiépileptique",
-    "antiepileptiques": "antiépileptiques",
-    "hypoglycemiant": "hypoglycémiant",
-    "hypolipidemiant": "hypolipidémiant",
-    "hypolipemiant": "hypolipémiant",
-    "hypolipemiants": "hypolipémiants",
-    "diuretique": "diurétique",
-    "diuretiques": "diurétiques",
-    "antitetanique": "antitétanique",
-    "cephalosporine": "céphalosporine",
-    "cephalosporines": "céphalosporines",
-    "generation": "génération",
-    "adrenergiques": "adrénergiques",
-    "dopaminergiques": "dopaminergiques",
-    "homeopathique": "homéopathique",
-    "homeopathiques": "homéopathiques",
-    "betabloquant": "bêtabloquant",
-    "betabloquants": "bêtabloquants",
-    "beta-bloquant": "bêta-bloquant",
-    "beta-bloquants": "bêta-bloquants",
-    "complement": "complément",
-    "corticoide": "corticoïde",
-    "corticoides": "corticoïdes",
-    "thyroidienne": "thyroïdienne",
-    "thyroidiennes": "thyroïdiennes",
-    "phosphodiesterase": "phosphodiestérase",
-    "mineraux": "minéraux",
-    "mineral": "minéral",
-    "oligoelements": "oligoéléments",
-    "oligoelement": "oligoélément",
-    "penicilline": "pénicilline",
-    "penicillines": "pénicillines",
-    "erectile": "érectile",
-    "antineoplasique": "antinéoplasique",
-    "antineoplasiques": "antinéoplasiques",
-}
-
-
-def _fix_accents(text: str) -> str:
-    """Fix missing/wrong accents in French pharmaceutical terms."""
-    words = text.split()
-    fixed = []
-    for w in words:
-        # Separate trailing punctuation
-        trail = ""
-        core = w
-        while core and core[-1] in ".,;:)":
-            trail = core[-1] + trail
-            core = core[:-1]
-        if not core:
-            fixed.append(w)
-            continue
-        stripped = _tc_strip_accents(core.lower())
-        if stripped in _ACCENT_FIX:
-            target = _ACCENT_FIX[stripped]
-            if core[0].isupper():
-                target = target[0].upper() + target[1:]
-            if core == core.upper() and len(core) > 3:
-                target = target.upper()
-            fixed.append(target + trail)
-        else:
-            fixed.append(w)
-    return " ".join(fixed)
-
-
-def _normalize_case(text: str) -> str:
-    """Normalize case: sentence case, preserving acronyms."""
-    if not text:
-        return text
-    # Known acronyms to preserve
-    acronyms = {"AINS", "IPP", "IEC", "ISRS", "IRSNa", "IRDN", "GnRH",
-                "DPP-4", "ECA", "IRSN", "ISRSN", "PDE5", "ADN", "HMG",
-                "CoA", "MAO", "ARA", "II", "III", "IV", "XA", "Xa",
-                "H1", "H2", "B1", "B2", "B6", "B9", "B12", "D3", "K",
-                "SGLT2", "DHA", "EPA", "RGO"}
-
-    words = text.split()
-    result = []
-    for i, w in enumerate(words):
-        # Keep acronyms as-is
-        if w in acronyms or w.rstrip(".,;:)") in acronyms:
-            result.append(w)
-        # Keep words with intentional mid-caps (e.g. "CoA")
-        elif any(c.isupper() for c in w[1:]) and not w.isupper():
-            result.append(w)
-        # First word: capitalize
-        elif i == 0:
-            result.append(w[0].upper() + w[1:].lower() if len(w) > 1 else w.upper())
-        # ALL-CAPS word (not acronym): lowercase
-        elif w == w.upper() and len(w) > 4:
-            result.append(w.lower())
-        # Short all-caps that aren't known acronyms: lowercase unless ≤2 chars
-        elif w == w.upper() and len(w) <= 4 and len(w) > 2:
-            result.append(w.lower())
-        else:
-            result.append(w.lower() if w[0].isupper() and i > 0 and len(w) > 1 else w)
-
-    return " ".join(result)
-
-
-# Explicit typo → correction map (lowercased keys, preferred-case values)
-_TYPO_MAP: Dict[str, str] = {
-    "abtibactérien": "Antibactérien",
-    "ais": "AINS",
-    "ant-inflammatoire non stéroïdien": "Anti-inflammatoire non stéroïdien",
-    "ant-inflammatoire stéroïdien": "Anti-inflammatoire stéroïdien",
-    "antagioniste": "Antagoniste",
-    "anti-inflammatoire non stroïdien": "Anti-inflammatoire non stéroïdien",
-    "anti-inflammatoire non stéroidien": "Anti-inflammatoire non stéroïdien",
-    "anti-inflammatoire stéroidien": "Anti-inflammatoire stéroïdien",
-    "anti-inflammatoires non stéroïdes": "Anti-inflammatoires non stéroïdiens",
-    "antimycosique a usage systemiqu": "Antimycosique à usage systémique",
-    "antaengoreux": "Antiangoreux",
-    "anytipyrétique": "antipyrétique",
-    "antbiotique": "Antibiotique",
-    "macropodes": "macrolides",
-    "fluoquinolone": "fluoroquinolone",
-    "fluoquinolones": "fluoroquinolones",
-    "plaguettaire": "plaquettaire",
-    "antihistamique": "Antihistaminique",
-    "musculoptrope": "musculotrope",
-    "musculotrpe": "musculotrope",
-    "anasthésique": "Anesthésique",
-    "anxolytique": "Anxiolytique",
-    "hynotique": "Hypnotique",
-    "hypolémiant": "Hypolipémiant",
-    "neuroleptiaue": "Neuroleptique",
-    "neuroléptique": "Neuroleptique",
-    "corticostroïde": "Corticostéroïde",
-    "glucostéroïdes": "Glucocorticoïdes",
-    "biphosphonate": "Bisphosphonate",
-    "immunosuppreseur": "Immunosuppresseur",
-    "immunosuppreseurs": "Immunosuppresseurs",
-    "antidiabètique": "Antidiabétique",
-    "mycolytique": "Mucolytique",
-    "votamines": "Vitamines",
-    "chelateur": "Chélateur",
-    "hypolipidemiant": "Hypolipémiant",
-    "cytologique": "cytotoxique",
-    "occulaire": "oculaire",
-    "veinotoniqueique": "veinotonique",
-    "duirétique": "diurétique",
-    "complémént": "Complément",
-    "allimentaire": "alimentaire",
-    "hypolémiants": "hypolipémiants",
-    "probiotics": "Probiotiques",
-    "emoliant": "Émollient",
-    "emolients": "Émollients",
-    "analoque": "analogue",
-    "antidiarrheique": "Antidiarrhéique",
-    "acétylchlinestérase": "acétylcholinestérase",
-    "sooscié": "associé",
-    "systèmique": "systémique",
-    "phosphodiésterase": "phosphodiestérase",
-    "eréctile": "érectile",
-    "hypertenseurs": "antihypertenseurs",
-    "facteur xa": "facteur Xa",
-}
-
-# Regex patterns that mark a value as junk (not a real therapeutic class)
-_JUNK_PATTERNS: List[re.Pattern] = [  # type: ignore[type-arg]
-    re.compile(r"^\d{5,}$"),                          # barcodes
-    re.compile(r"^[A-Z]\d{2}[A-Z]{0,2}\d{0,2}$"),    # ATC codes (e.g. A02BC05)
-    re.compile(r"Statut\s*:", re.IGNORECASE),          # "Statut :" appended
-    re.compile(r"\b(?:cpr|caps|pell)\s+\d", re.IGNORECASE),  # dosage forms
-    re.compile(r"\bDIOVAN\b|\bREVATIO\b|\bDEMETRIN\b|\bHYCAMTIN\b"),  # brand names
-    re.compile(r"\bUROMI\b"),                          # product name
-    re.compile(r"^(?:CalmTu|ReConnect|Vitadigest)\b"),  # product descriptions
-    re.compile(r"^Ce complément alimentaire", re.IGNORECASE),
-    re.compile(r"^Agalsidase bêta \(produite", re.IGNORECASE),
-    re.compile(r"est un cytostatique", re.IGNORECASE),
-    re.compile(r"^Traitement des infections suivantes", re.IGNORECASE),
-    re.compile(r"\bATC\s+[A-Z]\d{2}", re.IGNORECASE),  # inline ATC refs
-    re.compile(r"\bliste\s+\d", re.IGNORECASE),        # "liste 2" appended
-    re.compile(r"\bDCI\s*:", re.IGNORECASE),            # DCI refs
-    re.compile(r"^flacon compte goutte", re.IGNORECASE),
-    re.compile(r"^20 ML$", re.IGNORECASE),
-    re.compile(r"^ÉDICAMENTS?\b"),                      # truncated MÉDICAMENTS
-]
-
-# Fragment patterns: values from incorrect splitting that aren't real classes
-_FRAGMENT_PATTERNS: List[re.Pattern] = [  # type: ignore[type-arg]
-    re.compile(r"^(?:cystite|pyélonéphrite|otite moyenne aiguë|pneumonie aiguë communautaire)$", re.IGNORECASE),
-    re.compile(r"^(?:infections de la peau|infections des os|morsures animales)$", re.IGNORECASE),
-    re.compile(r"^(?:abcès dentaire|exacerbations aiguës|sinusite bactérienne)", re.IGNORECASE),
-    re.compile(r"^en particulier (?:ostéomyélite|cellulite)", re.IGNORECASE),
-    re.compile(r"^les enfants", re.IGNORECASE),
-    re.compile(r"ayant un effet bénéfique", re.IGNORECASE),
-    re.compile(r"^(?:CD3\)|CDK6|D3\)|EPA\)|III|dose réduite\))$"),
-    re.compile(r"^(?:alpha|puissant|monovalent|recombinant|sélectif|non fractionnée|non ionique|prolongée\.?)$", re.IGNORECASE),
-    re.compile(r"^(?:apparentés|associations\.?\s*(?:IEC)?|autres combinaisons|incluant les associations)$", re.IGNORECASE),
-    re.compile(r"^(?:de basse osmolarité|des propriétés vasoconstrictrices|à élimination rénale)$", re.IGNORECASE),
-    re.compile(r"^(?:la coqueluche|la diphtérie|la poliomyélite|la vitamine|le sommeil|le reflux)$", re.IGNORECASE),
-    re.compile(r"^de (?:la noradrénaline|l'hypothalamus|Antagoniste|bronchodilatateur)$", re.IGNORECASE),
-    re.compile(r"^(?:des articulations|des tissus mous|des fissures anales|scabicides inclus)$", re.IGNORECASE),
-    re.compile(r"^(?:non stéroïdiens|immunomodulateurs\)|anti-IL-23\)|diurétique \))$", re.IGNORECASE),
-    re.compile(r"^(?:LE REFLUX GASTRO|DES FISSURES ANALES|SCABICIDES INCLUS)", re.IGNORECASE),
-    re.compile(r"^(?:rhCG|rhFSH|rhLH|époétine alfa|époétine bêta|insuline glargine|lixisénatide|somatropine)$", re.IGNORECASE),
-]
-
-# Active ingredients misclassified as therapeutic classes
-_NOT_A_CLASS = {
-    "fer", "iode", "zinc", "sélénium", "lévodopa", "métformine",
-    "repaglinide", "prégabaline", "cyclophosphamide", "follitropine alfa",
-}
-
-
-def _apply_typo_fixes(text: str) -> str:
-    """Apply word-level typo corrections."""
-    lower = text.lower()
-    # Try full-string match first
-    if lower in _TYPO_MAP:
-        return _TYPO_MAP[lower]
-    # Try word-level replacements
-    result = text
-    for typo, fix in _TYPO_MAP.items():
-        pattern = re.compile(re.escape(typo), re.IGNORECASE)
-        if pattern.search(result):
-            result = pattern.sub(fix, result)
-    return result
-
-
-def _is_junk(value: str) -> bool:
-    """Check if a value should be discarded entirely."""
-    stripped = value.strip()
-    if not stripped or len(stripped) < 2:
-        return True
-    if len(stripped) > 120:
-        return True
-    if stripped.lower() in _NOT_A_CLASS:
-        return True
-    for pat in _JUNK_PATTERNS:
-        if pat.search(stripped):
-            return True
-    for pat in _FRAGMENT_PATTERNS:
-        if pat.search(stripped):
-            return True
-    return False
-
-
-def normalize_therapeutic_classes(values: List[str]) -> List[str]:
-    """Normalize a list of therapeutic class strings.
-
-    Applies: junk removal, typo fixes, punctuation cleanup,
-    whitespace normalization, case normalization, deduplication.
-    """
-    result: List[str] = []
-    seen: set = set()
-
-    for raw in values:
-        v = raw.strip()
-        if not v:
-            continue
-
-        # 1. Discard junk
-        if _is_junk(v):
-            continue
-
-        # 2. Fix concatenation errors (missing spaces)
-        v = re.sub(r"([a-zé])([A-Z])", r"\1, \2", v)  # "AntiacideAntiulcéreux"
-        v = re.sub(r"Anti-inAnti-", "Anti-", v)  # stuttered prefix
-
-        # 3. Strip trailing punctuation
-        v = re.sub(r"[.,;:]+\s*$", "", v)
-
-        # 4. Fix double spaces
-        v = re.sub(r"\s{2,}", " ", v).strip()
-
-        # 5. Fix unbalanced parentheses (missing closing)
-        open_count = v.count("(")
-        close_count = v.count(")")
-        if open_count > close_count:
-            v += ")" * (open_count - close_count)
-
-        # 6. Apply typo corrections
-        v = _apply_typo_fixes(v)
-
-        # 7. Fix accents (missing/wrong diacritics)
-        v = _fix_accents(v)
-
-        # 8. Case normalization
-        v = _normalize_case(v)
-
-        # 9. Ensure first letter is uppercase
-        if v and v[0].islower():
-            v = v[0].upper() + v[1:]
-
-        # 10. Second junk check after transformations (e.g. concatenation fixes)
-        if _is_junk(v):
-            continue
-
-        # 11. Deduplicate (case-insensitive, accent-insensitive)
-        key = _tc_strip_accents(v.lower().strip())
-        # Also strip trailing 's' for dedup
-        dedup_key = key.rstrip("s") if len(key) > 3 else key
-        if dedup_key in seen:
-            continue
-        seen.add(dedup_key)
-        seen.add(key)
-
-        if v.strip():
-            result.append(v.strip())
-
-    return result
-
-
-def parse_fr_date(raw: str) -> Optional[str]:
-    # examples: "5 novembre 2024"
-    raw_norm = raw.strip().lower()
-    raw_norm = unicodedata.normalize("NFD", raw_norm)
-    raw_norm = "".join(ch for ch in raw_norm if unicodedata.category(ch) != "Mn")
-    m = re.search(r"(\d{1,2})\s+([a-z]+)\s+(\d{4})", raw_norm)
-    if not m:
-        return None
-    day = int(m.group(1))
-    month = FR_MONTHS.get(m.group(2))
-    year = int(m.group(3))
-    if not month:
-        return None
-    try:
-        return dt.date(year, month, day).isoformat()
-    except ValueError:
-        return None
-
-
 def normalize_header(value: str) -> str:
-    v = value.strip().lower()
-    v = unicodedata.normalize("NFD", v)
-    v = "".join(ch for ch in v if unicodedata.category(ch) != "Mn")
+    v = strip_accents(value.strip().lower())
     v = re.sub(r"\s+", " ", v)
     return v
 
@@ -551,20 +161,24 @@ def write_json(path: Path, payload: Any) -> None:
     tmp.replace(path)
 
 
+# Shared client (http_client.py): pooled connections for the fetch threads,
+# jittered retries honouring Retry-After and a circuit breaker, so a dead
+# medicament.ma fails fast instead of costing retries x timeout per page.
+# HTTP errors are returned, not raised: callers map 4xx to "missing".
+HTTP = HttpClient(
+    headers=HEADERS,
+    timeout=REQUEST_TIMEOUT,
+    retry=RetryPolicy(max_retries=MAX_RETRIES),
+    pool_size=32,
+    raise_for_status=False,
+)
+
+
+MEMORY = MemoryMonitor()
+
+
 def get_with_retry(url: str) -> requests.Response:
-    last_exc: Optional[Exception] = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-            return resp
-        except requests.RequestException as exc:
-            last_exc = exc
-            if attempt >= MAX_RETRIES:
-                break
-            wait = 2 ** (attempt - 1)
-            logger.warning("GET failed (%s) for %s, retry in %ss", exc, url, wait)
-            time.sleep(wait)
-    raise RuntimeError(f"HTTP failure for {url}: {last_exc}")
+    return HTTP.get(url)
 
 
 def parse_sitemap_index() -> List[str]:
@@ -736,11 +350,48 @@ class RateLimiter:
             time.sleep(delay)
 
 
+def parse_medicament_html(
+    slug: str,
+    url: str,
+    html: str,
+    fallback_date: Optional[str] = None,
+) -> Tuple[str, Optional[Dict[str, Any]], str]:
+    """Parse a medicament page. Returns (status, record, message), status in {ok,missing,error}.
+
+    *fallback_date* is used as `updatedAt` when the page has no notice date
+    (defaults to today, i.e. the fetch date for live pages).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    page_title = (soup.title.get_text(strip=True) if soup.title else "").lower()
+
+    if "page non trouv" in page_title or "page non trouv" in soup.get_text(" ", strip=True).lower():
+        return "missing", None, "not found marker"
+
+    root = soup.select_one(".single-medicament")
+    if not root:
+        return "error", None, "missing .single-medicament container"
+
+    title_el = root.select_one("h1.main-title") or root.select_one("h1")
+    if not title_el:
+        return "error", None, "missing title"
+
+    name = re.sub(r"\s+", " ", title_el.get_text(" ", strip=True)).strip()
+    if not name:
+        return "error", None, "empty title"
+
+    details = extract_details_map(root)
+    updated_date, _ = parse_notice_dates(root)
+    record = map_details_to_record(slug, url, name, details, updated_date or fallback_date)
+
+    return "ok", record, ""
+
+
 def fetch_and_parse_medicament(
     entry: SitemapEntry,
     rate_limiter: Optional[RateLimiter] = None,
     request_delay: float = 0.0,
     request_jitter: float = 0.0,
+    snapshots: Optional[SnapshotStore] = None,
 ) -> Tuple[str, str, Optional[Dict[str, Any]], str]:
     """Returns (slug, status, record, message). status in {ok,missing,error}"""
     if rate_limiter is not None:
@@ -755,37 +406,377 @@ def fetch_and_parse_medicament(
     if resp.status_code >= 400:
         return entry.slug, "missing", None, f"http {resp.status_code}"
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    page_title = (soup.title.get_text(strip=True) if soup.title else "").lower()
-
-    if "page non trouv" in page_title or "page non trouv" in soup.get_text(" ", strip=True).lower():
-        return entry.slug, "missing", None, "not found marker"
-
-    root = soup.select_one(".single-medicament")
-    if not root:
-        return entry.slug, "error", None, "missing .single-medicament container"
-
-    title_el = root.select_one("h1.main-title") or root.select_one("h1")
-    if not title_el:
-        return entry.slug, "error", None, "missing title"
+    if snapshots is not None:
+        try:
+            snapshots.put(entry.slug, entry.url, resp.text)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Cannot store HTML snapshot for %s: %s", entry.slug, exc)
 
-    name = re.sub(r"\s+", " ", title_el.get_text(" ", strip=True)).strip()
-    if not name:
-        return entry.slug, "error", None, "empty title"
+    status, record, message = parse_medicament_html(entry.slug, entry.url, resp.text)
+    return entry.slug, status, record, message
 
-    details = extract_details_map(root)
-    updated_date, _ = parse_notice_dates(root)
-    record = map_details_to_record(entry.slug, entry.url, name, details, updated_date)
 
-    return entry.slug, "ok", record, ""
+def _reparse_snapshot(job: Tuple[str, str, str, Optional[str]]) -> Tuple[str, str, Optional[Dict[str, Any]], str]:
+    """Process-pool worker for --reparse: (slug, url, object path, fetch date)."""
+    slug, url, path, fetched_date = job
+    try:
+        html = read_object(Path(path))
+    except Exception as exc:  # noqa: BLE001
+        return slug, "error", None, f"unreadable snapshot: {exc}"
+    try:
+        status, record, message = parse_medicament_html(slug, url, html, fallback_date=fetched_date)
+    except Exception as exc:  # noqa: BLE001
+        return slug, "error", None, f"parse failed: {exc}"
+    return slug, status, record, message
 
 
-def merge_state_entry(prev: Dict[str, Any], **updates: Any) -> Dict[str, Any]:
+def merge_state_entry(prev: Any, **updates: Any) -> Any:
+    if isinstance(prev, StateEntry):
+        return prev.merged(**updates)
     next_entry = dict(prev)
     next_entry.update(updates)
     return next_entry
 
 
+# ---------------------------------------------------------------------------
+# Streaming merge (low-memory mode)
+# ---------------------------------------------------------------------------
+# Records never accumulate: existing ones are re-read from the file, fetched
+# ones go to sorted spill runs (`SortedRuns`) and next state entries to a
+# spill file (`StateSpill`). What stays resident grows with the number of
+# slugs, not with record size: the sitemap entries, a row count per
+# existing slug, slug sets, and a `StateEntry` per slug whose next entry is
+# not known yet.
+
+_UNSET = object()
+
+
+class StateEntry:
+    """Compact per-slug state record used by the streaming merge.
+
+    Same fields as the dicts stored under `records` in the state file, but
+    with `__slots__` instead of a per-entry hash table. Unknown keys are kept
+    in `extra` so a round-trip never loses data.
+    """
+
+    FIELDS = (
+        "url", "lastmod", "status", "missingStreak", "absentStreak",
+        "lastSeenAt", "lastFetchedAt", "lastMessage",
+    )
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, **values: Any):
+        for name in self.FIELDS:
+            setattr(self, name, values.pop(name, _UNSET))
+        self.extra = values or None
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "StateEntry":
+        return cls(**payload)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is _UNSET else value
+        return (self.extra or {}).get(key, default)
+
+    def merged(self, **updates: Any) -> "StateEntry":
+        values = self.to_dict()
+        values.update(updates)
+        return StateEntry(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = dict(self.extra or {})
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not _UNSET:
+                out[name] = value
+        return out
+
+
+class _JsonReader:
+    """Decode one JSON document value by value from a sliding text buffer
+    (`json.JSONDecoder.raw_decode`), for when ijson is not installed."""
+
+    _SPACE = " \t\r\n"
+
+    def __init__(self, fh: Any, chunk_size: int):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = fh.read(chunk_size)
+        self.pos = 0
+        self.eof = not self.buf
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fh.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self, skip: str = _SPACE) -> str:
+        """Next character after any of *skip* ("" at the end of the file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos} of {self.fh.name}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                item, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number running into the end of the buffer may be cut short
+            if (
+                isinstance(item, (int, float)) and not isinstance(item, bool)
+                and not self.buf[end:].strip("0123456789.eE+-") and self._fill()
+            ):
+                continue
+            self.pos = end
+            if self.pos > self.chunk_size:
+                self.buf = self.buf[self.pos:]
+                self.pos = 0
+            return item
+
+
+def iter_json_array(path: Path, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yield the items of a top-level JSON array without loading the file.
+
+    Uses ijson when installed; otherwise decodes items one by one with
+    `_JsonReader`.
+    """
+    if not path.exists():
+        return
+    try:
+        import ijson  # type: ignore[import-not-found]
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with path.open("rb") as fh:
+            yield from ijson.items(fh, "item", use_float=True)
+        return
+
+    with path.open("r", encoding="utf-8") as fh:
+        reader = _JsonReader(fh, chunk_size)
+        if reader.peek() != "[":
+            raise ValueError(f"{path} is not a JSON array")
+        reader.expect("[")
+        while reader.peek(_JsonReader._SPACE + ",") not in ("]", ""):
+            yield reader.value()
+
+
+def iter_json_items(path: Path, field: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+    """Yield the (key, value) pairs of the object under the top-level
+    *field* of a JSON object file, one pair in memory at a time.
+
+    Uses ijson when installed; otherwise `_JsonReader`, decoding the other
+    top-level values whole.
+    """
+    if not path.exists():
+        return
+    try:
+        import ijson  # type: ignore[import-not-found]
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with path.open("rb") as fh:
+            yield from ijson.kvitems(fh, field, use_float=True)
+        return
+
+    separators = _JsonReader._SPACE + ","
+    with path.open("r", encoding="utf-8") as fh:
+        reader = _JsonReader(fh, chunk_size)
+        if reader.peek() != "{":
+            raise ValueError(f"{path} is not a JSON object")
+        reader.expect("{")
+        while reader.peek(separators) not in ("}", ""):
+            key = reader.value()
+            reader.expect(":")
+            if key != field or reader.peek() != "{":
+                reader.value()
+                continue
+            reader.expect("{")
+            while reader.peek(separators) not in ("}", ""):
+                item_key = reader.value()
+                reader.expect(":")
+                yield item_key, reader.value()
+            return
+
+
+def scan_existing_slugs(path: Path) -> Tuple[Dict[str, int], int]:
+    """First streaming pass: row count per slug, and total row count."""
+    counts: Dict[str, int] = {}
+    total = 0
+    for item in iter_json_array(path):
+        total += 1
+        if not isinstance(item, dict):
+            continue
+        slug = item.get("id")
+        if slug:
+            counts[str(slug)] = counts.get(str(slug), 0) + 1
+    return counts, total
+
+
+def load_state_entries(path: Path) -> Dict[str, StateEntry]:
+    """The state file's `records` as `StateEntry` objects, read entry by
+    entry (`iter_json_items`)."""
+    entries: Dict[str, StateEntry] = {}
+    try:
+        for slug, value in iter_json_items(path, "records"):
+            if isinstance(value, dict):
+                entries[slug] = StateEntry.from_dict(value)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Failed to read %s: %s", path, exc)
+        return {}
+    return entries
+
+
+def output_sort_key(record: Dict[str, Any]) -> Tuple[str, str]:
+    return (str(record.get("name", "")).lower(), str(record.get("id", "")).lower())
+
+
+class SortedRuns:
+    """Records sorted by `output_sort_key` with at most *run_size* in memory.
+
+    Added records are buffered; full buffers are sorted and spilled to
+    temporary NDJSON files, which `merged()` lazily k-way merges. Ties keep
+    the order records were added in.
+    """
+
+    def __init__(self, run_size: int = 5000):
+        self.run_size = run_size
+        self._runs: List[Any] = []
+        self._buf: List[Dict[str, Any]] = []
+
+    def add(self, item: Dict[str, Any]) -> None:
+        self._buf.append(item)
+        if len(self._buf) >= self.run_size:
+            self._spill()
+
+    def extend(self, items: Iterable[Dict[str, Any]]) -> None:
+        for item in items:
+            self.add(item)
+
+    def _spill(self) -> None:
+        self._buf.sort(key=output_sort_key)
+        fh = tempfile.TemporaryFile("w+", encoding="utf-8")
+        for rec in self._buf:
+            fh.write(json.dumps(rec, ensure_ascii=False))
+            fh.write("\n")
+        fh.seek(0)
+        self._runs.append(fh)
+        self._buf.clear()
+
+    def merged(self) -> Iterator[Dict[str, Any]]:
+        if not self._runs:
+            self._buf.sort(key=output_sort_key)
+            yield from self._buf
+            return
+        if self._buf:
+            self._spill()
+
+        def read_run(fh: Any) -> Iterator[Dict[str, Any]]:
+            with fh:
+                for line in fh:
+                    yield json.loads(line)
+
+        yield from heapq.merge(*(read_run(fh) for fh in self._runs), key=output_sort_key)
+
+
+class StateSpill:
+    """Slug -> state entry map for the streaming merge that does not keep
+    the entries: each one is appended to a temporary NDJSON file when it is
+    set, and `items()` reads them back in that order. Only the slugs stay
+    in memory; every slug is set once per run.
+    """
+
+    def __init__(self) -> None:
+        self._fh = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._slugs: Set[str] = set()
+
+    def __setitem__(self, slug: str, entry: Any) -> None:
+        payload = entry.to_dict() if isinstance(entry, StateEntry) else entry
+        self._fh.write(json.dumps([slug, payload], ensure_ascii=False))
+        self._fh.write("\n")
+        self._slugs.add(slug)
+
+    def __contains__(self, slug: object) -> bool:
+        return slug in self._slugs
+
+    def __len__(self) -> int:
+        return len(self._slugs)
+
+    def keys(self) -> Set[str]:
+        return self._slugs
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self._fh.flush()
+        self._fh.seek(0)
+        for line in self._fh:
+            slug, payload = json.loads(line)
+            yield slug, payload
+        self._fh.seek(0, os.SEEK_END)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def write_json_stream(path: Path, items: Iterable[Any]) -> int:
+    """Write *items* as a JSON array byte-identical to `write_json` output.
+
+    Writes to `<path>.tmp` and returns the item count; the caller decides
+    whether to publish it with `Path.replace`.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    count = 0
+    with tmp.open("w", encoding="utf-8") as fh:
+        for item in items:
+            fh.write("[\n" if count == 0 else ",\n")
+            body = json.dumps(item, ensure_ascii=False, indent=2)
+            fh.write("  " + body.replace("\n", "\n  "))
+            count += 1
+        fh.write("\n]" if count else "[]")
+    return count
+
+
+def write_state_stream(path: Path, header: Dict[str, Any], entries: Iterable[Tuple[str, Any]]) -> None:
+    """Write the state file with `records` serialised entry by entry."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    head = json.dumps(header, ensure_ascii=False, indent=2)
+    with tmp.open("w", encoding="utf-8") as fh:
+        fh.write(head[:-2] + ',\n  "records": {' if header else '{\n  "records": {')
+        first = True
+        for slug, entry in entries:
+            payload = entry.to_dict() if isinstance(entry, StateEntry) else entry
+            body = json.dumps(payload, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+            fh.write("\n    " if first else ",\n    ")
+            fh.write(f"{json.dumps(slug, ensure_ascii=False)}: {body}")
+            first = False
+        fh.write("}\n}" if first else "\n  }\n}")
+    tmp.replace(path)
+
+
 def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Incremental daily updater for medicament dataset")
     parser.add_argument("--full-refresh", action="store_true", help="Ignore cache hints and re-fetch all discovered URLs")
@@ -810,6 +801,58 @@ def build_arg_parser() -> argparse.ArgumentParser:
         default=int(os.getenv("MEDICAMENT_CONCURRENCY", str(DEFAULT_CONCURRENCY))),
         help="Number of parallel fetch workers (default from MEDICAMENT_CONCURRENCY or 1)",
     )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        default=os.getenv("MEDICAMENT_STREAMING", "").lower() in ("1", "true", "yes"),
+        help="Low-memory merge: stream existing records, spill fetched records and state entries to "
+             "temporary files and write a sorted merge; only per-slug keys and compact state "
+             "entries stay in memory (default from MEDICAMENT_STREAMING)",
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="Rebuild records from the HTML snapshot store (no network), then regenerate derived files",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Parser processes for --reparse (default: CPU count)",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        type=Path,
+        default=Path(os.getenv("MEDICAMENT_SNAPSHOT_DIR", str(SNAPSHOT_DIR))),
+        help="HTML snapshot store (default from MEDICAMENT_SNAPSHOT_DIR or .cache/medicament_html)",
+    )
+    parser.add_argument("--no-snapshots", action="store_true", help="Do not store fetched HTML pages")
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=int(os.getenv("MEDICAMENT_KEEP_VERSIONS", str(DEFAULT_KEEP))),
+        help=f"Dataset versions listed in {VERSIONS_DIR.name}/index.json, with JSON Patch deltas between them "
+             f"(default from MEDICAMENT_KEEP_VERSIONS or {DEFAULT_KEEP}, 0 = do not publish versions)",
+    )
+    parser.add_argument("--skip-dedup", action="store_true", help=f"Do not regenerate {DUPLICATES_JSON.name}")
+    parser.add_argument("--skip-facets", action="store_true", help=f"Do not regenerate {FACETS_JSON.name}")
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Append NDJSON trace spans (stages and HTTP requests) to this file (default from TRACE_FILE)",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Log peak RSS and the top tracemalloc allocators of every stage (slower)",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=float,
+        default=env_float("MEDICAMENT_MAX_RSS_MB", 0.0),
+        help="RSS budget in MB: switch to --streaming when the dataset would not fit, stop before "
+             "writing when it is exceeded (default from MEDICAMENT_MAX_RSS_MB, 0 = none)",
+    )
     parser.add_argument("--verbose", action="store_true", help="Verbose logs")
     return parser
 
@@ -817,7 +860,39 @@ def build_arg_parser() -> argparse.ArgumentParser:
 def main() -> int:
     args = build_arg_parser().parse_args()
     configure_logging(args.verbose)
-
+    tracing.configure(args.trace)
+    MEMORY.start(report=args.memory_report, max_rss_mb=args.max_rss)
+    try:
+        with tracing.span("medicaments_updater", reparse=args.reparse, dry_run=args.dry_run) as span:
+            try:
+                code = run_update(args)
+            except MemoryBudgetExceeded as exc:
+                logger.error("Stopped: %s. No file was written.", exc)
+                code = 3
+            if span is not None:
+                span.set(exit_code=code)
+            return code
+    finally:
+        MEMORY.stop()
+        if MEMORY.report or MEMORY.max_rss_mb:
+            MEMORY.log_report(logger)
+        tracing.close()
+
+
+def stage(name: str, **attributes: Any) -> None:
+    """Start a pipeline stage: a trace span (tracing.py) and a memory phase."""
+    tracing.stage(name, **attributes)
+    MEMORY.phase(name)
+
+
+DerivedOutputs = Callable[[argparse.Namespace, Callable[[], Iterable[Dict[str, Any]]]], None]
+
+
+def run_update(args: argparse.Namespace, derived: Optional[DerivedOutputs] = None) -> int:
+    """Run the update (or --reparse); once the dataset is written, *derived*
+    (default `write_derived_outputs`) gets the records. medicament_pipeline.py
+    passes its own to build every derived file from the records in memory."""
+    derived = derived or write_derived_outputs
     if args.request_delay < 0 or args.request_jitter < 0:
         logger.error("--request-delay and --request-jitter must be >= 0")
         return 1
@@ -833,31 +908,76 @@ def main() -> int:
         logger.warning("--limit was provided without --dry-run. For safety, dry-run mode is enabled.")
         args.dry_run = True
 
-    existing_records: List[Dict[str, Any]] = read_json(OUTPUT_JSON, fallback=[])
-    if not isinstance(existing_records, list):
-        logger.error("Invalid format for %s (expected list)", OUTPUT_JSON)
-        return 1
+    if args.reparse:
+        return run_reparse(args, derived)
 
-    existing_rows_by_slug: Dict[str, List[Dict[str, Any]]] = {}
-    for item in existing_records:
-        if not isinstance(item, dict):
-            continue
-        slug = item.get("id")
-        if not slug:
-            continue
-        existing_rows_by_slug.setdefault(str(slug), []).append(item)
+    if not args.streaming and MEMORY.max_rss_mb:
+        dataset_mb = sum(path.stat().st_size for path in (OUTPUT_JSON, STATE_JSON) if path.exists()) / 2**20
+        if MEMORY.would_exceed(dataset_mb * IN_MEMORY_RSS_FACTOR):
+            logger.warning(
+                "Dataset (%.0f MB of JSON) would not fit the %.0f MB RSS budget in memory: streaming merge enabled",
+                dataset_mb,
+                MEMORY.max_rss_mb,
+            )
+            args.streaming = True
+            MEMORY.note("streaming")
 
-    def existing_first(slug: str) -> Optional[Dict[str, Any]]:
-        rows = existing_rows_by_slug.get(slug, [])
-        return rows[0] if rows else None
+    stage("load existing", streaming=args.streaming)
+    snapshots: Optional[SnapshotStore] = None
+    if not args.no_snapshots:
+        snapshots = SnapshotStore(args.snapshot_dir)
+        logger.info("HTML snapshot store: %s (%d slugs)", args.snapshot_dir, len(snapshots))
 
-    state_payload = read_json(STATE_JSON, fallback={})
-    state_records: Dict[str, Dict[str, Any]] = {}
-    if isinstance(state_payload, dict):
-        recs = state_payload.get("records", {})
-        if isinstance(recs, dict):
-            state_records = {k: v for k, v in recs.items() if isinstance(v, dict)}
+    existing_rows_by_slug: Dict[str, List[Dict[str, Any]]] = {}
+    # Streaming mode keeps only row counts per slug; records are re-read
+    # lazily from OUTPUT_JSON when the output is written, fetched records
+    # go to sorted spill runs and next state entries to a spill file.
+    existing_slug_rows: Dict[str, int] = {}
+    kept_existing: Set[str] = set()
+    state_records: Dict[str, Any] = {}
+
+    if args.streaming:
+        logger.info("Streaming merge enabled")
+        try:
+            existing_slug_rows, prev_count = scan_existing_slugs(OUTPUT_JSON)
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Invalid format for %s: %s", OUTPUT_JSON, exc)
+            return 1
+        state_records = load_state_entries(STATE_JSON)
+        empty_state: Any = StateEntry()
+    else:
+        existing_records: List[Dict[str, Any]] = read_json(OUTPUT_JSON, fallback=[])
+        if not isinstance(existing_records, list):
+            logger.error("Invalid format for %s (expected list)", OUTPUT_JSON)
+            return 1
+        prev_count = len(existing_records)
+
+        for item in existing_records:
+            if not isinstance(item, dict):
+                continue
+            slug = item.get("id")
+            if not slug:
+                continue
+            existing_rows_by_slug.setdefault(str(slug), []).append(item)
+            existing_slug_rows[str(slug)] = existing_slug_rows.get(str(slug), 0) + 1
+
+        state_payload = read_json(STATE_JSON, fallback={})
+        if isinstance(state_payload, dict):
+            recs = state_payload.get("records", {})
+            if isinstance(recs, dict):
+                state_records = {k: v for k, v in recs.items() if isinstance(v, dict)}
+        empty_state = {}
+
+    def has_existing(slug: str) -> bool:
+        return slug in existing_slug_rows
+
+    def keep_existing(slug: str) -> None:
+        if args.streaming:
+            kept_existing.add(slug)
+        else:
+            next_records[slug] = existing_rows_by_slug[slug][0]
 
+    stage("sitemaps")
     try:
         sitemap_urls = parse_sitemap_index()
     except Exception as exc:  # noqa: BLE001
@@ -872,6 +992,7 @@ def main() -> int:
         except Exception as exc:  # noqa: BLE001
             logger.warning("Failed to parse sitemap %s: %s", sitemap_url, exc)
 
+    stage("plan", sitemap_entries=len(all_entries))
     # dedupe by slug, keep latest lastmod available
     dedup: Dict[str, SitemapEntry] = {}
     for entry in all_entries:
@@ -896,7 +1017,9 @@ def main() -> int:
         logger.info("No state file detected: bootstrap mode enabled (reusing existing local records when possible)")
 
     next_records: Dict[str, Dict[str, Any]] = {}
-    next_state_records: Dict[str, Dict[str, Any]] = {}
+    next_state_records: Any = StateSpill() if args.streaming else {}
+    sorted_runs = SortedRuns()
+    fetched_slugs: Set[str] = set()
 
     discovered_slugs = {entry.slug for entry in discovered}
 
@@ -904,15 +1027,15 @@ def main() -> int:
     reused_count = 0
 
     for entry in discovered:
-        prev_state = state_records.get(entry.slug, {})
-        existing = existing_first(entry.slug)
+        prev_state = state_records.get(entry.slug, empty_state)
+        existing = has_existing(entry.slug)
 
         should_fetch = args.full_refresh
 
         if not should_fetch:
-            if bootstrap_mode and existing is not None:
+            if bootstrap_mode and existing:
                 should_fetch = False
-            elif existing is None:
+            elif not existing:
                 should_fetch = True
             elif prev_state.get("lastmod") != entry.lastmod:
                 should_fetch = True
@@ -925,21 +1048,25 @@ def main() -> int:
             to_fetch.append(entry)
             continue
 
-        if existing is not None:
-            next_records[entry.slug] = existing
+        if existing:
+            keep_existing(entry.slug)
             reused_count += 1
 
         next_state_records[entry.slug] = merge_state_entry(
             prev_state,
             url=entry.url,
             lastmod=entry.lastmod,
-            status="ok" if existing is not None else prev_state.get("status", "unknown"),
+            status="ok" if existing else prev_state.get("status", "unknown"),
             lastSeenAt=now_iso(),
             missingStreak=int(prev_state.get("missingStreak", 0) or 0),
             absentStreak=0,
         )
+        # Each slug's state is held once: the previous entry goes when the
+        # next one exists
+        state_records.pop(entry.slug, None)
 
     logger.info("Reused %d unchanged records, fetching %d records", reused_count, len(to_fetch))
+    stage("fetch", reused=reused_count, to_fetch=len(to_fetch), concurrency=max(1, args.concurrency))
 
     fetched_ok = 0
     fetched_missing = 0
@@ -950,11 +1077,16 @@ def main() -> int:
         record: Optional[Dict[str, Any]], message: str,
     ) -> None:
         nonlocal fetched_ok, fetched_missing, fetched_error
-        prev_state = state_records.get(slug, {})
-        existing = existing_first(slug)
+        MEMORY.check()
+        prev_state = state_records.pop(slug, empty_state)
+        existing = has_existing(slug)
 
         if status == "ok" and record is not None:
-            next_records[slug] = record
+            if args.streaming:
+                sorted_runs.add(record)
+                fetched_slugs.add(slug)
+            else:
+                next_records[slug] = record
             fetched_ok += 1
             next_state_records[slug] = merge_state_entry(
                 prev_state,
@@ -970,10 +1102,8 @@ def main() -> int:
         elif status == "missing":
             fetched_missing += 1
             missing_streak = int(prev_state.get("missingStreak", 0) or 0) + 1
-            keep_existing = (existing is not None) and (missing_streak < MISSING_GRACE_RUNS)
-
-            if keep_existing:
-                next_records[slug] = existing
+            if existing and missing_streak < MISSING_GRACE_RUNS:
+                keep_existing(slug)
 
             next_state_records[slug] = merge_state_entry(
                 prev_state,
@@ -988,8 +1118,8 @@ def main() -> int:
             )
         else:
             fetched_error += 1
-            if existing is not None:
-                next_records[slug] = existing
+            if existing:
+                keep_existing(slug)
 
             next_state_records[slug] = merge_state_entry(
                 prev_state,
@@ -1009,7 +1139,7 @@ def main() -> int:
         # Sequential mode (backward compatible)
         for idx, entry in enumerate(to_fetch, start=1):
             slug, status, record, message = fetch_and_parse_medicament(
-                entry, rate_limiter=rate_limiter,
+                entry, rate_limiter=rate_limiter, snapshots=snapshots,
             )
             _process_fetch_result(entry, slug, status, record, message)
             if idx % 100 == 0:
@@ -1020,41 +1150,65 @@ def main() -> int:
         logger.info("Parallel fetching enabled: %d workers", concurrency)
         done_count = 0
         with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # Workers run in a copy of this context, so their request spans nest under the stage
             future_to_entry = {
-                pool.submit(fetch_and_parse_medicament, entry, rate_limiter=rate_limiter): entry
+                pool.submit(
+                    contextvars.copy_context().run,
+                    fetch_and_parse_medicament, entry, rate_limiter=rate_limiter, snapshots=snapshots,
+                ): entry
                 for entry in to_fetch
             }
-            for future in concurrent.futures.as_completed(future_to_entry):
-                entry = future_to_entry[future]
-                try:
-                    slug, status, record, message = future.result()
-                except Exception as exc:  # noqa: BLE001
-                    slug, status, record, message = entry.slug, "error", None, f"thread error: {exc}"
-                _process_fetch_result(entry, slug, status, record, message)
-                done_count += 1
-                if done_count % 100 == 0:
-                    logger.info("Progress: fetched %d/%d", done_count, len(to_fetch))
+            try:
+                for future in concurrent.futures.as_completed(future_to_entry):
+                    entry = future_to_entry[future]
+                    try:
+                        slug, status, record, message = future.result()
+                    except Exception as exc:  # noqa: BLE001
+                        slug, status, record, message = entry.slug, "error", None, f"thread error: {exc}"
+                    _process_fetch_result(entry, slug, status, record, message)
+                    done_count += 1
+                    if done_count % 100 == 0:
+                        logger.info("Progress: fetched %d/%d", done_count, len(to_fetch))
+            except MemoryBudgetExceeded:
+                # Do not fetch the queued pages on the way out
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    HTTP.log_stats(logger)
+
+    if snapshots is not None:
+        try:
+            snapshots.save()
+            logger.info("Snapshots: %d pages stored, %d deduplicated", snapshots.stored, snapshots.deduplicated)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Cannot save snapshot index: %s", exc)
 
+    stage("merge", fetched_ok=fetched_ok, fetched_missing=fetched_missing, fetched_error=fetched_error)
     # Handle records no longer present in sitemap (temporary sitemap/API issues)
     retained_absent = 0
     retained_duplicate_rows = 0
     preserved_rows: List[Dict[str, Any]] = []
+    absent_kept: Set[str] = set()
 
-    for slug, rows in existing_rows_by_slug.items():
-        if slug in next_records:
+    for slug, row_count in existing_slug_rows.items():
+        if slug in next_records or slug in kept_existing or slug in fetched_slugs:
             # Keep historical duplicate rows untouched to avoid accidental collapse.
-            if len(rows) > 1:
-                preserved_rows.extend(rows[1:])
-                retained_duplicate_rows += len(rows) - 1
+            if row_count > 1:
+                if not args.streaming:
+                    preserved_rows.extend(existing_rows_by_slug[slug][1:])
+                retained_duplicate_rows += row_count - 1
             continue
         if slug in discovered_slugs:
             continue
 
-        prev_state = state_records.get(slug, {})
+        prev_state = state_records.pop(slug, empty_state)
         absent_streak = int(prev_state.get("absentStreak", 0) or 0) + 1
         if absent_streak < ABSENT_GRACE_RUNS:
-            preserved_rows.extend(rows)
-            retained_absent += len(rows)
+            if args.streaming:
+                absent_kept.add(slug)
+            else:
+                preserved_rows.extend(existing_rows_by_slug[slug])
+            retained_absent += row_count
 
         next_state_records[slug] = merge_state_entry(
             prev_state,
@@ -1064,11 +1218,42 @@ def main() -> int:
             lastFetchedAt=prev_state.get("lastFetchedAt"),
         )
 
-    output_records = list(next_records.values()) + preserved_rows
-    output_records.sort(key=lambda x: (str(x.get("name", "")).lower(), str(x.get("id", "")).lower()))
+    if args.streaming:
+        del existing_slug_rows
+        state_records.clear()
+        output_records: List[Dict[str, Any]] = []
+
+        def merged_rows() -> Iterator[Dict[str, Any]]:
+            # Existing rows in file order: the first row of a reused slug is
+            # kept, later rows are preserved duplicates; fetched records
+            # (already in the sorted runs, so they sort first on ties, as
+            # in memory) replace the first row of their slug.
+            seen: Set[str] = set()
+            for item in iter_json_array(OUTPUT_JSON):
+                if not isinstance(item, dict) or not item.get("id"):
+                    continue
+                slug = str(item["id"])
+                if slug in absent_kept:
+                    yield item
+                    continue
+                if slug not in kept_existing and slug not in fetched_slugs:
+                    continue
+                if slug in seen:
+                    yield item
+                    continue
+                seen.add(slug)
+                if slug in kept_existing:
+                    yield item
+
+        sorted_runs.extend(merged_rows())
+        new_count = write_json_stream(OUTPUT_JSON, sorted_runs.merged())
+        pending_output = OUTPUT_JSON.with_suffix(OUTPUT_JSON.suffix + ".tmp")
+    else:
+        output_records = list(next_records.values()) + preserved_rows
+        output_records.sort(key=output_sort_key)
+        new_count = len(output_records)
+        pending_output = None
 
-    prev_count = len(existing_records)
-    new_count = len(output_records)
     delta = new_count - prev_count
 
     logger.info(
@@ -1084,6 +1269,13 @@ def main() -> int:
     if retained_duplicate_rows:
         logger.info("Preserved %d duplicate legacy rows", retained_duplicate_rows)
 
+    try:
+        MEMORY.check()
+    except MemoryBudgetExceeded:
+        if pending_output is not None:
+            pending_output.unlink(missing_ok=True)
+        raise
+
     # Drop guard to avoid publishing broken scrapes
     if prev_count > 0:
         drop_ratio = (prev_count - new_count) / prev_count
@@ -1094,13 +1286,22 @@ def main() -> int:
                 drop_ratio * 100,
                 DROP_GUARD_RATIO * 100,
             )
+            if pending_output is not None:
+                pending_output.unlink(missing_ok=True)
             return 2
 
     if args.dry_run:
+        if pending_output is not None:
+            pending_output.unlink(missing_ok=True)
         logger.info("Dry-run: no files were written.")
         return 0
 
-    write_json(OUTPUT_JSON, output_records)
+    stage("write", records=new_count)
+    previous = snapshot_previous(OUTPUT_JSON) if args.keep_versions > 0 else None
+    if pending_output is not None:
+        pending_output.replace(OUTPUT_JSON)
+    else:
+        write_json(OUTPUT_JSON, output_records)
 
     state_payload_out = {
         "source": SITEMAP_INDEX_URL,
@@ -1120,11 +1321,198 @@ def main() -> int:
             "fetchedError": fetched_error,
             "retainedAbsent": retained_absent,
         },
-        "records": next_state_records,
+        "memory": MEMORY.summary(camel_case=True),
     }
-    write_json(STATE_JSON, state_payload_out)
+    if args.streaming:
+        write_state_stream(STATE_JSON, state_payload_out, next_state_records.items())
+        next_state_records.close()
+    else:
+        state_payload_out["records"] = next_state_records
+        write_json(STATE_JSON, state_payload_out)
 
     logger.info("Wrote %s and %s", OUTPUT_JSON.relative_to(ROOT_DIR), STATE_JSON.relative_to(ROOT_DIR))
+
+    if snapshots is not None:
+        try:
+            forgotten = snapshots.retain(next_state_records.keys())
+            snapshots.save()
+            pruned = snapshots.prune()
+            if forgotten or pruned:
+                logger.info("Snapshots: forgot %d slugs, pruned %d objects", forgotten, pruned)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Snapshot cleanup failed: %s", exc)
+
+    if args.keep_versions > 0:
+        stage("versions")
+        publish_dataset_version(args, previous)
+
+    stage("derived outputs")
+    derived(
+        args,
+        (lambda: iter_json_array(OUTPUT_JSON)) if args.streaming else (lambda: output_records),
+    )
+    return 0
+
+
+def publish_dataset_version(args: argparse.Namespace, previous: Optional[Path]) -> None:
+    """Publish the written dataset as a new version, with a JSON Patch delta
+    from *previous* (its content before the write; see medicament_versions.py)."""
+    versions_dir = OUTPUT_JSON.parent / VERSIONS_DIR.name
+    try:
+        entry = publish_version(previous, OUTPUT_JSON, versions_dir, keep=args.keep_versions, read=iter_json_array)
+        if entry is None:
+            logger.info("Versions: dataset unchanged")
+        elif "delta" in entry:
+            delta = entry["delta"]
+            logger.info("Published dataset version %d: delta %.1f KB (+%d ~%d -%d)", entry["version"],
+                        delta["bytes"] / 1024, delta["adds"], delta["updates"], delta["deletes"])
+        else:
+            logger.info("Published dataset version %d (new version chain, no delta)", entry["version"])
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Publishing the dataset version failed: %s", exc)
+    finally:
+        if previous is not None:
+            previous.unlink(missing_ok=True)
+
+
+def write_derived_outputs(args: argparse.Namespace, records: Callable[[], Iterable[Dict[str, Any]]]) -> None:
+    """Regenerate the duplicates report and facet index from the written dataset.
+
+    *records* is called once per output so streaming runs can re-read the file.
+    """
+    if not args.skip_dedup:
+        try:
+            with tracing.span("duplicates report"):
+                report = write_duplicates_report(records())
+            logger.info(
+                "Wrote %s (%d clusters, %d duplicate rows)",
+                DUPLICATES_JSON.relative_to(ROOT_DIR),
+                report["clusterCount"],
+                report["duplicateRecords"],
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Duplicate detection failed: %s", exc)
+
+    if not args.skip_facets:
+        try:
+            with tracing.span("facets"):
+                facets = write_facets(records())
+            logger.info(
+                "Wrote %s (%s)",
+                FACETS_JSON.relative_to(ROOT_DIR),
+                ", ".join(f"{name}={len(values)}" for name, values in facets["facets"].items()),
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Facet indexing failed: %s", exc)
+
+
+def run_reparse(args: argparse.Namespace, derived: DerivedOutputs) -> int:
+    """Rebuild existing records from stored HTML, without any network access.
+
+    Only slugs present in both the dataset and the snapshot store are
+    re-parsed; a record is replaced only when its page still parses as "ok",
+    so the dataset never shrinks. The state file is left untouched.
+    """
+    stage("load existing")
+    existing_records = read_json(OUTPUT_JSON, fallback=[])
+    if not isinstance(existing_records, list):
+        logger.error("Invalid format for %s (expected list)", OUTPUT_JSON)
+        return 1
+
+    snapshots = SnapshotStore(args.snapshot_dir)
+    if not len(snapshots):
+        logger.error("Snapshot store %s is empty: run the updater (or --full-refresh) first", args.snapshot_dir)
+        return 1
+
+    jobs: List[Tuple[str, str, str, Optional[str]]] = []
+    seen: Set[str] = set()
+    for item in existing_records:
+        slug = str(item.get("id", "")) if isinstance(item, dict) else ""
+        if not slug or slug in seen:
+            continue
+        seen.add(slug)
+        path = snapshots.path_for(slug)
+        if path is None:
+            continue
+        entry = snapshots.entries[slug]
+        fetched_date = str(entry.get("fetchedAt") or "")[:10] or None
+        jobs.append((slug, str(entry.get("url") or f"{BASE_URL}/medicament/{slug}/"), str(path), fetched_date))
+
+    if args.limit and args.limit > 0:
+        jobs = jobs[: args.limit]
+
+    workers = max(1, args.workers)
+    logger.info(
+        "Reparse: %d/%d records have a snapshot, parsing with %d workers",
+        len(jobs),
+        len(seen),
+        workers,
+    )
+
+    stage("reparse", jobs=len(jobs), workers=workers)
+    reparsed: Dict[str, Dict[str, Any]] = {}
+    failed: Dict[str, int] = {"missing": 0, "error": 0}
+    started = time.monotonic()
+    if workers == 1:
+        results: Iterable[Tuple[str, str, Optional[Dict[str, Any]], str]] = map(_reparse_snapshot, jobs)
+        pool = None
+    else:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_reparse_snapshot, jobs, chunksize=32)
+    try:
+        for idx, (slug, status, record, message) in enumerate(results, start=1):
+            if status == "ok" and record is not None:
+                reparsed[slug] = record
+            else:
+                failed[status] = failed.get(status, 0) + 1
+                logger.debug("Reparse %s: %s (%s), keeping existing record", slug, status, message)
+            if idx % 1000 == 0:
+                logger.info("Progress: reparsed %d/%d", idx, len(jobs))
+                MEMORY.check()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    changed = 0
+    output_records: List[Dict[str, Any]] = []
+    replaced: Set[str] = set()
+    for item in existing_records:
+        slug = str(item.get("id", "")) if isinstance(item, dict) else ""
+        record = reparsed.get(slug)
+        # Only the first row of a slug is replaced, as in a normal fetch
+        if record is not None and slug not in replaced:
+            replaced.add(slug)
+            if record != item:
+                changed += 1
+            output_records.append(record)
+        else:
+            output_records.append(item)
+    output_records.sort(key=output_sort_key)
+
+    logger.info(
+        "Reparse summary: %d parsed in %.1fs, %d changed | kept existing: missing=%d error=%d no-snapshot=%d",
+        len(reparsed),
+        time.monotonic() - started,
+        changed,
+        failed.get("missing", 0),
+        failed.get("error", 0),
+        len(seen) - len(jobs),
+    )
+
+    if args.dry_run:
+        logger.info("Dry-run: no files were written.")
+        return 0
+
+    MEMORY.check()
+    stage("write", records=len(output_records), changed=changed)
+    previous = snapshot_previous(OUTPUT_JSON) if args.keep_versions > 0 else None
+    write_json(OUTPUT_JSON, output_records)
+    logger.info("Wrote %s", OUTPUT_JSON.relative_to(ROOT_DIR))
+    if args.keep_versions > 0:
+        stage("versions")
+        publish_dataset_version(args, previous)
+    stage("derived outputs")
+    derived(args, lambda: output_records)
     return 0
 
 
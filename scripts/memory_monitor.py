@@ -0,0 +1,281 @@
+"""Per-phase memory report and RSS budget of a scraper run.
+
+`MemoryMonitor` follows a run through its phases (the pipeline stages of
+medicaments_updater.py and pharmacies_scraper.py):
+
+- each phase gets its RSS at start and end and its peak RSS: exact on
+  Linux, where the kernel's high-water mark (VmHWM) is reset at every
+  phase start, otherwise the highest of a sampler thread's readings
+  (every `interval` seconds). The sampler also watches the budget;
+- with `report=True`, tracemalloc runs too: each phase gets its peak of
+  Python allocations and its top allocators (source lines that grew the
+  most over the phase). tracemalloc slows allocation-heavy code down
+  noticeably and its snapshots add to the RSS, so this is for
+  investigations, not every run;
+- with `max_rss_mb`, `check()` raises `MemoryBudgetExceeded` once a sample
+  went over the budget. The scripts call it in their long loops and right
+  before they write, and stop without writing anything — a clean failure
+  instead of the runner's OOM killer. `would_exceed(mb)` lets a script
+  pick a leaner mode up front (the updater switches to --streaming).
+
+`summary()` is what the scripts store in their state/meta files: the
+run's peak RSS and, when sampling, the phases.
+
+Usage:
+    MEMORY.start(report=True, max_rss_mb=1024)
+    MEMORY.phase("load existing")
+    ...
+    MEMORY.check()
+    MEMORY.phase("merge")
+    ...
+    MEMORY.stop()
+    MEMORY.log_report(logger)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("memory_monitor")
+
+SAMPLE_INTERVAL = 0.05  # seconds between RSS samples
+TOP_ALLOCATORS = 5
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """The process RSS went over the --max-rss budget."""
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process. VmHWM is preferred over ru_maxrss, which
+    Linux carries over from the parent across fork/exec."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark (Linux); False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _short_path(filename: str) -> str:
+    """Last two components: enough to tell bs4/__init__.py from json/__init__.py."""
+    head, tail = os.path.split(filename)
+    return os.path.join(os.path.basename(head), tail)
+
+
+def _own_filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    """*snapshot* without tracemalloc's and this module's own allocations."""
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+
+def _camel_keys(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_camel_keys(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {
+        "".join(part.capitalize() if i else part for i, part in enumerate(key.split("_"))): _camel_keys(item)
+        for key, item in value.items()
+    }
+
+
+class _Phase:
+    __slots__ = ("name", "started", "seconds", "rss_start", "rss_end", "rss_peak", "exact_peak", "traced_peak",
+                 "top", "snapshot")
+
+    def __init__(self, name: str, rss: float, snapshot: Optional[tracemalloc.Snapshot]):
+        self.name = name
+        self.started = time.monotonic()
+        self.seconds = 0.0
+        self.rss_start = self.rss_end = self.rss_peak = rss
+        self.exact_peak = False
+        self.traced_peak: Optional[float] = None
+        self.top: List[Dict[str, Any]] = []
+        self.snapshot = snapshot
+
+    def as_dict(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "name": self.name,
+            "seconds": round(self.seconds, 3),
+            "rss_start_mb": round(self.rss_start, 1),
+            "rss_end_mb": round(self.rss_end, 1),
+            "rss_peak_mb": round(self.rss_peak, 1),
+        }
+        if self.traced_peak is not None:
+            payload["traced_peak_mb"] = round(self.traced_peak, 1)
+            payload["top_allocators"] = self.top
+        return payload
+
+
+class MemoryMonitor:
+    """RSS sampling, tracemalloc phases and the RSS budget of one run."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, top: int = TOP_ALLOCATORS):
+        self.interval = interval
+        self.top = top
+        self.report = False
+        self.max_rss_mb: Optional[float] = None
+        self.actions: List[str] = []
+        self._lock = threading.Lock()
+        self._phases: List[_Phase] = []
+        self._current: Optional[_Phase] = None
+        self._over: Optional[Tuple[float, str]] = None  # (RSS, phase) of the first sample over budget
+        self._peak = 0.0  # run peak; VmHWM only covers the current phase once reset
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_tracemalloc = False
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self, report: bool = False, max_rss_mb: Optional[float] = None) -> None:
+        """Start sampling (only if *report* or *max_rss_mb* asks for it)."""
+        self.report = report
+        self.max_rss_mb = max_rss_mb or None
+        if not (self.report or self.max_rss_mb) or self.active:
+            return
+        if self.report and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="memory-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.end_phase()
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def reset(self) -> None:
+        """Forget the recorded phases (a --daemon round starts afresh)."""
+        self.end_phase()
+        with self._lock:
+            self._phases = []
+            self.actions = []
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            with self._lock:
+                if self._current is not None:
+                    self._current.rss_peak = max(self._current.rss_peak, rss)
+                if self.max_rss_mb and rss > self.max_rss_mb and self._over is None:
+                    self._over = (rss, self._current.name if self._current else "the run")
+
+    def phase(self, name: str) -> None:
+        """End the current phase, if any, and start *name*."""
+        if not self.active:
+            return
+        self.end_phase()
+        snapshot = None
+        if self.report:
+            tracemalloc.reset_peak()
+            snapshot = _own_filtered(tracemalloc.take_snapshot())
+        phase = _Phase(name, current_rss_mb(), snapshot)
+        self._peak = max(self._peak, peak_rss_mb())
+        phase.exact_peak = _reset_peak_rss()
+        with self._lock:
+            self._current = phase
+
+    def end_phase(self) -> None:
+        with self._lock:
+            current, self._current = self._current, None
+        if current is None:
+            return
+        current.seconds = time.monotonic() - current.started
+        current.rss_end = current_rss_mb()
+        current.rss_peak = max(current.rss_peak, current.rss_end)
+        if current.exact_peak:
+            current.rss_peak = max(current.rss_peak, peak_rss_mb())
+        self._peak = max(self._peak, current.rss_peak)
+        if current.snapshot is not None and tracemalloc.is_tracing():
+            current.traced_peak = tracemalloc.get_traced_memory()[1] / 2**20
+            diff = _own_filtered(tracemalloc.take_snapshot()).compare_to(current.snapshot, "lineno")
+            diff.sort(key=lambda stat: stat.size_diff, reverse=True)
+            current.top = [
+                {
+                    "where": f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count_diff,
+                }
+                for stat in diff[: self.top]
+                if stat.size_diff > 0
+            ]
+            current.snapshot = None
+        with self._lock:
+            self._phases.append(current)
+
+    def check(self) -> None:
+        """Raise `MemoryBudgetExceeded` if a sample went over the budget."""
+        if self._over is None:
+            return
+        rss, phase = self._over
+        raise MemoryBudgetExceeded(f"RSS reached {rss:.0f} MB during {phase}, over the {self.max_rss_mb:.0f} MB budget")
+
+    def would_exceed(self, extra_mb: float) -> bool:
+        """Whether allocating *extra_mb* more would go over the budget."""
+        return bool(self.max_rss_mb) and current_rss_mb() + extra_mb > self.max_rss_mb
+
+    def note(self, action: str) -> None:
+        """Record something the budget made the run do."""
+        self.actions.append(action)
+
+    def summary(self, camel_case: bool = False) -> Dict[str, Any]:
+        """Peak RSS, budget, budget actions and phases; *camel_case* keys
+        for the updater's state file."""
+        with self._lock:
+            phases = [phase.as_dict() for phase in self._phases]
+        payload: Dict[str, Any] = {"peak_rss_mb": round(max(self._peak, peak_rss_mb()), 1)}
+        if self.max_rss_mb:
+            payload["max_rss_mb"] = self.max_rss_mb
+        if self.actions:
+            payload["actions"] = list(self.actions)
+        if phases:
+            payload["phases"] = phases
+        return _camel_keys(payload) if camel_case else payload
+
+    def log_report(self, log: logging.Logger = logger) -> None:
+        summary = self.summary()
+        log.info("Memory: peak RSS %.1f MB%s", summary["peak_rss_mb"],
+                 f" (budget {self.max_rss_mb:.0f} MB)" if self.max_rss_mb else "")
+        for phase in summary.get("phases", []):
+            log.info("Memory %-16s %7.2fs  RSS %7.1f -> %7.1f MB, peak %7.1f MB%s", phase["name"],
+                     phase["seconds"], phase["rss_start_mb"], phase["rss_end_mb"], phase["rss_peak_mb"],
+                     f", traced peak {phase['traced_peak_mb']:.1f} MB" if "traced_peak_mb" in phase else "")
+            for alloc in phase.get("top_allocators", []):
+                log.info("    %+10.1f KB  %7d blocks  %s", alloc["size_kb"], alloc["count"], alloc["where"])
@@ -4,21 +4,90 @@ Combines data from several Moroccan pharmacy directories:
   1. lematin.ma            — Casablanca, Marrakech, Fès, Agadir, Oujda (primary)
   2. guidepharmacies.ma    — Rabat, Salé, Kénitra, Témara (primary)
   3. infopoint.ma          — Tanger (primary)
-  4. annuaire-gratuit.ma   — secondary fallback for remaining cities
+  4. med.ma                — Marrakech (primary)
+  5. annuaire-gratuit.ma   — secondary fallback for remaining cities
 
-Source priority: lematin / guidepharmacies / infopoint override annuaire-gratuit.
+Source priority: the primary sources override annuaire-gratuit.
+Records from different sources are matched fuzzily (pharmacy_match.py), so
+spelling variants of one pharmacy are merged and counted as confirmations.
 Cities served only by annuaire-gratuit are kept if they have >= 3 pharmacies.
 
+Each source is a plugin registered in SOURCES (pharmacy_sources.py) with
+its hosts and their polite budgets (max concurrency, request spacing),
+entry URLs, time budget and refresh times. All sources run as coroutines
+on one asyncio fetch engine (fetch_engine.py), which enforces each host's
+budget across every source sharing it.
+
+annuaire-gratuit.ma detail pages are cached in .cache/pharmacies/ (TTL from
+ANNUAIRE_CACHE_TTL_DAYS, default 30 days, with conditional revalidation).
+guidepharmacies.ma weekly tables are kept in a dated schedule store
+(.cache/pharmacies/guide_schedule.json) and reused by later runs that week.
+
+Every source runs on a time budget (SOURCE_BUDGETS) inside a whole-run
+deadline (--deadline, default 15 minutes). A source that overruns stops
+fetching, keeps the records it has, and is completed from its last good
+snapshot (.cache/pharmacies/source_snapshots.json, at most
+SOURCE_SNAPSHOT_MAX_AGE_HOURS old, default 24): cities it did not reach and
+the rows of partly crawled cities it missed. Those rows keep their date,
+carry "stale": true and are listed per city in the meta's "stale"; an
+overrun run never replaces the snapshot.
+
+Records are geocoded offline against a bundled gazetteer of city/quartier
+centroids (pharmacy_geo.py): each gets lat, lng, geohash and geo_precision.
+
 Outputs:
-  public/data/pharmacies.json      — pharmacy records
-  public/data/pharmacies_meta.json — freshness metadata
+  public/data/pharmacies/<city>.json — pharmacy records of one city (shard)
+  public/data/pharmacies.json        — all pharmacy records
+  public/data/pharmacies_meta.json   — freshness metadata, shard index and
+                                       per-source telemetry (source_telemetry.py)
+  data/pharmacy_history/             — append-only duty history, one segment
+                                       per day (duty_history.py)
+
+A city the duty history expects but no source delivered (source down, no
+recent snapshot) is filled with the pharmacies its recorded rotation puts
+on duty today (duty_rotation.py). Those rows carry "predicted": true and a
+"confidence" in [0, 1], are listed per city in the meta's "predicted", and
+are never archived. --no-predict turns this off.
+
+--trace FILE (or TRACE_FILE) appends NDJSON spans to FILE (tracing.py): one
+per run stage, per source and per HTTP request with its host, status,
+bytes, retries and cache status, plus an event per detail page or weekly
+table served from cache. trace_report.py turns it into a timeline and
+per-host latency histograms.
+
+--memory-report logs each stage's RSS (start, end, peak) and top
+tracemalloc allocators; --max-rss MB (or PHARMACY_MAX_RSS_MB) stops the run
+before it writes anything once its RSS went over the budget (exit code 3,
+the previous outputs stay published). See memory_monitor.py; the meta's
+"memory" holds the figures.
+
+Records carry no scrape timestamp (only the meta does), and each shard is
+rewritten only when its content changes, so an unchanged city keeps its
+file — and its HTTP/CDN cache entry — from one run to the next.
+
+--daemon keeps one process running (warm HTTP session, caches and stores)
+and refreshes each source on its own daily schedule (SOURCE_REFRESH_TIMES:
+lematin per shift, infopoint nightly, guidepharmacies at midnight from its
+weekly table), rewriting the outputs atomically only when the merged
+pharmacies change.
 
 Usage:
   python scripts/pharmacies_scraper.py
+  python scripts/pharmacies_scraper.py --date 2026-02-24
+  python scripts/pharmacies_scraper.py --deadline 300
+  python scripts/pharmacies_scraper.py --no-predict
+  python scripts/pharmacies_scraper.py --trace /tmp/pharmacies.trace.ndjson
+  python scripts/pharmacies_scraper.py --memory-report --max-rss 512
+  python scripts/pharmacies_scraper.py --daemon
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import hashlib
+import os
+import signal
 import json
 import logging
 import re
@@ -26,15 +95,31 @@ import sys
 import time
 import unicodedata
 import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 
 import requests
 from bs4 import BeautifulSoup
 
+import tracing
+from detail_cache import DetailCache
+from duty_history import DutyHistory
+from duty_rotation import RotationPredictor
+from duty_schedule import ScheduleStore
+from fetch_engine import DeadlineExceeded, FetchEngine, HostPolicy, gather_sources, host_of, run_sources, time_left
+from http_client import HttpClient
+from medicament_indexes import records_bytes, write_if_changed
+from medicament_text import parse_fr_date
+from memory_monitor import MemoryBudgetExceeded, MemoryMonitor
+from pharmacy_geo import GeocodeCache, Gazetteer, geo_fields
+from pharmacy_match import cluster_pharmacies
+from pharmacy_sources import SourcePlugin, SourceRegistry
+from source_snapshots import SourceSnapshots
+from source_telemetry import SourceTelemetry, TelemetryHistory, parsing, record
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
@@ -59,6 +144,7 @@ DETAIL_DELAY = 0.3
 BASE_DIR = Path(__file__).resolve().parents[1]
 OUTPUT_JSON = BASE_DIR / "public" / "data" / "pharmacies.json"
 OUTPUT_META = BASE_DIR / "public" / "data" / "pharmacies_meta.json"
+OUTPUT_SHARDS_DIR = BASE_DIR / "public" / "data" / "pharmacies"
 
 MOROCCO_TZ = timezone(timedelta(hours=1))
 _NOW_MOROCCO = datetime.now(MOROCCO_TZ)
@@ -119,6 +205,8 @@ def _clean(txt: str) -> str:
 
 
 def _strip_accents(s: str) -> str:
+    if s.isascii():
+        return s
     return "".join(
         c for c in unicodedata.normalize("NFD", s)
         if unicodedata.category(c) != "Mn"
@@ -143,6 +231,8 @@ def _normalize_phone(raw: str) -> str:
 
 
 _HOURS_RE = re.compile(r"\d{1,2}h")
+_PHARMACIE_PREFIX_RE = re.compile(r"pharmacie\s*(de\s*)?")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
 
 
 def _canonical_duty(raw: str) -> str:
@@ -167,29 +257,64 @@ def _split_area_duty(text: str) -> Tuple[str, str]:
 # ---------------------------------------------------------------------------
 # HTTP
 # ---------------------------------------------------------------------------
-def get_with_retry(url: str, max_retries: int = 3, timeout: int = 30) -> requests.Response:
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=timeout)
-            resp.raise_for_status()
-            return resp
-        except requests.RequestException as exc:
-            if attempt == max_retries - 1:
-                raise
-            wait = 2 ** attempt
-            logger.warning("Attempt %d failed for %s: %s. Retry in %ds", attempt + 1, url, exc, wait)
-            time.sleep(wait)
-    raise RuntimeError("unreachable")
+# One client per process (http_client.py): pooled keep-alive connections,
+# reused across refresh rounds in --daemon mode, jittered retries honouring
+# Retry-After, and a circuit breaker per host. Inside a source with a
+# deadline it neither waits nor retries past it.
+HTTP = HttpClient(
+    headers=HEADERS,
+    time_left=time_left,
+    on_retry=lambda wait: record(retries=1, backoff_seconds=wait),
+)
+
+
+MEMORY = MemoryMonitor()
+
+
+def get_with_retry(
+    url: str,
+    max_retries: int = 3,
+    timeout: int = 30,
+    headers: Optional[Dict[str, str]] = None,
+) -> requests.Response:
+    return HTTP.get(url, headers=headers, timeout=timeout, max_retries=max_retries)
 
 
-def safe_soup(url: str) -> BeautifulSoup:
-    return BeautifulSoup(get_with_retry(url).text, "html.parser")
+# Every source registers itself (hosts and their budgets, entry URLs, time
+# budget, refresh times) at the end of its section; see pharmacy_sources.py
+SOURCES = SourceRegistry()
+
+
+def host_policies() -> Dict[str, HostPolicy]:
+    """Per-host politeness budgets for the fetch engine, as declared by the
+    registered sources (the strictest one for a shared host)."""
+    return SOURCES.host_policies()
+
+
+_STORES: Dict[str, object] = {}
+
+
+def _store(name: str, factory):
+    """Cache/store object *name*, loaded once per process and reused (with
+    zeroed counters) by later runs, so --daemon keeps them in memory."""
+    store = _STORES.get(name)
+    if store is None:
+        store = _STORES[name] = factory()
+    else:
+        store.reset_stats()
+    return store
+
+
+async def fetch_soup(engine: FetchEngine, url: str) -> BeautifulSoup:
+    resp = await engine.get(url)
+    with parsing():
+        return BeautifulSoup(resp.text, "html.parser")
 
 
 # ---------------------------------------------------------------------------
 # Data model
 # ---------------------------------------------------------------------------
-@dataclass
+@dataclass(slots=True)
 class Pharmacy:
     city: str
     area: str
@@ -201,50 +326,67 @@ class Pharmacy:
     source: str = ""
     source_site: str = ""
     date: str = ""
+    # Taken from the source's last good snapshot, not from this run
+    stale: bool = False
 
     def norm_key(self) -> Tuple[str, str]:
         """Key for dedup: (city_lower, name_stripped_lower)"""
         city_n = _strip_accents(self.city.lower().strip())
-        name_n = _strip_accents(re.sub(r"pharmacie\s*(de\s*)?", "", self.name.lower().strip()))
-        name_n = re.sub(r"[^a-z0-9]", "", name_n)
+        name_n = _strip_accents(_PHARMACIE_PREFIX_RE.sub("", self.name.lower().strip()))
+        name_n = _NON_ALNUM_RE.sub("", name_n)
         return (city_n, name_n)
 
 
 # ---------------------------------------------------------------------------
 # Source 1: annuaire-gratuit.ma (national)
 # ---------------------------------------------------------------------------
-ANNUAIRE_BASE = "https://www.annuaire-gratuit.ma"
+# Base URLs can be pointed at the fixture stand-in server (pharmacy_fixtures.py)
+ANNUAIRE_BASE = os.getenv("ANNUAIRE_BASE", "https://www.annuaire-gratuit.ma").rstrip("/")
 ANNUAIRE_MAIN = f"{ANNUAIRE_BASE}/pharmacie-garde-maroc.html"
 
 
-def scrape_annuaire_gratuit() -> Tuple[List[Pharmacy], dict]:
-    """Scrape all cities from annuaire-gratuit.ma."""
+async def scrape_annuaire_gratuit(engine: FetchEngine) -> Tuple[List[Pharmacy], dict]:
+    """Scrape all cities from annuaire-gratuit.ma.
+
+    Detail pages go through a persistent TTL cache (ANNUAIRE_CACHE_TTL_DAYS,
+    default 30); only city pages are fetched on every run.
+    """
     source_name = "annuaire-gratuit.ma"
     results: List[Pharmacy] = []
     status = {"ok": True, "count": 0, "error": None}
+    cache = _store("annuaire_details", lambda: DetailCache.for_source("annuaire_details", "ANNUAIRE_CACHE_TTL_DAYS"))
 
     try:
-        soup = safe_soup(ANNUAIRE_MAIN)
+        soup = await fetch_soup(engine, ANNUAIRE_MAIN)
         city_links = [
             ANNUAIRE_BASE + a["href"]
             for a in soup.select("ul#agItemList li.ag_listing_item h3 > a")
         ]
         logger.info("[annuaire-gratuit] Found %d city pages", len(city_links))
 
-        for city_url in city_links:
-            try:
-                records = _parse_annuaire_city(city_url, source_name)
-                results.extend(records)
-                logger.info("[annuaire-gratuit] %s -> %d pharmacies", city_url.split("-")[-1].split(".")[0], len(records))
-            except Exception as exc:
-                logger.warning("[annuaire-gratuit] Failed %s: %s", city_url, exc)
-            time.sleep(REQUEST_DELAY)
+        outcomes = await asyncio.gather(
+            *(_parse_annuaire_city(engine, city_url, source_name, cache) for city_url in city_links),
+            return_exceptions=True,
+        )
+        for city_url, outcome in zip(city_links, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning("[annuaire-gratuit] Failed %s: %s", city_url, outcome)
+                continue
+            results.extend(outcome)
+            logger.info("[annuaire-gratuit] %s -> %d pharmacies", city_url.split("-")[-1].split(".")[0], len(outcome))
 
     except Exception as exc:
         logger.error("[annuaire-gratuit] Fatal: %s", exc)
         status["ok"] = False
         status["error"] = str(exc)
 
+    try:
+        cache.save()
+    except Exception as exc:
+        logger.warning("[annuaire-gratuit] Cannot save detail cache: %s", exc)
+    status["cache"] = cache.summary()
+    logger.info("[annuaire-gratuit] Detail cache: %s", status["cache"])
+
     status["count"] = len(results)
     return results, status
 
@@ -270,58 +412,68 @@ def _clean_address(address: str, name: str) -> str:
     return _clean(cleaned)
 
 
-def _parse_annuaire_city(city_url: str, source_name: str) -> List[Pharmacy]:
-    soup = safe_soup(city_url)
-
-    # Try to get city name from <h1> tag first (most reliable)
-    h1 = soup.select_one("h1")
-    if h1:
-        h1_text = _clean(h1.get_text(" ", strip=True))
-        # "Pharmacies de garde à El Jadida" -> "El Jadida"
-        m = re.search(r"(?:garde\s+(?:à|a|de)\s+)(.+)", h1_text, re.I)
-        city = normalize_city(m.group(1)) if m else normalize_city(_extract_city_from_url(city_url))
-    else:
-        city = normalize_city(_extract_city_from_url(city_url))
-
-    records: List[Pharmacy] = []
+async def _parse_annuaire_city(
+    engine: FetchEngine, city_url: str, source_name: str, cache: DetailCache,
+) -> List[Pharmacy]:
+    soup = await fetch_soup(engine, city_url)
+    city = _annuaire_city_name(soup, city_url)
 
     # Try structured quartier headings first
+    cards = []
     for heading in soup.select('h2[title^="Quartier"]'):
         area = _clean(heading.get_text(" ", strip=True))
         listing = heading.find_next("ul", class_="agItemList")
         if not listing:
             continue
         for card in listing.select("li.ag_listing_item"):
-            ph = _parse_annuaire_card(card, city, area, city_url, source_name)
-            if ph:
-                records.append(ph)
-            time.sleep(DETAIL_DELAY)
+            cards.append(_annuaire_card(engine, card, city, area, source_name, cache))
+    records = [ph for ph in await asyncio.gather(*cards) if ph]
 
     # Fallback: flat list without quartier headings
     if not records:
-        for li in soup.select("ul#agItemList li.ag_listing_item"):
-            name_tag = li.select_one("h3[itemprop=name]") or li.select_one("h3")
-            name = _fix_039(_clean(name_tag.text)) if name_tag else ""
-            area_tag = li.select_one("span[itemprop=addressLocality]")
-            area = _clean(area_tag.text) if area_tag else city
-            addr_tag = li.select_one("p[itemprop=streetAddress]")
-            address = _clean_address(_clean(addr_tag.text) if addr_tag else "", name)
-            phone_tag = li.select_one("span[title='Appelle-nous']")
-            phone = _normalize_phone(phone_tag.text) if phone_tag else ""
-            duty_tag = li.select_one(".garde-openingStatus") or li.select_one(".garde_status")
-            duty = _clean(duty_tag.text) if duty_tag else ""
-
-            if name:
-                records.append(Pharmacy(
-                    city=city, area=area, name=name, address=address,
-                    phone=phone, district=area, duty=duty,
-                    source=city_url, source_site=source_name, date=TODAY,
-                ))
+        with parsing():
+            records = _parse_annuaire_flat(soup, city, city_url, source_name)
 
     return records
 
 
-def _parse_annuaire_card(card, city: str, area: str, city_url: str, source_name: str) -> Pharmacy | None:
+def _annuaire_city_name(soup: BeautifulSoup, city_url: str) -> str:
+    # Try to get city name from <h1> tag first (most reliable)
+    h1 = soup.select_one("h1")
+    if h1:
+        h1_text = _clean(h1.get_text(" ", strip=True))
+        # "Pharmacies de garde à El Jadida" -> "El Jadida"
+        m = re.search(r"(?:garde\s+(?:à|a|de)\s+)(.+)", h1_text, re.I)
+        return normalize_city(m.group(1)) if m else normalize_city(_extract_city_from_url(city_url))
+    return normalize_city(_extract_city_from_url(city_url))
+
+
+def _parse_annuaire_flat(soup: BeautifulSoup, city: str, city_url: str, source_name: str) -> List[Pharmacy]:
+    records: List[Pharmacy] = []
+    for li in soup.select("ul#agItemList li.ag_listing_item"):
+        name_tag = li.select_one("h3[itemprop=name]") or li.select_one("h3")
+        name = _fix_039(_clean(name_tag.text)) if name_tag else ""
+        area_tag = li.select_one("span[itemprop=addressLocality]")
+        area = _clean(area_tag.text) if area_tag else city
+        addr_tag = li.select_one("p[itemprop=streetAddress]")
+        address = _clean_address(_clean(addr_tag.text) if addr_tag else "", name)
+        phone_tag = li.select_one("span[title='Appelle-nous']")
+        phone = _normalize_phone(phone_tag.text) if phone_tag else ""
+        duty_tag = li.select_one(".garde-openingStatus") or li.select_one(".garde_status")
+        duty = _clean(duty_tag.text) if duty_tag else ""
+
+        if name:
+            records.append(Pharmacy(
+                city=city, area=area, name=name, address=address,
+                phone=phone, district=area, duty=duty,
+                source=city_url, source_site=source_name, date=TODAY,
+            ))
+    return records
+
+
+async def _annuaire_card(
+    engine: FetchEngine, card, city: str, area: str, source_name: str, cache: DetailCache,
+) -> Pharmacy | None:
     link = card.select_one("a")
     if not link or "href" not in link.attrs:
         return None
@@ -338,15 +490,10 @@ def _parse_annuaire_card(card, city: str, area: str, city_url: str, source_name:
         detail_url = detail_path
 
     # Try detail page for richer data
-    try:
-        dsoup = safe_soup(detail_url)
-        name_tag = dsoup.select_one('h1[itemprop="name"]') or dsoup.find("h1")
-        name = _fix_039(_clean(name_tag.text)) if name_tag else ""
-        addr_tag = dsoup.select_one('td[itemprop="streetAddress"]') or dsoup.select_one("span[itemprop=streetAddress]")
-        address = _clean_address(_clean(addr_tag.text) if addr_tag else "", name)
-        phone_tag = dsoup.select_one('a[itemprop="telephone"]') or dsoup.select_one("span[itemprop=telephone]")
-        phone = _normalize_phone(phone_tag.text) if phone_tag else ""
-    except Exception:
+    details = await _annuaire_details(engine, detail_url, cache)
+    if details is not None:
+        name, address, phone = details["name"], details["address"], details["phone"]
+    else:
         h3 = link.select_one("h3")
         name = _fix_039(_clean(h3.text)) if h3 else _fix_039(_clean(link.text))
         address, phone = "", ""
@@ -361,30 +508,98 @@ def _parse_annuaire_card(card, city: str, area: str, city_url: str, source_name:
     )
 
 
+async def _annuaire_details(engine: FetchEngine, detail_url: str, cache: DetailCache) -> Dict[str, str] | None:
+    """Name, address and phone from a detail page, via the TTL cache.
+
+    Returns None when the page cannot be fetched and nothing is cached.
+    """
+    cached, conditional = cache.lookup(detail_url)
+    if cached is not None:
+        tracing.event("cache hit", **{"url.full": detail_url, "cache.status": "hit"})
+        return cached
+
+    try:
+        resp = await engine.get(detail_url, headers=conditional)
+        if resp.status_code == 304:
+            return cache.revalidated(detail_url)
+        with parsing():
+            details = _parse_annuaire_detail(BeautifulSoup(resp.text, "html.parser"))
+        cache.store(
+            detail_url, details,
+            etag=resp.headers.get("ETag", ""),
+            last_modified=resp.headers.get("Last-Modified", ""),
+        )
+        return details
+    except Exception:
+        stale = cache.stale(detail_url)
+        if stale is not None:
+            tracing.event("cache stale", **{"url.full": detail_url, "cache.status": "stale"})
+        return stale
+
+
+def _parse_annuaire_detail(dsoup: BeautifulSoup) -> Dict[str, str]:
+    name_tag = dsoup.select_one('h1[itemprop="name"]') or dsoup.find("h1")
+    name = _fix_039(_clean(name_tag.text)) if name_tag else ""
+    addr_tag = dsoup.select_one('td[itemprop="streetAddress"]') or dsoup.select_one("span[itemprop=streetAddress]")
+    address = _clean_address(_clean(addr_tag.text) if addr_tag else "", name)
+    phone_tag = dsoup.select_one('a[itemprop="telephone"]') or dsoup.select_one("span[itemprop=telephone]")
+    phone = _normalize_phone(phone_tag.text) if phone_tag else ""
+    return {"name": name, "address": address, "phone": phone}
+
+
+SOURCES.register(SourcePlugin(
+    name="annuaire-gratuit.ma",
+    scrape=scrape_annuaire_gratuit,
+    hosts={host_of(ANNUAIRE_BASE): HostPolicy(concurrency=2, min_interval=DETAIL_DELAY)},
+    entry_urls=(ANNUAIRE_MAIN,),
+    # Dozens of city pages, each with per-card detail pages
+    budget_seconds=10 * 60,
+    # City pages twice a day; detail pages come from the TTL cache
+    refresh_times=("08:30", "20:30"),
+))
+
+
 # ---------------------------------------------------------------------------
 # Source 2: guidepharmacies.ma (Rabat, Salé, Kénitra, Témara)
 # ---------------------------------------------------------------------------
+GUIDE_BASE = os.getenv("GUIDE_BASE", "https://www.guidepharmacies.ma").rstrip("/")
 GUIDE_SOURCES = {
-    "Rabat": "https://www.guidepharmacies.ma/pharmacies-de-garde/rabat.html",
-    "Salé": "https://www.guidepharmacies.ma/pharmacies-de-garde/sale.html",
-    "Kénitra": "https://www.guidepharmacies.ma/pharmacies-de-garde/kenitra-mehdia.html",
-    "Témara": "https://www.guidepharmacies.ma/pharmacies-de-garde/temara.html",
+    "Rabat": f"{GUIDE_BASE}/pharmacies-de-garde/rabat.html",
+    "Salé": f"{GUIDE_BASE}/pharmacies-de-garde/sale.html",
+    "Kénitra": f"{GUIDE_BASE}/pharmacies-de-garde/kenitra-mehdia.html",
+    "Témara": f"{GUIDE_BASE}/pharmacies-de-garde/temara.html",
 }
 
 
-def scrape_guidepharmacies() -> Tuple[List[Pharmacy], dict]:
+async def scrape_guidepharmacies(engine: FetchEngine) -> Tuple[List[Pharmacy], dict]:
+    """Scrape guidepharmacies.ma weekly tables.
+
+    Every day of the table goes into a dated schedule store, so later runs
+    in the same week are served from it (GUIDE_SCHEDULE_MAX_AGE_HOURS,
+    default 13, before a conditional revalidation).
+    """
     source_name = "guidepharmacies.ma"
     results: List[Pharmacy] = []
     status = {"ok": True, "count": 0, "error": None}
+    store = _store("guide_schedule", lambda: ScheduleStore.for_source("guide_schedule", "GUIDE_SCHEDULE_MAX_AGE_HOURS"))
 
-    for city, url in GUIDE_SOURCES.items():
-        try:
-            records = _parse_guide_table(url, city, source_name)
-            results.extend(records)
-            logger.info("[guidepharmacies] %s -> %d pharmacies", city, len(records))
-        except Exception as exc:
-            logger.warning("[guidepharmacies] Failed %s: %s", city, exc)
-        time.sleep(REQUEST_DELAY)
+    outcomes = await asyncio.gather(
+        *(_guide_city(engine, url, city, source_name, store) for city, url in GUIDE_SOURCES.items()),
+        return_exceptions=True,
+    )
+    for city, outcome in zip(GUIDE_SOURCES, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.warning("[guidepharmacies] Failed %s: %s", city, outcome)
+            continue
+        records, fetched = outcome
+        results.extend(records)
+        logger.info("[guidepharmacies] %s -> %d pharmacies%s", city, len(records), "" if fetched else " (schedule store)")
+
+    try:
+        store.save(TODAY)
+    except Exception as exc:
+        logger.warning("[guidepharmacies] Cannot save schedule store: %s", exc)
+    status["cache"] = store.summary()
 
     if not results:
         status["ok"] = False
@@ -394,11 +609,49 @@ def scrape_guidepharmacies() -> Tuple[List[Pharmacy], dict]:
     return results, status
 
 
-def _parse_guide_table(url: str, city: str, source_name: str) -> List[Pharmacy]:
-    """Parse guidepharmacies.ma weekly table, extracting only TODAY's entries."""
-    records: List[Pharmacy] = []
+async def _guide_city(
+    engine: FetchEngine, url: str, city: str, source_name: str, store: ScheduleStore,
+) -> Tuple[List[Pharmacy], bool]:
+    """TODAY's records for one city, from the store when fresh.
+
+    Returns (records, whether a request was made).
+    """
+    rows, conditional = store.lookup(city, url, TODAY)
+    if rows is not None:
+        tracing.event("cache hit", **{"url.full": url, "cache.status": "hit", "city": city})
+        return [Pharmacy(**row) for row in rows], False
+
+    try:
+        resp = await engine.get(url, headers=conditional)
+    except Exception:
+        rows = store.stale(city, url, TODAY)
+        if rows is None:
+            raise
+        logger.warning("[guidepharmacies] %s unreachable, using stored schedule", city)
+        tracing.event("cache stale", **{"url.full": url, "cache.status": "stale", "city": city})
+        return [Pharmacy(**row) for row in rows], True
+
+    if resp.status_code == 304:
+        rows = store.revalidated(city, url, TODAY) or []
+        return [Pharmacy(**row) for row in rows], True
+
+    with parsing():
+        week = _parse_guide_table(BeautifulSoup(resp.text, "html.parser"), url, city, source_name)
+    store.put(
+        city, url,
+        {day: [asdict(ph) for ph in records] for day, records in week.items()},
+        etag=resp.headers.get("ETag", ""),
+        last_modified=resp.headers.get("Last-Modified", ""),
+    )
+    if TODAY not in week:
+        logger.warning("[guidepharmacies] %s: no section for %s (found %s)", city, TODAY, ", ".join(sorted(week)) or "none")
+    return week.get(TODAY, []), True
+
+
+def _parse_guide_table(soup: BeautifulSoup, url: str, city: str, source_name: str) -> Dict[str, List[Pharmacy]]:
+    """Parse a guidepharmacies.ma weekly table into {ISO date: records}."""
+    week: Dict[str, List[Pharmacy]] = {}
     seen: set = set()
-    soup = safe_soup(url)
 
     # Remove nav to avoid noise
     nav = soup.select_one("nav.sp-megamenu-wrapper")
@@ -407,24 +660,18 @@ def _parse_guide_table(url: str, city: str, source_name: str) -> List[Pharmacy]:
 
     # The page shows a weekly schedule.  Day headers live in td.tableh2
     # (e.g. "lundi  23 février  2026") and pharmacy entries in td.tableb.
-    # We walk through both in document order and only keep today's section.
-    day_num = str(_NOW_MOROCCO.day)          # "23" (no leading zero)
-    year_str = str(_NOW_MOROCCO.year)         # "2026"
-    in_today = False
+    # We walk through both in document order, filing entries under the
+    # date of the last header seen.
+    day: str | None = None
 
     for td in soup.select("td.tableh2, td.tableb"):
         classes = td.get("class", [])
 
         if "tableh2" in classes:
-            header = td.get_text(" ", strip=True)
-            # Match e.g. "lundi  23 février  2026"
-            in_today = (
-                re.search(rf"\b{day_num}\b", header) is not None
-                and year_str in header
-            )
+            day = parse_fr_date(td.get_text(" ", strip=True))
             continue
 
-        if not in_today or "tableb" not in classes:
+        if day is None or "tableb" not in classes:
             continue
 
         loc = td.find("p", class_="location-name")
@@ -445,73 +692,48 @@ def _parse_guide_table(url: str, city: str, source_name: str) -> List[Pharmacy]:
         if not name_stripped and area:
             name = f"Pharmacie {area}"
 
-        key = (city.lower(), re.sub(r"[^a-z0-9]", "", _strip_accents(name.lower())))
+        key = (day, re.sub(r"[^a-z0-9]", "", _strip_accents(name.lower())))
         if key in seen:
             continue
         seen.add(key)
 
-        records.append(Pharmacy(
+        week.setdefault(day, []).append(Pharmacy(
             city=normalize_city(city), area=area, name=name.title(),
             address="", phone=phone, district=area, duty=duty or "24h/24",
-            source=url, source_site=source_name, date=TODAY,
+            source=url, source_site=source_name, date=day,
         ))
 
-    return records
+    return week
+
+
+SOURCES.register(SourcePlugin(
+    name="guidepharmacies.ma",
+    scrape=scrape_guidepharmacies,
+    hosts={host_of(GUIDE_BASE): HostPolicy(concurrency=1, min_interval=REQUEST_DELAY)},
+    entry_urls=tuple(GUIDE_SOURCES.values()),
+    budget_seconds=3 * 60,
+    # Rows come from the weekly schedule store: the midnight run rolls the
+    # duty date and only downloads a table when the stored week runs out
+    refresh_times=("00:05",),
+    primary=True,
+))
 
 
 # ---------------------------------------------------------------------------
 # Source 3: infopoint.ma (Tanger, Casablanca)
 # ---------------------------------------------------------------------------
-INFOPOINT_URL = "https://infopoint.ma/pharmacies-de-garde"
+INFOPOINT_URL = os.getenv("INFOPOINT_URL", "https://infopoint.ma/pharmacies-de-garde")
 
 
-def scrape_infopoint() -> Tuple[List[Pharmacy], dict]:
+async def scrape_infopoint(engine: FetchEngine) -> Tuple[List[Pharmacy], dict]:
     source_name = "infopoint.ma"
     results: List[Pharmacy] = []
     status = {"ok": True, "count": 0, "error": None}
 
     try:
-        soup = safe_soup(INFOPOINT_URL)
-        for card in soup.select("div.item-grid.arabe_pharm"):
-            addr_tag = card.select_one("p.adress-item:not(.adress_arabe)")
-            # Use title attr for clean address, full text for city detection
-            address = _clean(addr_tag["title"]) if addr_tag and addr_tag.get("title") else ""
-            full_text = _clean(addr_tag.get_text(" ", strip=True)) if addr_tag else ""
-
-            # Determine city from full <p> text (contains "90000 TANGER - Maroc")
-            full_upper = full_text.upper()
-            if "TANGER" in full_upper:
-                city = "Tanger"
-            elif "CASABLANCA" in full_upper or "CASA" in full_upper:
-                city = "Casablanca"
-            else:
-                city = "Tanger"  # default — infopoint is Tanger-based
-
-            h3 = card.select_one("h3")
-            name = _clean(h3.text) if h3 else ""
-            phone_tag = card.select_one("p.phone-item")
-            phone = _normalize_phone(phone_tag.get_text(strip=True)) if phone_tag else ""
-
-            # Extract quartier from LAST segment of address (after last comma)
-            # "73, Avenue Haroun Errachid, Colonia" -> "Colonia"
-            # "Avenue Moulay Rachid, Résidence Golden Beach" -> "Résidence Golden Beach"
-            if "," in address:
-                area = _clean(address.rsplit(",", 1)[-1])
-                # If last segment is just a number or too short, try second-to-last
-                if len(area) <= 3 or area.isdigit():
-                    parts = [_clean(p) for p in address.split(",")]
-                    area = next((p for p in reversed(parts) if len(p) > 3 and not p.isdigit()), city)
-            else:
-                area = city
-
-            if name:
-                results.append(Pharmacy(
-                    city=city, area=area, name=name.title(),
-                    address=address, phone=phone, district=area,
-                    duty="20h00-09h00", source=INFOPOINT_URL,
-                    source_site=source_name, date=TODAY,
-                ))
-
+        soup = await fetch_soup(engine, INFOPOINT_URL)
+        with parsing():
+            results = _parse_infopoint(soup, source_name)
         logger.info("[infopoint] %d pharmacies found", len(results))
 
     except Exception as exc:
@@ -523,10 +745,67 @@ def scrape_infopoint() -> Tuple[List[Pharmacy], dict]:
     return results, status
 
 
+def _parse_infopoint(soup: BeautifulSoup, source_name: str) -> List[Pharmacy]:
+    results: List[Pharmacy] = []
+    for card in soup.select("div.item-grid.arabe_pharm"):
+        addr_tag = card.select_one("p.adress-item:not(.adress_arabe)")
+        # Use title attr for clean address, full text for city detection
+        address = _clean(addr_tag["title"]) if addr_tag and addr_tag.get("title") else ""
+        full_text = _clean(addr_tag.get_text(" ", strip=True)) if addr_tag else ""
+
+        # Determine city from full <p> text (contains "90000 TANGER - Maroc")
+        full_upper = full_text.upper()
+        if "TANGER" in full_upper:
+            city = "Tanger"
+        elif "CASABLANCA" in full_upper or "CASA" in full_upper:
+            city = "Casablanca"
+        else:
+            city = "Tanger"  # default — infopoint is Tanger-based
+
+        h3 = card.select_one("h3")
+        name = _clean(h3.text) if h3 else ""
+        phone_tag = card.select_one("p.phone-item")
+        phone = _normalize_phone(phone_tag.get_text(strip=True)) if phone_tag else ""
+
+        # Extract quartier from LAST segment of address (after last comma)
+        # "73, Avenue Haroun Errachid, Colonia" -> "Colonia"
+        # "Avenue Moulay Rachid, Résidence Golden Beach" -> "Résidence Golden Beach"
+        if "," in address:
+            area = _clean(address.rsplit(",", 1)[-1])
+            # If last segment is just a number or too short, try second-to-last
+            if len(area) <= 3 or area.isdigit():
+                parts = [_clean(p) for p in address.split(",")]
+                area = next((p for p in reversed(parts) if len(p) > 3 and not p.isdigit()), city)
+        else:
+            area = city
+
+        if name:
+            results.append(Pharmacy(
+                city=city, area=area, name=name.title(),
+                address=address, phone=phone, district=area,
+                duty="20h00-09h00", source=INFOPOINT_URL,
+                source_site=source_name, date=TODAY,
+            ))
+
+    return results
+
+
+SOURCES.register(SourcePlugin(
+    name="infopoint.ma",
+    scrape=scrape_infopoint,
+    hosts={host_of(INFOPOINT_URL): HostPolicy(concurrency=1, min_interval=REQUEST_DELAY)},
+    entry_urls=(INFOPOINT_URL,),
+    budget_seconds=2 * 60,
+    # The night list is published once per evening
+    refresh_times=("20:05",),
+    primary=True,
+))
+
+
 # ---------------------------------------------------------------------------
 # Source 4: lematin.ma (Casablanca, Marrakech, Fès, Agadir, Oujda)
 # ---------------------------------------------------------------------------
-LEMATIN_BASE = "https://lematin.ma"
+LEMATIN_BASE = os.getenv("LEMATIN_BASE", "https://lematin.ma").rstrip("/")
 LEMATIN_CITIES = {
     "Casablanca": "casablanca",
     "Marrakech": "marrakech",
@@ -536,21 +815,47 @@ LEMATIN_CITIES = {
 }
 
 
-def scrape_lematin() -> Tuple[List[Pharmacy], dict]:
-    """Scrape Le Matin pharmacy duty pages (jour + nuit shifts)."""
+async def scrape_lematin(engine: FetchEngine) -> Tuple[List[Pharmacy], dict]:
+    """Scrape Le Matin pharmacy duty pages (jour + nuit shifts).
+
+    City and neighbourhood × shift pages are all queued on the engine
+    (lematin.ma host budget); records are then assembled per city in page
+    order, so the output does not depend on fetch timing.
+    """
     source_name = "lematin.ma"
     results: List[Pharmacy] = []
     status = {"ok": True, "count": 0, "error": None}
 
     try:
-        for city, slug in LEMATIN_CITIES.items():
-            try:
-                city_records = _scrape_lematin_city(city, slug, source_name)
-                results.extend(city_records)
-                logger.info("[lematin] %s -> %d pharmacies", city, len(city_records))
-            except Exception as exc:
-                logger.warning("[lematin] Failed %s: %s", city, exc)
-            time.sleep(REQUEST_DELAY)
+        city_soups = await asyncio.gather(
+            *(fetch_soup(engine, f"{LEMATIN_BASE}/pharmacie-garde/{slug}") for slug in LEMATIN_CITIES.values()),
+            return_exceptions=True,
+        )
+
+        # Queue every shift page before waiting on any of them
+        pages: Dict[str, List[Tuple[str, str, str]]] = {}
+        for (city, slug), soup in zip(LEMATIN_CITIES.items(), city_soups):
+            if isinstance(soup, BaseException):
+                logger.warning("[lematin] Failed %s: %s", city, soup)
+                continue
+            nhood_info = _lematin_neighbourhoods(soup)
+            if not nhood_info:
+                logger.warning("[lematin] No neighborhoods found for %s", city)
+            pages[city] = [
+                (label or ns.replace("-", " ").title(), shift, f"{LEMATIN_BASE}/pharmacie-garde/{slug}/{shift}/{ns}")
+                for ns, label in nhood_info
+                for shift in ("jour", "nuit")
+            ]
+        shift_rows = {
+            city: asyncio.gather(*(_lematin_shift(engine, url) for _, _, url in shifts), return_exceptions=True)
+            for city, shifts in pages.items()
+        }
+
+        for city, shifts in pages.items():
+            rows = await shift_rows[city]
+            city_records = _merge_lematin_city(city, list(zip(shifts, rows)), source_name)
+            results.extend(city_records)
+            logger.info("[lematin] %s -> %d pharmacies", city, len(city_records))
 
     except Exception as exc:
         logger.error("[lematin] Fatal: %s", exc)
@@ -565,16 +870,11 @@ def scrape_lematin() -> Tuple[List[Pharmacy], dict]:
     return results, status
 
 
-def _scrape_lematin_city(city: str, slug: str, source_name: str) -> List[Pharmacy]:
-    """Scrape one city from lematin.ma, both jour and nuit shifts.
+def _lematin_neighbourhoods(soup: BeautifulSoup) -> List[Tuple[str, str]]:
+    """Return (neighbourhood slug, label) pairs listed on a lematin.ma city page.
 
     URL pattern: /pharmacie-garde/{city}/{shift}/{neighborhood}
-    HTML: div.ph-record > div.ph-name a[title], div.ph-address
     """
-    city_url = f"{LEMATIN_BASE}/pharmacie-garde/{slug}"
-    soup = safe_soup(city_url)
-
-    # Extract unique neighborhood slugs from links
     nhood_info: List[Tuple[str, str]] = []  # (slug, label)
     seen_slugs: set = set()
     for a in soup.select("div.record a[href]"):
@@ -587,112 +887,275 @@ def _scrape_lematin_city(city: str, slug: str, source_name: str) -> List[Pharmac
                 seen_slugs.add(ns)
                 label = _clean(a.get_text(strip=True))
                 nhood_info.append((ns, label))
+    return nhood_info
 
-    if not nhood_info:
-        logger.warning("[lematin] No neighborhoods found for %s", city)
-        return []
 
+async def _lematin_shift(engine: FetchEngine, shift_url: str) -> List[Tuple[str, str]]:
+    page = await fetch_soup(engine, shift_url)
+    with parsing():
+        return _parse_lematin_shift(page)
+
+
+def _parse_lematin_shift(page: BeautifulSoup) -> List[Tuple[str, str]]:
+    """(name, address) rows of one neighbourhood/shift page.
+
+    HTML: div.ph-record > div.ph-name a[title], div.ph-address
+    """
+    rows: List[Tuple[str, str]] = []
+    for rec in page.select("div.ph-record"):
+        name_a = rec.select_one("div.ph-name a")
+        if not name_a:
+            continue
+        raw_name = name_a.get("title", "") or _clean(name_a.get_text(strip=True))
+        name = _clean(raw_name)
+        if not name:
+            continue
+        addr_el = rec.select_one("div.ph-address")
+        address = _clean(addr_el.get_text(strip=True)) if addr_el else ""
+        rows.append((name, address))
+    return rows
+
+
+def _merge_lematin_city(
+    city: str,
+    pages: List[Tuple[Tuple[str, str, str], List[Tuple[str, str]] | BaseException]],
+    source_name: str,
+) -> List[Pharmacy]:
+    """Build one city's records from its fetched shift pages
+    ((area, shift, url), rows or fetch error), in neighbourhood order
+    (jour before nuit). A pharmacy listed in both shifts becomes 24h/24."""
     records: List[Pharmacy] = []
     # Map norm_key → Pharmacy for marking 24h when seen in both shifts
     key_map: Dict[Tuple[str, str], Pharmacy] = {}
 
-    for ns, label in nhood_info:
-        area = label or ns.replace("-", " ").title()
-        for shift in ("jour", "nuit"):
-            shift_url = f"{LEMATIN_BASE}/pharmacie-garde/{slug}/{shift}/{ns}"
-            try:
-                page = safe_soup(shift_url)
-                for rec in page.select("div.ph-record"):
-                    name_a = rec.select_one("div.ph-name a")
-                    if not name_a:
-                        continue
-                    raw_name = name_a.get("title", "") or _clean(name_a.get_text(strip=True))
-                    name = _clean(raw_name)
-                    if not name:
-                        continue
-
-                    addr_el = rec.select_one("div.ph-address")
-                    address = _clean(addr_el.get_text(strip=True)) if addr_el else ""
-
-                    key = (city.lower(), re.sub(r"[^a-z0-9]", "", _strip_accents(name.lower())))
-
-                    if key in key_map:
-                        # Seen in jour, now in nuit (or vice-versa) → 24h
-                        existing = key_map[key]
-                        if existing.duty != "24h/24":
-                            existing.duty = "24h/24"
-                        continue
-
-                    duty = "Garde de jour" if shift == "jour" else "Garde de nuit"
-
-                    ph = Pharmacy(
-                        city=normalize_city(city),
-                        area=area,
-                        name=name.title(),
-                        address=address,
-                        phone="",
-                        district=area,
-                        duty=duty,
-                        source=shift_url,
-                        source_site=source_name,
-                        date=TODAY,
-                    )
-                    key_map[key] = ph
-                    records.append(ph)
-            except Exception as exc:
-                logger.debug("[lematin] %s/%s/%s: %s", city, shift, ns, exc)
-            time.sleep(DETAIL_DELAY)
+    for (area, shift, shift_url), rows in pages:
+        if isinstance(rows, BaseException):
+            logger.debug("[lematin] %s: %s", shift_url, rows)
+            continue
+
+        for name, address in rows:
+            key = (city.lower(), re.sub(r"[^a-z0-9]", "", _strip_accents(name.lower())))
+
+            if key in key_map:
+                # Seen in jour, now in nuit (or vice-versa) → 24h
+                existing = key_map[key]
+                if existing.duty != "24h/24":
+                    existing.duty = "24h/24"
+                continue
+
+            duty = "Garde de jour" if shift == "jour" else "Garde de nuit"
+
+            ph = Pharmacy(
+                city=normalize_city(city),
+                area=area,
+                name=name.title(),
+                address=address,
+                phone="",
+                district=area,
+                duty=duty,
+                source=shift_url,
+                source_site=source_name,
+                date=TODAY,
+            )
+            key_map[key] = ph
+            records.append(ph)
 
     return records
 
 
+SOURCES.register(SourcePlugin(
+    name="lematin.ma",
+    scrape=scrape_lematin,
+    hosts={host_of(LEMATIN_BASE): HostPolicy(concurrency=4, min_interval=DETAIL_DELAY)},
+    entry_urls=tuple(f"{LEMATIN_BASE}/pharmacie-garde/{slug}" for slug in LEMATIN_CITIES.values()),
+    budget_seconds=8 * 60,
+    # One refresh per shift (jour, nuit)
+    refresh_times=("09:05", "20:05"),
+    primary=True,
+))
+
+
+# ---------------------------------------------------------------------------
+# Source 5: med.ma (Marrakech)
+# ---------------------------------------------------------------------------
+MEDMA_BASE = os.getenv("MEDMA_BASE", "https://www.med.ma").rstrip("/")
+MEDMA_CITIES = {
+    "Marrakech": "marrakech",
+}
+MEDMA_PAGES = 5  # listing pages per city; the first five more than cover the night
+
+
+def _medma_pages(slug: str) -> List[str]:
+    return [f"{MEDMA_BASE}/pharmacie/garde-nuit/{slug}/{page}" for page in range(MEDMA_PAGES)]
+
+
+async def scrape_medma(engine: FetchEngine) -> Tuple[List[Pharmacy], dict]:
+    """Scrape med.ma night duty listings.
+
+    Every listing page of every city is queued on the engine at once (med.ma
+    host budget) instead of being walked page by page; records are then
+    assembled in page order, deduplicated by name and phone.
+    """
+    source_name = "med.ma"
+    results: List[Pharmacy] = []
+    status = {"ok": True, "count": 0, "error": None}
+
+    pages = [(city, url) for city, slug in MEDMA_CITIES.items() for url in _medma_pages(slug)]
+    soups = await asyncio.gather(*(fetch_soup(engine, url) for _, url in pages), return_exceptions=True)
+
+    seen: set = set()
+    errors = [soup for soup in soups if isinstance(soup, BaseException)]
+    for (city, url), soup in zip(pages, soups):
+        if isinstance(soup, BaseException):
+            logger.debug("[med.ma] %s: %s", url, soup)
+            continue
+        with parsing():
+            for ph in _parse_medma_page(soup, city, url, source_name):
+                key = (*ph.norm_key(), ph.phone)
+                if key not in seen:
+                    seen.add(key)
+                    results.append(ph)
+
+    if errors and len(errors) == len(pages):
+        logger.error("[med.ma] Fatal: %s", errors[0])
+        status["ok"] = False
+        status["error"] = str(errors[0])
+    elif errors:
+        logger.warning("[med.ma] %d of %d listing pages failed", len(errors), len(pages))
+    logger.info("[med.ma] %d pharmacies found", len(results))
+
+    status["count"] = len(results)
+    return results, status
+
+
+def _parse_medma_page(soup: BeautifulSoup, city: str, url: str, source_name: str) -> List[Pharmacy]:
+    results: List[Pharmacy] = []
+    for block in soup.select("div.card-doctor-block"):
+        name_tag = block.select_one(".list__label--name")
+        if not name_tag:
+            continue
+        name = _clean(name_tag.text)
+        # First address line is the street address, the last one (if any)
+        # the duty hours ("Garde de 20h00 à 09h00")
+        lines = block.select(".list__label--adr")
+        address = _clean(lines[0].text) if lines else ""
+        duty = _canonical_duty(_clean(lines[-1].text)) if len(lines) > 1 else "Garde de nuit"
+        phone_tag = block.select_one("a.calltel")
+        phone = _normalize_phone(phone_tag.text) if phone_tag else ""
+
+        results.append(Pharmacy(
+            city=normalize_city(city), area=city, name=name.title(),
+            address=address, phone=phone, district=city,
+            duty=duty, source=url, source_site=source_name, date=TODAY,
+        ))
+    return results
+
+
+SOURCES.register(SourcePlugin(
+    name="med.ma",
+    scrape=scrape_medma,
+    hosts={host_of(MEDMA_BASE): HostPolicy(concurrency=2, min_interval=REQUEST_DELAY)},
+    entry_urls=tuple(_medma_pages(slug)[0] for slug in MEDMA_CITIES.values()),
+    budget_seconds=2 * 60,
+    # Night listings, published in the evening
+    refresh_times=("20:05",),
+    primary=True,
+))
+
+
 # ---------------------------------------------------------------------------
 # Merge & cross-validate
 # ---------------------------------------------------------------------------
-_PRIORITY_SOURCES = {"guidepharmacies.ma", "lematin.ma", "infopoint.ma"}
+_PRIORITY_SOURCES = SOURCES.primary_sources()
 _MIN_ANNUAIRE_ONLY = 3  # cities with fewer pharmacies from annuaire-only are dropped
 
 
-def merge_and_validate(source_lists: List[Tuple[str, List[Pharmacy]]]) -> List[Pharmacy]:
+class PharmacyRecord:
+    """A scraped pharmacy with its normalised keys, computed once.
+
+    `sources_count` is filled in by merge_and_validate for merged records;
+    `confidence` is set only on rotation predictions.
+    """
+
+    __slots__ = ("source_name", "pharmacy", "city_key", "key", "sources_count", "confidence")
+
+    def __init__(self, source_name: str, pharmacy: Pharmacy):
+        self.source_name = source_name
+        self.pharmacy = pharmacy
+        self.key = pharmacy.norm_key()
+        self.city_key = self.key[0]
+        self.sources_count = 1
+        self.confidence: Optional[float] = None
+
+    # Fields read by pharmacy_match
+    @property
+    def name(self) -> str:
+        return self.pharmacy.name
+
+    @property
+    def area(self) -> str:
+        return self.pharmacy.area
+
+    @property
+    def address(self) -> str:
+        return self.pharmacy.address
+
+    @property
+    def phone(self) -> str:
+        return self.pharmacy.phone
+
+
+def merge_and_validate(source_lists: List[Tuple[str, List[Pharmacy]]]) -> List[PharmacyRecord]:
     """Merge pharmacies from multiple sources, deduplicate, and filter.
 
     Source priority: for cities where a *primary* source (guidepharmacies,
-    lematin, infopoint) has data, annuaire-gratuit entries for that city
+    lematin, infopoint, med.ma) has data, annuaire-gratuit entries for that city
     are skipped.  Cities served only by annuaire-gratuit are kept if
     they have at least _MIN_ANNUAIRE_ONLY pharmacies.
+
+    Duplicates are found by pharmacy_match.cluster_pharmacies: the exact
+    norm_key plus fuzzy name matching backed by phone, area and address.
+    All records, skipped annuaire-gratuit rows included, are clustered
+    once; each cluster yields its source count (confirmations) and, from
+    its non-skipped members, one merged record.
     """
+    records = [PharmacyRecord(source_name, ph) for source_name, pharmacies in source_lists for ph in pharmacies]
 
     # Detect which cities each priority source covers
-    priority_cities: set = set()
-    for source_name, pharmacies in source_lists:
-        if source_name in _PRIORITY_SOURCES:
-            for ph in pharmacies:
-                priority_cities.add(_strip_accents(ph.city.lower().strip()))
+    priority_cities = {rec.city_key for rec in records if rec.source_name in _PRIORITY_SOURCES}
     if priority_cities:
         logger.info("Primary sources cover %d cities: %s",
                      len(priority_cities), ", ".join(sorted(priority_cities)))
 
-    # Index all pharmacies by normalized key
-    by_key: Dict[Tuple[str, str], List[Pharmacy]] = {}
-    for source_name, pharmacies in source_lists:
-        for ph in pharmacies:
-            city_norm = _strip_accents(ph.city.lower().strip())
-            # For priority-covered cities, skip annuaire-gratuit
-            if city_norm in priority_cities and source_name == "annuaire-gratuit.ma":
-                continue
-            key = ph.norm_key()
-            by_key.setdefault(key, []).append(ph)
+    match_stats: Dict[str, int] = {}
+    clusters = cluster_pharmacies(
+        records, key=lambda rec: rec.key, city_key=lambda rec: rec.city_key, stats=match_stats,
+    )
+    logger.info("Matching: %d records, %d comparisons, %d fuzzy merges",
+                match_stats["records"], match_stats["comparisons"], match_stats["fuzzy_merges"])
+
+    merged: List[PharmacyRecord] = []
+    city_counts: Dict[str, int] = {}
+    city_sources: Dict[str, set] = {}
+    for members in clusters:
+        cluster = [records[i] for i in members]
+        # For priority-covered cities, skip annuaire-gratuit
+        dupes = [
+            rec for rec in cluster
+            if not (rec.city_key in priority_cities and rec.source_name == "annuaire-gratuit.ma")
+        ]
+        if not dupes:
+            continue
 
-    merged: List[Pharmacy] = []
-    for key, dupes in by_key.items():
         # Pick the most complete record (most non-empty fields)
-        best = max(dupes, key=lambda p: sum([
-            bool(p.address), bool(p.phone), bool(p.area),
-            bool(p.duty), len(p.address),
+        best_rec = max(dupes, key=lambda r: sum([
+            bool(r.pharmacy.address), bool(r.pharmacy.phone), bool(r.pharmacy.area),
+            bool(r.pharmacy.duty), len(r.pharmacy.address),
         ]))
+        best = best_rec.pharmacy
 
         # Fill in missing fields from other records
-        for other in dupes:
+        for other in (rec.pharmacy for rec in dupes):
             if not best.address and other.address:
                 best.address = other.address
             if not best.phone and other.phone:
@@ -700,64 +1163,76 @@ def merge_and_validate(source_lists: List[Tuple[str, List[Pharmacy]]]) -> List[P
             if not best.duty and other.duty:
                 best.duty = other.duty
 
-        merged.append(best)
+        # Stale only when no source confirmed it in this run
+        best.stale = all(rec.pharmacy.stale for rec in dupes)
+        best_rec.sources_count = len({rec.source_name for rec in cluster})
+        merged.append(best_rec)
+        # Per-city counts and source sites for the filter below
+        city_counts[best_rec.city_key] = city_counts.get(best_rec.city_key, 0) + 1
+        city_sources.setdefault(best_rec.city_key, set()).add(best.source_site)
 
     # ── City-level filtering ──────────────────────────────────────────
-    # Count per-city and track source sites
-    city_counts: Dict[str, int] = {}
-    city_sources: Dict[str, set] = {}
-    for ph in merged:
-        cn = _strip_accents(ph.city.lower().strip())
-        city_counts[cn] = city_counts.get(cn, 0) + 1
-        city_sources.setdefault(cn, set()).add(ph.source_site)
-
-    def _keep(ph: Pharmacy) -> bool:
-        cn = _strip_accents(ph.city.lower().strip())
+    def _keep(rec: PharmacyRecord) -> bool:
         # Always keep cities with a primary source
-        if city_sources.get(cn, set()) & _PRIORITY_SOURCES:
+        if city_sources.get(rec.city_key, set()) & _PRIORITY_SOURCES:
             return True
         # For annuaire-only cities, require minimum pharmacy count
-        return city_counts.get(cn, 0) >= _MIN_ANNUAIRE_ONLY
+        return city_counts.get(rec.city_key, 0) >= _MIN_ANNUAIRE_ONLY
 
     before = len(merged)
-    merged = [ph for ph in merged if _keep(ph)]
+    merged = [rec for rec in merged if _keep(rec)]
     dropped = before - len(merged)
     if dropped:
-        kept_cities = len(set(_strip_accents(ph.city.lower().strip()) for ph in merged))
+        kept_cities = len({rec.city_key for rec in merged})
         logger.info("Filtered: removed %d pharmacies from low-confidence cities "
                      "(%d cities kept)", dropped, kept_cities)
 
     # Sort by city then name
-    merged.sort(key=lambda p: (p.city, p.name))
+    merged.sort(key=lambda r: (r.pharmacy.city, r.pharmacy.name))
 
     logger.info("Merged: %d unique pharmacies from %d total records",
-                len(merged), sum(len(phs) for _, phs in source_lists))
+                len(merged), len(records))
     return merged
 
 
-def count_sources_per_pharmacy(source_lists: List[Tuple[str, List[Pharmacy]]]) -> Dict[Tuple[str, str], int]:
-    """Count how many distinct sources confirm each pharmacy."""
-    sources_by_key: Dict[Tuple[str, str], set] = {}
-    for source_name, pharmacies in source_lists:
-        for ph in pharmacies:
-            key = ph.norm_key()
-            sources_by_key.setdefault(key, set()).add(source_name)
-    return {k: len(v) for k, v in sources_by_key.items()}
+# ---------------------------------------------------------------------------
+# Geocoding
+# ---------------------------------------------------------------------------
+def geocode_pharmacies(merged: List[PharmacyRecord]) -> List[dict]:
+    """Offline lat/lng/geohash fields per merged record (see pharmacy_geo.py).
+
+    A missing or broken gazetteer leaves every record without coordinates.
+    """
+    try:
+        cache = _store("geocode", lambda: GeocodeCache.default(Gazetteer.load()))
+    except Exception as exc:
+        logger.warning("Geocoding disabled: %s", exc)
+        return [geo_fields(None) for _ in merged]
+
+    fields = []
+    counts: Dict[str, int] = {}
+    for rec in merged:
+        ph = rec.pharmacy
+        geo = geo_fields(cache.geocode(ph.city, ph.area, ph.address))
+        precision = geo["geo_precision"] or "none"
+        counts[precision] = counts.get(precision, 0) + 1
+        fields.append(geo)
+    try:
+        cache.save()
+    except Exception as exc:
+        logger.warning("Cannot save geocode cache: %s", exc)
+    logger.info("Geocoded %d pharmacies: %s (cache %s)", len(merged), counts, cache.stats)
+    return fields
 
 
 # ---------------------------------------------------------------------------
 # Output
 # ---------------------------------------------------------------------------
-def write_output(
-    pharmacies: List[Pharmacy],
-    sources_count: Dict[Tuple[str, str], int],
-    source_statuses: Dict[str, dict],
-) -> None:
-    OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
-
-    # Build enriched records
+def build_records(merged: List[PharmacyRecord], geo: Optional[List[dict]] = None) -> List[dict]:
+    """Published pharmacies.json rows for *merged* (with *geo* fields)."""
     records = []
-    for ph in pharmacies:
+    for i, entry in enumerate(merged):
+        ph = entry.pharmacy
         rec = {
             "city": ph.city,
             "area": ph.area,
@@ -767,15 +1242,138 @@ def write_output(
             "district": ph.district or ph.area,
             "duty": ph.duty,
             "source": ph.source,
-            "sources_count": sources_count.get(ph.norm_key(), 1),
+            "sources_count": entry.sources_count,
             "date": ph.date,
-            "scraped_at": NOW_ISO,
+            **(geo[i] if geo else geo_fields(None)),
         }
+        if ph.stale:
+            rec["stale"] = True
+        if entry.confidence is not None:
+            rec["predicted"] = True
+            rec["confidence"] = entry.confidence
         records.append(rec)
+    return records
+
+
+def records_fingerprint(records: List[dict]) -> str:
+    """Content hash of published rows (ignoring the per-record scrape
+    timestamp that files written by older versions still carry)."""
+    digest = hashlib.sha256()
+    for rec in records:
+        digest.update(json.dumps({k: v for k, v in rec.items() if k != "scraped_at"}, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path: Path, payload) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+
+
+def city_slug(city: str) -> str:
+    """Shard file stem for *city*: "Fès" -> "fes", "El Jadida" -> "el-jadida"."""
+    return re.sub(r"[^a-z0-9]+", "-", _strip_accents(city.lower())).strip("-") or "autres"
+
+
+def write_shards(records: List[dict]) -> Dict[str, dict]:
+    """Write one shard per city under OUTPUT_SHARDS_DIR and delete shards of
+    cities no longer published. Returns the shard index for the meta:
+    city -> {file, count, hash}."""
+    OUTPUT_SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+    by_city: Dict[str, List[dict]] = {}
+    for rec in records:
+        by_city.setdefault(rec["city"], []).append(rec)
+
+    index: Dict[str, dict] = {}
+    written = 0
+    files = set()
+    for city in sorted(by_city):
+        slug = city_slug(city)
+        while f"{slug}.json" in files:  # two spellings folding to one slug
+            slug += "-2"
+        files.add(f"{slug}.json")
+        data = records_bytes(by_city[city])
+        written += write_if_changed(OUTPUT_SHARDS_DIR / f"{slug}.json", data)
+        index[city] = {
+            "file": f"{OUTPUT_SHARDS_DIR.name}/{slug}.json",
+            "count": len(by_city[city]),
+            "hash": hashlib.sha256(data).hexdigest()[:16],
+        }
+    removed = 0
+    for path in OUTPUT_SHARDS_DIR.glob("*.json"):
+        if path.name not in files:
+            path.unlink()
+            removed += 1
+    logger.info("Shards: %d cities, %d rewritten, %d unchanged, %d removed",
+                len(index), written, len(index) - written, removed)
+    return index
+
+
+# Fill cities missing from a run from their recorded duty rotation
+PREDICT_MISSING_CITIES = os.getenv("PREDICT_MISSING_CITIES", "1") != "0"
+
+
+def add_rotation_predictions(merged: List[PharmacyRecord]) -> List[PharmacyRecord]:
+    """*merged* plus, for each city the duty history expects but this run
+    has no record of, the pharmacies its rotation puts on duty on TODAY
+    (duty_rotation.py), flagged with their confidence."""
+    if not PREDICT_MISSING_CITIES:
+        return merged
+    try:
+        predictor = RotationPredictor(_store("duty_history", DutyHistory.default))
+        filled = predictor.fill_missing({rec.pharmacy.city for rec in merged}, TODAY)
+    except Exception as exc:
+        logger.warning("Cannot predict missing cities: %s", exc)
+        return merged
+
+    predicted: List[PharmacyRecord] = []
+    for city, predictions in filled.items():
+        logger.warning("City %s has no record in this run: %d pharmacies predicted from its duty rotation "
+                       "(confidence %.2f-%.2f)", city, len(predictions),
+                       min(p.confidence for p in predictions), max(p.confidence for p in predictions))
+        for prediction in predictions:
+            rec = PharmacyRecord("rotation", Pharmacy(
+                city=prediction.city, area=prediction.area, name=prediction.name,
+                address=prediction.address, phone=prediction.phone, district=prediction.area,
+                duty=prediction.duty, source_site="rotation", date=TODAY,
+            ))
+            rec.confidence = prediction.confidence
+            predicted.append(rec)
+    if not predicted:
+        return merged
+    return sorted(merged + predicted, key=lambda r: (r.pharmacy.city, r.pharmacy.name))
+
+
+def archive_duties(records: List[dict]) -> None:
+    """Append the published rows to the duty history (duty_history.py);
+    predicted and stale rows are left out so they never feed later
+    predictions."""
+    try:
+        history = _store("duty_history", DutyHistory.default)
+        added = history.append((rec for rec in records if not rec.get("predicted") and not rec.get("stale")),
+                               at=NOW_ISO)
+        history.save()
+        logger.info("Duty history: %d new rows (%d new pharmacies)", added, history.stats["pharmacies_added"])
+    except Exception as exc:
+        logger.warning("Cannot archive duty history: %s", exc)
+
+
+def write_output(
+    merged: List[PharmacyRecord],
+    source_statuses: Dict[str, dict],
+    geo: Optional[List[dict]] = None,
+) -> None:
+    OUTPUT_JSON.parent.mkdir(parents=True, exist_ok=True)
 
-    with OUTPUT_JSON.open("w", encoding="utf-8") as fh:
-        json.dump(records, fh, ensure_ascii=False, indent=2)
-    logger.info("Wrote %d pharmacies to %s", len(records), OUTPUT_JSON)
+    pharmacies = [rec.pharmacy for rec in merged]
+    records = build_records(merged, geo)
+    shards = write_shards(records)
+    if write_if_changed(OUTPUT_JSON, records_bytes(records)):
+        logger.info("Wrote %d pharmacies to %s", len(records), OUTPUT_JSON)
+    else:
+        logger.info("%s unchanged (%d pharmacies)", OUTPUT_JSON, len(records))
+    archive_duties(records)
 
     # Load previous metadata for delta comparison
     previous_total = 0
@@ -794,63 +1392,410 @@ def write_output(
         "total_pharmacies": len(records),
         "cities_count": len(cities),
         "cities": cities,
+        "shards": shards,
         "sources_used": list(source_statuses.keys()),
         "sources_status": source_statuses,
+        "cache_hit_rates": {
+            name: status["cache"]["hit_rate"]
+            for name, status in source_statuses.items()
+            if isinstance(status.get("cache"), dict)
+        },
+        "slow_sources": [name for name, status in source_statuses.items() if status.get("slow")],
+        "memory": MEMORY.summary(),
+        "predicted": dict(sorted(Counter(rec.pharmacy.city for rec in merged if rec.confidence is not None).items())),
+        "stale": dict(sorted(Counter(rec.pharmacy.city for rec in merged if rec.pharmacy.stale).items())),
         "previous_total": previous_total,
         "delta": len(records) - previous_total if previous_total else None,
+        "geocoded": {
+            precision: sum(1 for r in records if (r["geo_precision"] or "none") == precision)
+            for precision in ("quartier", "city", "none")
+        },
     }
 
-    with OUTPUT_META.open("w", encoding="utf-8") as fh:
-        json.dump(meta, fh, ensure_ascii=False, indent=2)
+    _write_json_atomic(OUTPUT_META, meta)
     logger.info("Wrote metadata to %s", OUTPUT_META)
 
 
+# ---------------------------------------------------------------------------
+# Runs
+# ---------------------------------------------------------------------------
+def source_scrapers() -> Dict[str, Callable[[FetchEngine], Awaitable[Tuple[List[Pharmacy], dict]]]]:
+    return SOURCES.scrapers()
+
+
+def stage(name: str, **attributes) -> None:
+    """Start a run stage: a trace span (tracing.py) and a memory phase."""
+    tracing.stage(name, **attributes)
+    MEMORY.phase(name)
+
+
+def make_engine() -> FetchEngine:
+    # The engine enforces per-host concurrency and spacing instead of
+    # per-source sleeps
+    return FetchEngine(
+        lambda url, headers=None: get_with_retry(url, headers=headers),
+        host_policies(),
+        default_policy=HostPolicy(concurrency=1, min_interval=REQUEST_DELAY),
+    )
+
+
+def _source_outcome(name: str, outcome) -> Tuple[List[Pharmacy], dict]:
+    if isinstance(outcome, BaseException):
+        logger.error("Source %s crashed: %s", name, outcome)
+        return [], {"ok": False, "count": 0, "error": str(outcome)}
+    pharmacies, status = outcome
+    logger.info("Source %s: %d pharmacies (ok=%s)", name, status["count"], status["ok"])
+    return pharmacies, status
+
+
+# Whole-run deadline (seconds, 0 = none): the evening list ships on time
+# even when a source hangs
+SCRAPE_DEADLINE_SECONDS = float(os.getenv("SCRAPE_DEADLINE_SECONDS", str(15 * 60)))
+# Per-source budgets (seconds), capped by the run deadline
+SOURCE_BUDGETS: Dict[str, float] = SOURCES.budgets()
+
+
+def source_deadlines(names, total: float) -> Dict[str, float]:
+    """`time.monotonic()` deadline per source: its budget, capped by *total*
+    seconds from now. No deadlines when *total* is 0."""
+    if not total:
+        return {}
+    start = time.monotonic()
+    return {name: start + min(total, SOURCE_BUDGETS.get(name, total)) for name in names}
+
+
+def _overran(outcome, telemetry: Optional[SourceTelemetry]) -> bool:
+    if isinstance(outcome, DeadlineExceeded):
+        return True
+    return telemetry is not None and telemetry.as_dict()["deadline_skips"] > 0
+
+
+def with_snapshot_fallback(
+    name: str, pharmacies: List[Pharmacy], status: dict, overran: bool,
+) -> List[Pharmacy]:
+    """Keep the source's records per city as its last good snapshot or,
+    when the source overran its budget, complete them from that snapshot
+    (source_snapshots.py).
+
+    An overrun run is not a good snapshot and is not stored. Sources do not
+    tell which cities they only partly crawled, so every snapshot record
+    the run did not return (by norm_key) is added, flagged stale: the
+    cities it did not reach and the missed rows of the ones it did."""
+    snapshots = _store("source_snapshots", SourceSnapshots.default)
+    if not overran:
+        by_city: Dict[str, List[dict]] = {}
+        for ph in pharmacies:
+            by_city.setdefault(ph.city, []).append(asdict(ph))
+        snapshots.update(name, by_city)
+    else:
+        seen = {ph.norm_key() for ph in pharmacies}
+        reached = {ph.city for ph in pharmacies}
+        extra: List[Pharmacy] = []
+        for rows in snapshots.fallback(name).values():
+            for row in rows:
+                ph = Pharmacy(**{**row, "stale": True})
+                if ph.norm_key() not in seen:
+                    seen.add(ph.norm_key())
+                    extra.append(ph)
+        cities = sorted({ph.city for ph in extra})
+        status["timed_out"] = True
+        status["fallback_cities"] = cities
+        status["partial_cities"] = [city for city in cities if city in reached]
+        status["fallback_count"] = len(extra)
+        logger.warning("Source %s overran its budget: kept %d pharmacies, %d more from its last good "
+                       "snapshot (%s), snapshot left as it was", name, len(pharmacies), len(extra),
+                       ", ".join(cities) or "none")
+        pharmacies = pharmacies + extra
+    try:
+        snapshots.save()
+    except Exception as exc:
+        logger.warning("Cannot save source snapshots: %s", exc)
+    return pharmacies
+
+
+def record_telemetry(source_statuses: Dict[str, dict], telemetry: Dict[str, SourceTelemetry]) -> None:
+    """Attach each run source's telemetry to its status and append it to
+    the rolling history (.cache/pharmacies/telemetry_history.json), flagging
+    sources much slower than their usual wall time."""
+    history = TelemetryHistory.default()
+    for name, source_telemetry in telemetry.items():
+        status = source_statuses[name]
+        status["telemetry"] = source_telemetry.as_dict()
+        status.update(history.record(name, status["telemetry"], ok=status["ok"], count=status["count"]))
+        logger.info("Source %s telemetry: %s", name, status["telemetry"])
+        if status["slow"]:
+            logger.warning("ALERT: source %s is slow: %.1fs (usual %.1fs)",
+                           name, status["telemetry"]["wall_seconds"], status["baseline_wall_seconds"])
+    try:
+        history.save()
+    except Exception as exc:
+        logger.warning("Cannot save telemetry history: %s", exc)
+
+
+# ---------------------------------------------------------------------------
+# Daemon
+# ---------------------------------------------------------------------------
+# Daily refresh times (Morocco local) per source, as registered
+SOURCE_REFRESH_TIMES: Dict[str, Tuple[str, ...]] = SOURCES.refresh_times()
+DAEMON_DEFAULT_REFRESH_TIMES = ("08:30", "20:30")
+DAEMON_GUIDE_MAX_AGE_HOURS = 7 * 24
+DAEMON_MAX_SLEEP = 300.0  # re-check the clock at least this often (seconds)
+
+
+def next_refresh(times: Tuple[str, ...], after: datetime) -> datetime:
+    """First of the daily local *times* ("HH:MM") strictly after *after*."""
+    candidates = []
+    for hhmm in times:
+        hour, minute = (int(part) for part in hhmm.split(":"))
+        at = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if at <= after:
+            at += timedelta(days=1)
+        candidates.append(at)
+    return min(candidates)
+
+
+def _published_fingerprint() -> Optional[str]:
+    try:
+        return records_fingerprint(json.loads(OUTPUT_JSON.read_text(encoding="utf-8")))
+    except Exception:
+        return None
+
+
+def publish_if_changed(
+    source_results: Dict[str, List[Pharmacy]],
+    source_statuses: Dict[str, dict],
+    last_fingerprint: Optional[str],
+) -> str:
+    """Merge the current per-source results and rewrite the outputs only
+    when the published rows change. Returns the rows' fingerprint."""
+    global NOW_ISO
+    source_lists = [(name, source_results[name]) for name in source_scrapers() if name in source_results]
+    merged = add_rotation_predictions(merge_and_validate(source_lists))
+    geo = geocode_pharmacies(merged)
+    fingerprint = records_fingerprint(build_records(merged, geo))
+    if fingerprint == last_fingerprint:
+        logger.info("No change in %d pharmacies, outputs left as they are", len(merged))
+        return fingerprint
+    NOW_ISO = datetime.now(timezone.utc).isoformat()
+    write_output(merged, source_statuses, geo)
+    return fingerprint
+
+
+async def run_daemon(max_rounds: int = 0) -> None:
+    """Refresh each source on its own schedule (SOURCE_REFRESH_TIMES) with
+    one fetch engine, HTTP session and set of caches, republishing only
+    when the merged result changes. Stops on SIGINT/SIGTERM, or after
+    *max_rounds* refresh rounds when non-zero.
+
+    A source whose refresh yields nothing keeps its previous records
+    (flagged "stale" in its status) until the next successful refresh.
+    """
+    global TODAY
+    os.environ.setdefault("GUIDE_SCHEDULE_MAX_AGE_HOURS", str(DAEMON_GUIDE_MAX_AGE_HOURS))
+    scrapers = source_scrapers()
+    engine = make_engine()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    results: Dict[str, List[Pharmacy]] = {}
+    statuses: Dict[str, dict] = {}
+    now = datetime.now(MOROCCO_TZ)
+    due = {name: now for name in scrapers}
+    fingerprint = _published_fingerprint()
+    rounds = 0
+    try:
+        while not stop.is_set():
+            now = datetime.now(MOROCCO_TZ)
+            ready = [name for name, at in due.items() if at <= now]
+            if not ready:
+                wait = (min(due.values()) - now).total_seconds()
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=min(max(wait, 0.0), DAEMON_MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            TODAY = now.strftime("%Y-%m-%d")
+            logger.info("Refreshing %s (duty date %s)", ", ".join(ready), TODAY)
+            with tracing.span("daemon round", round=rounds + 1, sources=",".join(ready), date=TODAY):
+                stage("sources")
+                telemetry: Dict[str, SourceTelemetry] = {}
+                outcomes = await gather_sources(
+                    engine, {name: scrapers[name] for name in ready}, telemetry,
+                    source_deadlines(ready, SCRAPE_DEADLINE_SECONDS),
+                )
+                stage("fallback")
+                for name, outcome in outcomes.items():
+                    pharmacies, status = _source_outcome(name, outcome)
+                    pharmacies = with_snapshot_fallback(name, pharmacies, status,
+                                                        _overran(outcome, telemetry.get(name)))
+                    if pharmacies or name not in results:
+                        results[name] = pharmacies
+                    else:
+                        logger.warning("Source %s returned nothing, keeping its previous %d pharmacies",
+                                       name, len(results[name]))
+                        status["stale"] = True
+                    statuses[name] = status
+                    due[name] = next_refresh(SOURCE_REFRESH_TIMES.get(name, DAEMON_DEFAULT_REFRESH_TIMES), now)
+                    logger.info("Source %s: next refresh at %s", name, due[name].strftime("%Y-%m-%d %H:%M"))
+                record_telemetry(statuses, telemetry)
+
+                MEMORY.check()
+                stage("publish")
+                fingerprint = publish_if_changed(results, statuses, fingerprint)
+            MEMORY.end_phase()
+            if MEMORY.report:
+                MEMORY.log_report(logger)
+            MEMORY.reset()
+            rounds += 1
+            if max_rounds and rounds >= max_rounds:
+                break
+    finally:
+        for host, stats in engine.stats().items():
+            logger.info("Host %s: %s", host, stats)
+        HTTP.log_stats(logger)
+        engine.close()
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Multi-source duty pharmacy scraper")
+    parser.add_argument(
+        "--date",
+        help="Duty date to publish, YYYY-MM-DD (default: today in Morocco). guidepharmacies.ma "
+             "rows come from its week schedule for that date; other sources report their live pages.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and refresh each source on its own schedule, republishing on change.",
+    )
+    parser.add_argument("--max-rounds", type=int, default=0, help="With --daemon: stop after N refresh rounds.")
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=SCRAPE_DEADLINE_SECONDS,
+        help="Seconds before every source is stopped and the outputs are written, completing "
+             "each source from its last good snapshot, rows flagged stale (default "
+             "SCRAPE_DEADLINE_SECONDS or 900; 0 = no deadline). Sources also have their own "
+             "budgets (SOURCE_BUDGETS).",
+    )
+    parser.add_argument(
+        "--no-predict",
+        action="store_true",
+        help="Do not fill cities missing from the run with predictions from their duty rotation.",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Append NDJSON trace spans (stages, sources, HTTP requests) to this file (default TRACE_FILE).",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Log each stage's RSS and top tracemalloc allocators (slower).",
+    )
+    parser.add_argument(
+        "--max-rss",
+        type=float,
+        default=float(os.getenv("PHARMACY_MAX_RSS_MB", "0")),
+        help="RSS budget in MB: stop before writing the outputs once it is exceeded "
+             "(default PHARMACY_MAX_RSS_MB; 0 = none).",
+    )
+    return parser
+
+
 def main() -> None:
-    logger.info("Starting multi-source pharmacy scraper")
+    global SCRAPE_DEADLINE_SECONDS, PREDICT_MISSING_CITIES
+    args = build_arg_parser().parse_args()
+    SCRAPE_DEADLINE_SECONDS = args.deadline
+    if args.no_predict:
+        PREDICT_MISSING_CITIES = False
+    tracing.configure(args.trace)
+    MEMORY.start(report=args.memory_report, max_rss_mb=args.max_rss)
+    try:
+        with tracing.span("pharmacies_scraper", daemon=args.daemon, deadline=args.deadline):
+            run(args)
+    except MemoryBudgetExceeded as exc:
+        logger.error("Stopped: %s. The previous outputs were left as they are.", exc)
+        sys.exit(3)
+    finally:
+        MEMORY.stop()
+        if MEMORY.report or MEMORY.max_rss_mb:
+            MEMORY.log_report(logger)
+        tracing.close()
+
+
+def run(args: argparse.Namespace) -> None:
+    global TODAY
+    if args.daemon:
+        if args.date:
+            logger.error("--date cannot be combined with --daemon")
+            sys.exit(1)
+        logger.info("Starting pharmacy scraper daemon")
+        asyncio.run(run_daemon(args.max_rounds))
+        return
+    if args.date:
+        try:
+            TODAY = datetime.strptime(args.date, "%Y-%m-%d").date().isoformat()
+        except ValueError:
+            logger.error("Invalid --date %r (expected YYYY-MM-DD)", args.date)
+            sys.exit(1)
 
-    scrapers = {
-        "annuaire-gratuit.ma": scrape_annuaire_gratuit,
-        "guidepharmacies.ma": scrape_guidepharmacies,
-        "infopoint.ma": scrape_infopoint,
-        "lematin.ma": scrape_lematin,
-    }
+    logger.info("Starting multi-source pharmacy scraper (duty date %s)", TODAY)
 
     source_lists: List[Tuple[str, List[Pharmacy]]] = []
     source_statuses: Dict[str, dict] = {}
 
-    # Run scrapers in parallel (each source is independent)
-    with ThreadPoolExecutor(max_workers=4) as pool:
-        futures = {
-            pool.submit(fn): name
-            for name, fn in scrapers.items()
-        }
-
-        for future in as_completed(futures):
-            name = futures[future]
-            try:
-                pharmacies, status = future.result()
-                source_lists.append((name, pharmacies))
-                source_statuses[name] = status
-                logger.info("Source %s: %d pharmacies (ok=%s)",
-                            name, status["count"], status["ok"])
-            except Exception as exc:
-                logger.error("Source %s crashed: %s", name, exc)
-                source_statuses[name] = {"ok": False, "count": 0, "error": str(exc)}
-
-    # Merge and cross-validate
+    # Run every source on one event loop
+    stage("sources")
+    engine = make_engine()
+    started = time.monotonic()
+    telemetry: Dict[str, SourceTelemetry] = {}
+    scrapers = source_scrapers()
+    outcomes = run_sources(engine, scrapers, telemetry, source_deadlines(scrapers, args.deadline))
+    logger.info("Sources finished in %.1fs", time.monotonic() - started)
+    for host, stats in engine.stats().items():
+        logger.info("Host %s: %s", host, stats)
+    HTTP.log_stats(logger)
+
+    stage("fallback")
+    for name, outcome in outcomes.items():
+        pharmacies, source_statuses[name] = _source_outcome(name, outcome)
+        pharmacies = with_snapshot_fallback(name, pharmacies, source_statuses[name],
+                                            _overran(outcome, telemetry.get(name)))
+        if pharmacies or not isinstance(outcome, BaseException):
+            source_lists.append((name, pharmacies))
+    record_telemetry(source_statuses, telemetry)
+
+    # Merge and cross-validate; predict the cities no source delivered
+    stage("merge", records=sum(len(pharmacies) for _, pharmacies in source_lists))
     merged = merge_and_validate(source_lists)
-    sources_per_ph = count_sources_per_pharmacy(source_lists)
-
-    # Write output
-    write_output(merged, sources_per_ph, source_statuses)
+    stage("predict")
+    merged = add_rotation_predictions(merged)
+
+    # Geocode and write output
+    stage("geocode", records=len(merged))
+    geo = geocode_pharmacies(merged)
+    MEMORY.check()
+    stage("write")
+    write_output(merged, source_statuses, geo)
+    tracing.end_stage()
+    MEMORY.end_phase()
 
     # Summary
     total = len(merged)
-    multi_source = sum(1 for v in sources_per_ph.values() if v >= 2)
-    logger.info("DONE: %d pharmacies total, %d confirmed by 2+ sources", total, multi_source)
+    multi_source = sum(1 for rec in merged if rec.sources_count >= 2)
+    predicted = sum(1 for rec in merged if rec.confidence is not None)
+    logger.info("DONE: %d pharmacies total, %d confirmed by 2+ sources, %d predicted",
+                total, multi_source, predicted)
 
     # Check for significant drop (for CI alerting)
     if OUTPUT_META.exists():
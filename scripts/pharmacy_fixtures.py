@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Recorded HTML fixtures of the pharmacy sources and a local stand-in server.
+
+Layout (scripts/fixtures/pharmacies/):
+    manifest.json         {"date": duty date of the recording, "recorded_at": ...}
+    <source dir>/<page>   one file per URL path: "/a/b.html" -> "a__b.html",
+                          "/a/b" -> "a__b", "/" -> "index"
+    expected.json         bench reference (bench_pharmacy_sources.py)
+
+`StandinServer` serves one source directory on 127.0.0.1 with injectable
+latency (fixed + random jitter) and failures (a random share of requests,
+or every path matching a pattern, answered with 503). `start_standins()`
+starts one server per source — distinct ports keep the scraper's per-host
+budgets apart — and `standin_env()` gives the variables that point the
+scraper at them (ANNUAIRE_BASE, GUIDE_BASE, INFOPOINT_URL, LEMATIN_BASE,
+MEDMA_BASE).
+
+Usage:
+    python scripts/pharmacy_fixtures.py --latency 0.2 --fail-rate 0.05
+    # then, in another shell, with the printed variables exported:
+    python scripts/pharmacies_scraper.py --date 2026-02-24
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("pharmacy_fixtures")
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures" / "pharmacies"
+
+
+@dataclass(frozen=True)
+class FixtureSource:
+    directory: str   # sub-directory of FIXTURES_DIR
+    env: str         # scraper variable holding the base URL
+    live_base: str   # scheme://host of the live site
+    entry: str = ""  # path appended to the base in `env` (INFOPOINT_URL is a page)
+
+
+FIXTURE_SOURCES: Dict[str, FixtureSource] = {
+    "annuaire-gratuit.ma": FixtureSource("annuaire", "ANNUAIRE_BASE", "https://www.annuaire-gratuit.ma"),
+    "guidepharmacies.ma": FixtureSource("guide", "GUIDE_BASE", "https://www.guidepharmacies.ma"),
+    "infopoint.ma": FixtureSource("infopoint", "INFOPOINT_URL", "https://infopoint.ma", "/pharmacies-de-garde"),
+    "lematin.ma": FixtureSource("lematin", "LEMATIN_BASE", "https://lematin.ma"),
+    "med.ma": FixtureSource("medma", "MEDMA_BASE", "https://www.med.ma"),
+}
+
+
+def fixture_name(path: str) -> str:
+    """File name of the page at URL *path* (query string ignored)."""
+    path = urllib.parse.urlsplit(path).path.strip("/")
+    return urllib.parse.unquote(path).replace("/", "__") or "index"
+
+
+def load_manifest(root: Path = FIXTURES_DIR) -> Dict[str, str]:
+    return json.loads((root / "manifest.json").read_text(encoding="utf-8"))
+
+
+class StandinServer:
+    """Serves the fixture pages of one source directory."""
+
+    def __init__(
+        self,
+        root: Path,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        fail_rate: float = 0.0,
+        fail_pattern: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        self.root = root
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.fail_pattern = re.compile(fail_pattern) if fail_pattern else None
+        self.stats = {"requests": 0, "served": 0, "failed": 0, "not_found": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        if self._httpd is None:
+            raise RuntimeError("server not started")
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _decide(self, path: str) -> Tuple[float, bool]:
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = bool(self.fail_pattern and self.fail_pattern.search(path)) or (
+                self.fail_rate > 0 and self._rng.random() < self.fail_rate
+            )
+        return delay, fail
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def start(self) -> "StandinServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # noqa: N802
+                delay, fail = server._decide(self.path)
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    server._count("failed")
+                    self._reply(503, b"injected failure")
+                    return
+                page = server.root / fixture_name(self.path)
+                if not page.is_file():
+                    server._count("not_found")
+                    self._reply(404, b"no fixture for " + self.path.encode("utf-8", "replace"))
+                    return
+                server._count("served")
+                self._reply(200, page.read_bytes())
+
+            def _reply(self, code: int, body: bytes) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt: str, *args) -> None:
+                logger.debug("%s %s", self.address_string(), fmt % args)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name=f"standin-{self.root.name}", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def start_standins(root: Path = FIXTURES_DIR, **options) -> Dict[str, StandinServer]:
+    """One started `StandinServer` per source; *options* go to each server."""
+    return {name: StandinServer(root / src.directory, **options).start() for name, src in FIXTURE_SOURCES.items()}
+
+
+def standin_env(servers: Dict[str, StandinServer]) -> Dict[str, str]:
+    """Scraper base-URL variables pointing at *servers*."""
+    return {
+        FIXTURE_SOURCES[name].env: server.base_url + FIXTURE_SOURCES[name].entry
+        for name, server in servers.items()
+    }
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve the recorded pharmacy source fixtures locally")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR, help="Fixture directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--fail-pattern", help="Regex: paths matching it always get 503")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for jitter and failures")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    servers = start_standins(
+        args.fixtures, latency=args.latency, jitter=args.jitter,
+        fail_rate=args.fail_rate, fail_pattern=args.fail_pattern, seed=args.seed,
+    )
+    print(f"# duty date of the fixtures: {load_manifest(args.fixtures)['date']}")
+    for key, value in standin_env(servers).items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for name, server in servers.items():
+            logger.info("%s: %s", name, server.stats)
+            server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
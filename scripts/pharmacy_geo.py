@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Offline geocoding and nearest duty pharmacy queries.
+
+pharmacies.json only has free-text city / area / address, so the scraper
+geocodes every record against a bundled gazetteer of Moroccan city and
+quartier centroids (`scripts/data/morocco_gazetteer.json`) — no network
+geocoder is involved:
+
+- the area (then the address) is matched against the city's quartier
+  names and aliases; the most specific match wins (`geo_precision`
+  "quartier");
+- otherwise the city centroid is used ("city");
+- unknown cities get no coordinates.
+
+Results are cached by normalised (city, area, address) in
+`.cache/pharmacies/geocode.json`, keyed to the gazetteer's content hash.
+Each record gets `lat`, `lng`, `geohash` (precision 7, ~150 m cells) and
+`geo_precision`.
+
+`PharmacyIndex` builds a KD-tree over unit-sphere coordinates (exact
+great-circle ordering) and answers k-nearest queries in microseconds,
+optionally only for pharmacies on duty at a given time.
+
+Usage:
+    python scripts/pharmacy_geo.py --near 33.5898,-7.6039
+    python scripts/pharmacy_geo.py --near 34.02,-6.84 -k 3 --at 2026-02-24T22:30
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import math
+import re
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from detail_cache import CACHE_DIR
+from pharmacy_match import text_tokens
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+GAZETTEER_PATH = Path(__file__).resolve().parent / "data" / "morocco_gazetteer.json"
+PHARMACIES_JSON = BASE_DIR / "public" / "data" / "pharmacies.json"
+
+GEOHASH_PRECISION = 7
+EARTH_RADIUS_KM = 6371.0088
+
+logger = logging.getLogger("pharmacy_geo")
+
+Geocode = Tuple[float, float, str]  # (lat, lng, precision)
+
+
+# ---------------------------------------------------------------------------
+# Gazetteer
+# ---------------------------------------------------------------------------
+def _place_key(name: str) -> str:
+    return " ".join(sorted(text_tokens(name)))
+
+
+class Gazetteer:
+    """City and quartier centroids, indexed by normalised name and alias."""
+
+    def __init__(self, payload: Dict[str, Any], digest: str = ""):
+        self.digest = digest
+        self._cities: Dict[str, Tuple[float, float, List[Tuple[FrozenSet[str], float, float]]]] = {}
+        for name, entry in payload.get("cities", {}).items():
+            quartiers = []
+            for q in entry.get("quartiers", []):
+                for label in [q["name"], *q.get("aliases", [])]:
+                    tokens = text_tokens(label)
+                    if tokens:
+                        quartiers.append((tokens, q["lat"], q["lng"]))
+            # Most specific names first, so "Kasba Mehdia" beats "Mehdia"
+            quartiers.sort(key=lambda item: -len(item[0]))
+            city = (entry["lat"], entry["lng"], quartiers)
+            for label in [name, *entry.get("aliases", [])]:
+                self._cities.setdefault(_place_key(label), city)
+
+    @classmethod
+    def load(cls, path: Path = GAZETTEER_PATH) -> "Gazetteer":
+        raw = path.read_bytes()
+        return cls(json.loads(raw), hashlib.sha256(raw).hexdigest()[:16])
+
+    def geocode(self, city: str, area: str = "", address: str = "") -> Optional[Geocode]:
+        entry = self._cities.get(_place_key(city))
+        if entry is None:
+            return None
+        lat, lng, quartiers = entry
+        for text in (area, address):
+            tokens = text_tokens(text)
+            if not tokens:
+                continue
+            for q_tokens, q_lat, q_lng in quartiers:
+                if q_tokens <= tokens:
+                    return q_lat, q_lng, "quartier"
+        return lat, lng, "city"
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+class GeocodeCache:
+    """Normalised (city, area, address) → geocode, tied to a gazetteer digest."""
+
+    def __init__(self, path: Path, gazetteer: Gazetteer):
+        self.path = path
+        self.gazetteer = gazetteer
+        self._entries: Dict[str, Optional[List[Any]]] = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self._load()
+
+    @classmethod
+    def default(cls, gazetteer: Gazetteer) -> "GeocodeCache":
+        return cls(CACHE_DIR / "geocode.json", gazetteer)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable geocode cache %s: %s", self.path, exc)
+            return
+        if isinstance(payload, dict) and payload.get("gazetteer") == self.gazetteer.digest:
+            self._entries = payload.get("entries") or {}
+
+    def reset_stats(self) -> None:
+        self.stats = dict.fromkeys(self.stats, 0)
+
+    @staticmethod
+    def key(city: str, area: str, address: str) -> str:
+        return "|".join(_place_key(part) for part in (city, area, address))
+
+    def geocode(self, city: str, area: str = "", address: str = "") -> Optional[Geocode]:
+        key = self.key(city, area, address)
+        if key in self._entries:
+            self.stats["hits"] += 1
+            hit = self._entries[key]
+            return tuple(hit) if hit else None  # type: ignore[return-value]
+        self.stats["misses"] += 1
+        result = self.gazetteer.geocode(city, area, address)
+        self._entries[key] = list(result) if result else None
+        return result
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({"version": 1, "gazetteer": self.gazetteer.digest, "entries": self._entries}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    chars: List[str] = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value, lng_lo = value * 2 + 1, mid
+            else:
+                value, lng_hi = value * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value, lat_lo = value * 2 + 1, mid
+            else:
+                value, lat_hi = value * 2, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geo_fields(result: Optional[Geocode]) -> Dict[str, Any]:
+    """Record fields for a geocode result (all None when not geocoded)."""
+    if result is None:
+        return {"lat": None, "lng": None, "geohash": None, "geo_precision": None}
+    lat, lng, precision = result
+    return {"lat": lat, "lng": lng, "geohash": geohash_encode(lat, lng), "geo_precision": precision}
+
+
+# ---------------------------------------------------------------------------
+# Duty hours
+# ---------------------------------------------------------------------------
+_HOUR_RANGE_RE = re.compile(r"(\d{1,2})\s*h\s*(\d{2})?\D+?(\d{1,2})\s*h\s*(\d{2})?")
+DAY_SHIFT = (9 * 60, 21 * 60)
+NIGHT_SHIFT = (20 * 60, 9 * 60)
+
+
+def duty_window(duty: str) -> Optional[Tuple[int, int]]:
+    """(start, end) minutes after midnight of the duty date; end <= start
+    means the shift ends the next morning. None when the hours are unknown."""
+    text = (duty or "").lower()
+    if "24" in text and ("24h" in text or "24 h" in text):
+        return 0, 24 * 60
+    m = _HOUR_RANGE_RE.search(text)
+    if m:
+        start = int(m.group(1)) % 24 * 60 + int(m.group(2) or 0)
+        end = int(m.group(3)) % 24 * 60 + int(m.group(4) or 0)
+        return start, end
+    if "nuit" in text:
+        return NIGHT_SHIFT
+    if "jour" in text:
+        return DAY_SHIFT
+    return None
+
+
+def duty_interval(record: Dict[str, Any]) -> Optional[Tuple[datetime, datetime]]:
+    """Local [start, end) of *record*'s duty; unknown hours cover the whole
+    duty date. None when the record has no valid date."""
+    try:
+        day = datetime.strptime(record.get("date", ""), "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+    window = duty_window(record.get("duty", ""))
+    if window is None:
+        return day, day + timedelta(days=1)
+    start, end = window
+    if end <= start:
+        end += 24 * 60
+    return day + timedelta(minutes=start), day + timedelta(minutes=end)
+
+
+def is_on_duty(record: Dict[str, Any], when: datetime) -> bool:
+    """Whether *record* (duty date + hours) covers local time *when*."""
+    interval = duty_interval(record)
+    return interval is not None and interval[0] <= when < interval[1]
+
+
+# ---------------------------------------------------------------------------
+# Spatial index
+# ---------------------------------------------------------------------------
+def _unit_vector(lat: float, lng: float) -> Tuple[float, float, float]:
+    phi, lam = math.radians(lat), math.radians(lng)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi)
+
+
+class PharmacyIndex:
+    """Static 3-d KD-tree over geocoded records (flat arrays, built once).
+
+    Points are unit vectors, so squared chord length orders neighbours
+    exactly like great-circle distance. Leaves hold up to `LEAF_SIZE`
+    points, scanned linearly.
+    """
+
+    LEAF_SIZE = 8
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        self.records = [r for r in records if r.get("lat") is not None and r.get("lng") is not None]
+        self._points = [_unit_vector(r["lat"], r["lng"]) for r in self.records]
+        self._duty = [duty_interval(r) for r in self.records]
+        self._order = list(range(len(self._points)))
+        # Node arrays. Inner node: axis >= 0, split value, left/right child.
+        # Leaf: axis -1, points self._order[lo:hi] stored in left/right.
+        self._axis: List[int] = []
+        self._split: List[float] = []
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._root = self._build(0, len(self._order), 0) if self._order else -1
+
+    @classmethod
+    def from_json(cls, path: Path = PHARMACIES_JSON) -> "PharmacyIndex":
+        """Index a pharmacies.json file; records written before geocoding
+        existed are geocoded on the fly."""
+        records = json.loads(path.read_text(encoding="utf-8"))
+        gazetteer: Optional[Gazetteer] = None
+        for rec in records:
+            if "lat" not in rec:
+                gazetteer = gazetteer or Gazetteer.load()
+                rec.update(geo_fields(gazetteer.geocode(rec.get("city", ""), rec.get("area", ""), rec.get("address", ""))))
+        return cls(records)
+
+    def _node(self, axis: int, split: float, left: int, right: int) -> int:
+        self._axis.append(axis)
+        self._split.append(split)
+        self._left.append(left)
+        self._right.append(right)
+        return len(self._axis) - 1
+
+    def _build(self, lo: int, hi: int, depth: int) -> int:
+        if hi - lo <= self.LEAF_SIZE:
+            return self._node(-1, 0.0, lo, hi)
+        points = self._points
+        # Split on the widest axis of this box
+        spans = [
+            max(points[i][a] for i in self._order[lo:hi]) - min(points[i][a] for i in self._order[lo:hi])
+            for a in range(3)
+        ]
+        axis = spans.index(max(spans))
+        self._order[lo:hi] = sorted(self._order[lo:hi], key=lambda i: points[i][axis])
+        mid = (lo + hi) // 2
+        node = self._node(axis, points[self._order[mid]][axis], -1, -1)
+        self._left[node] = self._build(lo, mid, depth + 1)
+        self._right[node] = self._build(mid, hi, depth + 1)
+        return node
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 5,
+        when: Optional[datetime] = None,
+        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """The *k* nearest records as (distance km, record), closest first.
+
+        With *when*, only pharmacies on duty at that local time qualify;
+        *predicate* adds any other filter.
+        """
+        if k <= 0 or self._root < 0:
+            return []
+        qx, qy, qz = query = _unit_vector(lat, lng)
+        records, points, order, duty = self.records, self._points, self._order, self._duty
+        axes, splits, left, right = self._axis, self._split, self._left, self._right
+        best: List[Tuple[float, int]] = []  # max-heap of (-chord², point id)
+        worst = math.inf
+        stack = [(self._root, 0.0)]  # (node, squared distance to its half-space)
+        while stack:
+            node, bound = stack.pop()
+            if bound >= worst:
+                continue
+            axis = axes[node]
+            if axis < 0:
+                for pid in order[left[node]:right[node]]:
+                    px, py, pz = points[pid]
+                    d2 = (px - qx) ** 2 + (py - qy) ** 2 + (pz - qz) ** 2
+                    if d2 >= worst:
+                        continue
+                    if when is not None and not (duty[pid] and duty[pid][0] <= when < duty[pid][1]):
+                        continue
+                    if predicate is not None and not predicate(records[pid]):
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d2, pid))
+                    else:
+                        heapq.heapreplace(best, (-d2, pid))
+                    if len(best) == k:
+                        worst = -best[0][0]
+                continue
+            diff = query[axis] - splits[node]
+            near, far = (left[node], right[node]) if diff < 0 else (right[node], left[node])
+            # Far side first on the stack so the near side is explored first
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        out = []
+        for neg_d2, pid in sorted(best, reverse=True):
+            chord = math.sqrt(-neg_d2)
+            out.append((2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2)), records[pid]))
+        return out
+
+
+def _bench(index: PharmacyIndex, queries: Iterable[Tuple[float, float]], k: int, when: Optional[datetime]) -> float:
+    """Mean query time in microseconds."""
+    queries = list(queries)
+    started = time.perf_counter()
+    for lat, lng in queries:
+        index.nearest(lat, lng, k=k, when=when)
+    return (time.perf_counter() - started) / max(1, len(queries)) * 1e6
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Nearest duty pharmacies from pharmacies.json")
+    parser.add_argument("--near", required=True, help="LAT,LNG of the query point")
+    parser.add_argument("-k", type=int, default=5, help="Number of pharmacies (default 5)")
+    parser.add_argument("--at", help="Local time YYYY-MM-DDTHH:MM; only pharmacies on duty then")
+    parser.add_argument("--input", type=Path, default=PHARMACIES_JSON)
+    return parser
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    args = build_arg_parser().parse_args()
+    try:
+        lat, lng = (float(part) for part in args.near.split(","))
+        when = datetime.fromisoformat(args.at) if args.at else None
+    except ValueError:
+        logger.error("Expected --near LAT,LNG and --at YYYY-MM-DDTHH:MM")
+        return 1
+
+    index = PharmacyIndex.from_json(args.input)
+    for dist, rec in index.nearest(lat, lng, k=args.k, when=when):
+        print(f"{dist:7.2f} km  {rec['name']} — {rec.get('area', '')}, {rec['city']} "
+              f"({rec.get('duty', '')}, {rec.get('geo_precision')})")
+    mean_us = _bench(index, [(lat + i * 1e-4, lng) for i in range(1000)], args.k, when)
+    logger.info("%d indexed pharmacies, %.1f µs per query", len(index.records), mean_us)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
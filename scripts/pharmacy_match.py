@@ -0,0 +1,274 @@
+"""Fuzzy cross-source matching of duty pharmacy records.
+
+The sources spell the same pharmacy differently ("Al Ikhlass" / "El Ikhlas",
+"Pharmacie Ikhlas Hay Riad" with the quartier appended, ...), so an exact
+(city, name) key leaves duplicates behind. This module clusters records
+without comparing every pair:
+
+- blocking: records are only compared when they share a block inside the
+  same city — exact key, phone number, name-token prefix or consonant
+  skeleton ("nour"/"noor" → "nr"). A block bigger than `MAX_BLOCK` (a
+  common word in a big city) is split by area, and sub-blocks still too
+  big are skipped (the other blocks still cover their members), so the
+  work stays near-linear in the number of records;
+- scoring: token-set similarity over Jaro-Winkler token matches, plus
+  phone, area and address agreement (see `same_pharmacy`);
+- clustering: union-find over the accepted pairs.
+
+Records only need `name`, `area`, `address` and `phone` attributes, plus
+`city` unless a `city_key` callable is given.
+
+Usage:
+    groups = cluster_pharmacies(records, key=lambda ph: ph.norm_key())
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Optional, Sequence, Set, Tuple
+
+from medicament_text import strip_accents
+
+MAX_BLOCK = 64
+TOKEN_MATCH = 0.88      # Jaro-Winkler needed for two name tokens to match
+STRONG_NAME = 0.97      # token-set score accepted on the name alone
+WEAK_NAME = 0.90        # token-set score accepted with area/address agreement
+PHONE_NAME = 0.80       # token-set score accepted when phones agree
+CONTEXT_MATCH = 0.80    # area/address token-set score counted as agreement
+
+_STOPWORDS = frozenset({
+    "pharmacie", "pharmacies", "pharma", "ph", "de", "du", "des", "la", "le", "les",
+    "d", "l", "el", "al", "et", "rue", "avenue", "av", "bd", "boulevard", "n", "no",
+})
+_SEPARATORS = re.compile(r"[^a-z0-9]+")
+_VOWELS = re.compile(r"[aeiouy]")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+# ---------------------------------------------------------------------------
+# Similarity
+# ---------------------------------------------------------------------------
+def jaro_winkler(a: str, b: str, prefix_scale: float = 0.1) -> float:
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if not la or not lb:
+        return 0.0
+    window = max(max(la, lb) // 2 - 1, 0)
+    a_hits = [False] * la
+    b_hits = [False] * lb
+    matches = 0
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(lb, i + window + 1)):
+            if not b_hits[j] and b[j] == ch:
+                a_hits[i] = b_hits[j] = True
+                matches += 1
+                break
+    if not matches:
+        return 0.0
+    transpositions = 0
+    j = 0
+    for i in range(la):
+        if a_hits[i]:
+            while not b_hits[j]:
+                j += 1
+            if a[i] != b[j]:
+                transpositions += 1
+            j += 1
+    jaro = (matches / la + matches / lb + (matches - transpositions / 2) / matches) / 3
+    prefix = 0
+    for ca, cb in zip(a[:4], b[:4]):
+        if ca != cb:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+
+@lru_cache(maxsize=1 << 16)
+def text_tokens(text: str) -> FrozenSet[str]:
+    """Accent-free lowercase tokens without stopwords, repeated letters collapsed."""
+    text = (text or "").lower()
+    if not text.isascii():
+        text = strip_accents(text)
+    words = _SEPARATORS.split(text)
+    return frozenset(_REPEATS.sub(r"\1", w) for w in words if w and w not in _STOPWORDS)
+
+
+@lru_cache(maxsize=1 << 18)
+def _token_score(a: str, b: str) -> float:
+    if a.isdigit() or b.isdigit():
+        return 1.0 if a == b else 0.0
+    return jaro_winkler(a, b)
+
+
+def token_set_similarity(a: FrozenSet[str], b: FrozenSet[str]) -> Tuple[float, FrozenSet[str]]:
+    """Score the smaller token set against the larger one.
+
+    Returns (mean best Jaro-Winkler per token of the smaller set, tokens of
+    the larger set left unmatched). Tokens below `TOKEN_MATCH` count as 0.
+    """
+    if not a or not b:
+        return 0.0, frozenset()
+    if a == b:
+        return 1.0, frozenset()
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    total = 0.0
+    matched: Set[str] = set()
+    for tok in sorted(small):
+        best, best_tok = 0.0, None
+        for other in large:
+            score = 1.0 if tok == other else _token_score(tok, other)
+            if score > best:
+                best, best_tok = score, other
+        if best >= TOKEN_MATCH:
+            total += best
+            matched.add(best_tok)
+    return total / len(small), frozenset(large - matched)
+
+
+# ---------------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------------
+class _Profile:
+    __slots__ = ("city", "key", "name", "area", "area_key", "address", "phone")
+
+    def __init__(self, record: Any, key: Hashable, city: str):
+        self.city = city
+        self.key = key
+        self.name = text_tokens(record.name)
+        self.area = text_tokens(record.area)
+        self.area_key = " ".join(sorted(self.area))
+        self.address = text_tokens(record.address)
+        digits = re.sub(r"\D", "", record.phone or "")
+        self.phone = digits[-9:] if len(digits) >= 9 else ""
+
+    def blocks(self) -> List[Tuple[str, str]]:
+        keys = [("p", self.phone)] if self.phone else []
+        for tok in self.name:
+            if len(tok) >= 3 and not tok.isdigit():
+                keys.append(("t", tok[:4]))
+                skeleton = _VOWELS.sub("", tok)
+                if len(skeleton) >= 2:
+                    keys.append(("s", skeleton))
+        return keys
+
+
+def _city_key(record: Any) -> str:
+    return strip_accents((record.city or "").lower().strip())
+
+
+def _context_agrees(a: _Profile, b: _Profile) -> bool:
+    for left, right in ((a.area, b.area), (a.address, b.address)):
+        if left and right and token_set_similarity(left, right)[0] >= CONTEXT_MATCH:
+            return True
+    return False
+
+
+def same_pharmacy(a: _Profile, b: _Profile) -> bool:
+    """Decide whether two profiles from the same city are one pharmacy.
+
+    - identical exact keys always match;
+    - equal phones need a name score of `PHONE_NAME`;
+    - different phones never match on a fuzzy name;
+    - otherwise the names must cover each other at `STRONG_NAME`, or at
+      `WEAK_NAME` with area/address agreement. Extra name tokens on one
+      side are accepted only when they belong to an area, or to the address
+      of the shorter-named record ("Ikhlas Hay Riad" vs "Ikhlas" in Hay
+      Riad); the longer name's own address often just repeats it.
+    """
+    if a.key == b.key:
+        return True
+    if a.phone and b.phone:
+        return a.phone == b.phone and token_set_similarity(a.name, b.name)[0] >= PHONE_NAME
+    score, extra = token_set_similarity(a.name, b.name)
+    if extra:
+        short, long = (a, b) if len(a.name) <= len(b.name) else (b, a)
+        if not extra <= (short.area | short.address | long.area):
+            return False
+    if score >= STRONG_NAME:
+        return True
+    return score >= WEAK_NAME and _context_agrees(a, b)
+
+
+# ---------------------------------------------------------------------------
+# Clustering
+# ---------------------------------------------------------------------------
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def cluster_pharmacies(
+    records: Sequence[Any],
+    key: Callable[[Any], Hashable],
+    stats: Optional[Dict[str, int]] = None,
+    city_key: Optional[Callable[[Any], str]] = None,
+) -> List[List[int]]:
+    """Group *records* that describe the same pharmacy.
+
+    *key* is the exact dedup key; records sharing it are always grouped.
+    *city_key* returns the blocking city (default: accent-free lowercase
+    `record.city`). Returns index lists in input order, ordered by their
+    first member. If *stats* is given it receives comparison counters.
+    """
+    city_key = city_key or _city_key
+    profiles = [_Profile(rec, key(rec), city_key(rec)) for rec in records]
+    uf = _UnionFind(len(profiles))
+
+    exact: Dict[Hashable, int] = {}
+    blocks: Dict[Tuple[str, str, str], List[int]] = {}
+    for i, prof in enumerate(profiles):
+        first = exact.setdefault(prof.key, i)
+        if first != i:
+            uf.union(first, i)
+            continue
+        for kind, value in prof.blocks():
+            blocks.setdefault((prof.city, kind, value), []).append(i)
+
+    pending = list(blocks.values())
+    for members in blocks.values():
+        if len(members) > MAX_BLOCK:
+            by_area: Dict[str, List[int]] = {}
+            for i in members:
+                by_area.setdefault(profiles[i].area_key, []).append(i)
+            pending.extend(sub for area, sub in by_area.items() if area)
+
+    seen: Set[Tuple[int, int]] = set()
+    compared = skipped = 0
+    for members in pending:
+        if len(members) > MAX_BLOCK:
+            skipped += 1
+            continue
+        for x, i in enumerate(members):
+            for j in members[x + 1:]:
+                if (i, j) in seen:
+                    continue
+                seen.add((i, j))
+                compared += 1
+                if uf.find(i) != uf.find(j) and same_pharmacy(profiles[i], profiles[j]):
+                    uf.union(i, j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(profiles)):
+        groups.setdefault(uf.find(i), []).append(i)
+    if stats is not None:
+        stats.update(
+            records=len(profiles),
+            comparisons=compared,
+            skipped_blocks=skipped,
+            fuzzy_merges=sum(len({profiles[i].key for i in g}) - 1 for g in groups.values()),
+        )
+    return list(groups.values())
@@ -0,0 +1,140 @@
+"""Pluggable pharmacy sources with declarative per-host budgets.
+
+A source is a `SourcePlugin`: its scrape coroutine plus what the scheduler
+needs to know about it —
+
+- `hosts`          — every host it fetches from, each with its polite
+                     budget (`HostPolicy`: max concurrency, min spacing
+                     between request starts);
+- `entry_urls`     — the pages a run starts from (their hosts must be
+                     declared);
+- `budget_seconds` — its time budget inside the run deadline;
+- `refresh_times`  — daily refresh times for --daemon (Morocco local);
+- `primary`        — whether it overrides annuaire-gratuit.ma in its cities.
+
+`SourceRegistry` collects the plugins and derives the scraper's tables
+from them: the coroutines to run, the budgets and refresh times, and the
+per-host policies of the one shared `FetchEngine`. A host declared by
+several sources gets a single slot with the strictest of their budgets
+(lowest concurrency, longest spacing), so sources sharing a host never
+exceed it together, while sources on different hosts run side by side:
+adding a source or a city adds requests to a host's queue, not serial wall
+time to the run.
+
+Usage:
+    SOURCES = SourceRegistry()
+    SOURCES.register(SourcePlugin(
+        name="med.ma",
+        scrape=scrape_medma,
+        hosts={"www.med.ma": HostPolicy(concurrency=2, min_interval=0.5)},
+        entry_urls=("https://www.med.ma/pharmacie/garde-nuit/marrakech/0",),
+        budget_seconds=120,
+        refresh_times=("20:05",),
+        primary=True,
+    ))
+    engine = FetchEngine(get_with_retry, SOURCES.host_policies())
+    outcomes = run_sources(engine, SOURCES.scrapers())
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fetch_engine import FetchEngine, HostPolicy, host_of
+
+logger = logging.getLogger("pharmacy_sources")
+
+Scraper = Callable[[FetchEngine], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class SourcePlugin:
+    name: str
+    scrape: Scraper
+    hosts: Dict[str, HostPolicy] = field(default_factory=dict)
+    entry_urls: Tuple[str, ...] = ()
+    budget_seconds: Optional[float] = None  # None: the run deadline only
+    refresh_times: Tuple[str, ...] = ()
+    primary: bool = False
+
+
+def strictest(policies: Iterable[HostPolicy]) -> HostPolicy:
+    """One policy no looser than any of *policies*."""
+    policies = list(policies)
+    return HostPolicy(
+        concurrency=min(p.concurrency for p in policies),
+        min_interval=max(p.min_interval for p in policies),
+    )
+
+
+class SourceRegistry:
+    """Registered source plugins, in registration order."""
+
+    def __init__(self) -> None:
+        self._plugins: Dict[str, SourcePlugin] = {}
+
+    def register(self, plugin: SourcePlugin) -> SourcePlugin:
+        if plugin.name in self._plugins:
+            raise ValueError(f"source {plugin.name!r} is already registered")
+        if not plugin.hosts:
+            raise ValueError(f"source {plugin.name!r} declares no host")
+        hosts = {host.lower() for host in plugin.hosts}
+        undeclared = sorted({host_of(url) for url in plugin.entry_urls} - hosts)
+        if undeclared:
+            raise ValueError(f"source {plugin.name!r} has entry URLs on undeclared hosts: {', '.join(undeclared)}")
+        for hhmm in plugin.refresh_times:
+            hour, minute = (int(part) for part in hhmm.split(":"))
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError(f"source {plugin.name!r}: invalid refresh time {hhmm!r}")
+        self._plugins[plugin.name] = plugin
+        return plugin
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._plugins
+
+    def __getitem__(self, name: str) -> SourcePlugin:
+        return self._plugins[name]
+
+    def names(self) -> List[str]:
+        return list(self._plugins)
+
+    def plugins(self) -> List[SourcePlugin]:
+        return list(self._plugins.values())
+
+    def scrapers(self, names: Optional[Iterable[str]] = None) -> Dict[str, Scraper]:
+        """{name: scrape coroutine} of *names* (default: every source)."""
+        selected = self._plugins if names is None else {name: self._plugins[name] for name in names}
+        return {name: plugin.scrape for name, plugin in selected.items()}
+
+    def host_policies(self) -> Dict[str, HostPolicy]:
+        """One policy per host: the strictest budget of the sources declaring it."""
+        declared: Dict[str, List[Tuple[str, HostPolicy]]] = {}
+        for plugin in self._plugins.values():
+            for host, policy in plugin.hosts.items():
+                declared.setdefault(host.lower(), []).append((plugin.name, policy))
+        policies = {}
+        for host, entries in declared.items():
+            policies[host] = strictest(policy for _, policy in entries)
+            if len({policy for _, policy in entries}) > 1:
+                logger.info("Host %s is shared by %s, using the strictest budget %s",
+                            host, ", ".join(name for name, _ in entries), policies[host])
+        return policies
+
+    def shared_hosts(self) -> Dict[str, List[str]]:
+        """Hosts declared by more than one source: {host: source names}."""
+        users: Dict[str, List[str]] = {}
+        for plugin in self._plugins.values():
+            for host in plugin.hosts:
+                users.setdefault(host.lower(), []).append(plugin.name)
+        return {host: names for host, names in users.items() if len(names) > 1}
+
+    def budgets(self) -> Dict[str, float]:
+        return {name: p.budget_seconds for name, p in self._plugins.items() if p.budget_seconds is not None}
+
+    def refresh_times(self) -> Dict[str, Tuple[str, ...]]:
+        return {name: p.refresh_times for name, p in self._plugins.items() if p.refresh_times}
+
+    def primary_sources(self) -> Set[str]:
+        return {name for name, p in self._plugins.items() if p.primary}
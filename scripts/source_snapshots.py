@@ -0,0 +1,108 @@
+"""Last good records per source and city, for deadline fallbacks.
+
+Every run that finishes in time stores the records each source returned,
+city by city. When a source overruns its time budget (see `SOURCE_BUDGETS`
+in pharmacies_scraper.py) the run is completed from this store instead,
+cities it did not reach and rows it missed in the ones it did, and the
+store is left as it was. Stored cities older than `max_age_hours` are not
+used.
+
+Layout (`.cache/pharmacies/source_snapshots.json`, not published):
+    {"sources": {"lematin.ma": {"Casablanca": {"saved_at": 1730000000.0,
+                                               "records": [{pharmacy fields}, ...]}}}}
+
+Usage:
+    snapshots = SourceSnapshots.default()
+    snapshots.update("lematin.ma", {"Casablanca": [asdict(ph), ...]})
+    rows = snapshots.fallback("lematin.ma")
+    snapshots.save()
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from detail_cache import CACHE_DIR
+
+DEFAULT_MAX_AGE_HOURS = 24.0
+
+logger = logging.getLogger("source_snapshots")
+
+
+class SourceSnapshots:
+    """Source → city → last stored records."""
+
+    def __init__(self, path: Path, max_age_hours: float = DEFAULT_MAX_AGE_HOURS):
+        self.path = path
+        self.max_age = max_age_hours * 3600
+        self._sources: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.stats = {"cities_saved": 0, "cities_used": 0, "records_used": 0}
+        self._load()
+
+    @classmethod
+    def default(cls) -> "SourceSnapshots":
+        """`.cache/pharmacies/source_snapshots.json`, max age from
+        SOURCE_SNAPSHOT_MAX_AGE_HOURS (default 24)."""
+        try:
+            max_age = float(os.getenv("SOURCE_SNAPSHOT_MAX_AGE_HOURS", str(DEFAULT_MAX_AGE_HOURS)))
+        except ValueError:
+            logger.warning("Invalid SOURCE_SNAPSHOT_MAX_AGE_HOURS, using %s hours", DEFAULT_MAX_AGE_HOURS)
+            max_age = DEFAULT_MAX_AGE_HOURS
+        return cls(CACHE_DIR / "source_snapshots.json", max_age)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable source snapshots %s: %s", self.path, exc)
+            return
+        sources = payload.get("sources") if isinstance(payload, dict) else None
+        if isinstance(sources, dict):
+            self._sources = {name: cities for name, cities in sources.items() if isinstance(cities, dict)}
+
+    def reset_stats(self) -> None:
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def update(self, source: str, cities: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Replace the stored records of each city in *cities*; other cities
+        of the source are kept."""
+        now = time.time()
+        stored = self._sources.setdefault(source, {})
+        for city, records in cities.items():
+            if records:
+                stored[city] = {"saved_at": now, "records": records}
+                self.stats["cities_saved"] += 1
+
+    def fallback(self, source: str, exclude: Iterable[str] = ()) -> Dict[str, List[Dict[str, Any]]]:
+        """Stored records of the source's cities not in *exclude* and not
+        older than the max age: {city: records}."""
+        skip = set(exclude)
+        cutoff = time.time() - self.max_age
+        found = {}
+        for city, entry in sorted(self._sources.get(source, {}).items()):
+            if city in skip or entry.get("saved_at", 0) < cutoff:
+                continue
+            found[city] = entry["records"]
+            self.stats["cities_used"] += 1
+            self.stats["records_used"] += len(entry["records"])
+        return found
+
+    def save(self, now: Optional[float] = None) -> None:
+        """Write the store, dropping cities too old to ever be used."""
+        cutoff = (now or time.time()) - self.max_age
+        sources = {
+            name: {city: entry for city, entry in sorted(cities.items()) if entry.get("saved_at", 0) >= cutoff}
+            for name, cities in sorted(self._sources.items())
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps({"version": 1, "sources": sources}, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
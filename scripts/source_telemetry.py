@@ -0,0 +1,173 @@
+"""Per-source performance telemetry for the pharmacy scraper.
+
+Every source coroutine runs with its own `SourceTelemetry` in a context
+variable (see `fetch_engine.gather_sources`), so code deep inside a source
+— the fetch engine, the retrying HTTP helper in a worker thread, the HTML
+parsers — records into the right source without passing it around:
+
+- `requests`, `errors`, `retries`, `bytes` — HTTP traffic;
+- `deadline_skips` — requests skipped or abandoned at the source deadline;
+- `fetch_seconds` — time inside HTTP calls (summed over concurrent calls,
+  retry backoff excluded);
+- `sleep_seconds` — host pacing waits plus retry backoff;
+- `parse_seconds` — HTML parsing;
+- `wall_seconds` — start to finish of the source.
+
+`TelemetryHistory` keeps the last runs per source in
+.cache/pharmacies/telemetry_history.json and flags a source whose wall
+time is well above its usual (median) one.
+
+Usage:
+    with parsing():
+        soup = BeautifulSoup(html, "html.parser")
+    history = TelemetryHistory.default()
+    history.record(name, telemetry.as_dict(), ok=True)  # -> slow flag fields
+    history.save()
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from detail_cache import CACHE_DIR
+
+logger = logging.getLogger("source_telemetry")
+
+HISTORY_RUNS = 90          # runs kept per source (a month at three runs a day)
+SLOW_MIN_SAMPLES = 3       # successful runs needed before judging speed
+SLOW_FACTOR = 2.0          # slow when wall time > factor x median ...
+SLOW_MIN_SECONDS = 10.0    # ... and at least this many seconds above it
+
+_COUNTERS = ("requests", "errors", "retries", "bytes", "deadline_skips",
+             "fetch_seconds", "wait_seconds", "backoff_seconds", "parse_seconds")
+
+
+class SourceTelemetry:
+    """Counters of one source run; safe to update from fetch threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, float] = dict.fromkeys(_COUNTERS, 0)
+        self.wall_seconds = 0.0
+
+    def add(self, **deltas: float) -> None:
+        with self._lock:
+            for name, value in deltas.items():
+                self._counts[name] += value
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counts)
+        return {
+            "wall_seconds": round(self.wall_seconds, 3),
+            "requests": int(c["requests"]),
+            "errors": int(c["errors"]),
+            "retries": int(c["retries"]),
+            "bytes": int(c["bytes"]),
+            "deadline_skips": int(c["deadline_skips"]),
+            "fetch_seconds": round(max(0.0, c["fetch_seconds"] - c["backoff_seconds"]), 3),
+            "sleep_seconds": round(float(c["wait_seconds"] + c["backoff_seconds"]), 3),
+            "parse_seconds": round(float(c["parse_seconds"]), 3),
+        }
+
+
+_CURRENT: ContextVar[Optional[SourceTelemetry]] = ContextVar("source_telemetry", default=None)
+
+
+def current_telemetry() -> Optional[SourceTelemetry]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def collecting(telemetry: SourceTelemetry) -> Iterator[SourceTelemetry]:
+    """Make *telemetry* current (for tasks and threads started inside) and
+    measure the block's wall time into it."""
+    token = _CURRENT.set(telemetry)
+    started = time.perf_counter()
+    try:
+        yield telemetry
+    finally:
+        telemetry.wall_seconds += time.perf_counter() - started
+        _CURRENT.reset(token)
+
+
+def record(**deltas: float) -> None:
+    """Add *deltas* to the current source's counters (no-op outside a source)."""
+    telemetry = _CURRENT.get()
+    if telemetry is not None:
+        telemetry.add(**deltas)
+
+
+@contextmanager
+def parsing() -> Iterator[None]:
+    """Count the block as parse time of the current source."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(parse_seconds=time.perf_counter() - started)
+
+
+class TelemetryHistory:
+    """Rolling per-source run history with a slow-run check."""
+
+    def __init__(self, path: Path, max_runs: int = HISTORY_RUNS):
+        self.path = path
+        self.max_runs = max_runs
+        self._runs: Dict[str, List[Dict[str, Any]]] = {}
+        self._load()
+
+    @classmethod
+    def default(cls) -> "TelemetryHistory":
+        return cls(CACHE_DIR / "telemetry_history.json")
+
+    def _load(self) -> None:
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+            self._runs = {name: list(runs) for name, runs in payload.get("sources", {}).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Ignoring unreadable telemetry history %s: %s", self.path, exc)
+
+    def baseline(self, source: str) -> Optional[float]:
+        """Median wall time of the source's successful runs, if enough."""
+        walls = [run["wall_seconds"] for run in self._runs.get(source, []) if run.get("ok")]
+        if len(walls) < SLOW_MIN_SAMPLES:
+            return None
+        return statistics.median(walls)
+
+    def record(self, source: str, telemetry: Dict[str, Any], ok: bool, count: int = 0) -> Dict[str, Any]:
+        """Append a run and return its slow-check fields for the source
+        status: {"slow": bool, "baseline_wall_seconds": median or None}.
+        The run is judged against the history before it."""
+        baseline = self.baseline(source)
+        wall = telemetry.get("wall_seconds", 0.0)
+        slow = bool(
+            ok and baseline is not None
+            and wall > baseline * SLOW_FACTOR and wall - baseline >= SLOW_MIN_SECONDS
+        )
+        runs = self._runs.setdefault(source, [])
+        runs.append({
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ok": ok,
+            "count": count,
+            **telemetry,
+        })
+        del runs[:-self.max_runs]
+        return {"slow": slow, "baseline_wall_seconds": round(baseline, 3) if baseline is not None else None}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"version": 1, "sources": self._runs}, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Read an NDJSON trace (tracing.py) back: timeline and per-host latencies.
+
+The timeline is the span tree laid out on the run's time axis, flame-graph
+style: one row per span, indented under its parent, with a bar covering
+its share of the run. HTTP request spans and instant events (cache hits)
+are folded into one row per parent and name ("GET lematin.ma x42"), whose
+bar runs from the first request's start to the last one's end; --requests
+lists them one by one.
+
+The host report gives, for every host, the request count, errors, status
+codes, cache statuses, resends, bytes, latency percentiles and a latency
+histogram.
+
+--chrome writes the spans in the Chrome trace event format, for a zoomable
+flame chart in Perfetto (ui.perfetto.dev) or chrome://tracing: one lane
+per source and per fetch thread.
+
+A trace file is appended to by every run; the last trace in the file is
+reported unless --trace-id picks another (--list shows them).
+
+Usage:
+    python scripts/trace_report.py /tmp/pharmacies.trace.ndjson
+    python scripts/trace_report.py run.ndjson --requests --max-depth 3
+    python scripts/trace_report.py run.ndjson --hosts-only
+    python scripts/trace_report.py run.ndjson --chrome /tmp/run.chrome.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("trace_report")
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def load_spans(path: Path) -> List[Dict[str, Any]]:
+    spans = []
+    with path.open(encoding="utf-8") as fh:
+        for lineno, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a truncated last line
+                logger.warning("%s:%d: not JSON, skipped", path, lineno)
+    return spans
+
+
+def traces(spans: List[Dict[str, Any]]) -> Dict[str, Tuple[int, int, int]]:
+    """{trace_id: (first start, last end, span count)}, oldest first."""
+    found: Dict[str, Tuple[int, int, int]] = {}
+    for span in spans:
+        start, end, count = found.get(span["trace_id"], (span["start_time_unix_nano"], 0, 0))
+        found[span["trace_id"]] = (
+            min(start, span["start_time_unix_nano"]), max(end, span["end_time_unix_nano"]), count + 1,
+        )
+    return dict(sorted(found.items(), key=lambda item: item[1][0]))
+
+
+def duration_ms(span: Dict[str, Any]) -> float:
+    return (span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1e6
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _fmt_ms(ms: float) -> str:
+    return f"{ms / 1000:.2f}s" if ms >= 1000 else f"{ms:.0f}ms"
+
+
+# ---------------------------------------------------------------------------
+# Timeline
+# ---------------------------------------------------------------------------
+def _children(spans: List[Dict[str, Any]]) -> Dict[Optional[str], List[Dict[str, Any]]]:
+    ids = {span["span_id"] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for span in spans:
+        # Spans whose parent is missing (e.g. a killed run) become roots
+        parent = span.get("parent_span_id") if span.get("parent_span_id") in ids else None
+        children.setdefault(parent, []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s["start_time_unix_nano"])
+    return children
+
+
+def _foldable(span: Dict[str, Any]) -> bool:
+    return span.get("kind") == "client" or span["start_time_unix_nano"] == span["end_time_unix_nano"]
+
+
+def _rows(
+    children: Dict[Optional[str], List[Dict[str, Any]]],
+    parent: Optional[str],
+    depth: int,
+    max_depth: Optional[int],
+    fold: bool,
+) -> List[Tuple[int, str, int, int, str]]:
+    """(depth, label, start, end, note) rows of *parent*'s subtree."""
+    rows: List[Tuple[int, str, int, int, str]] = []
+    folded: Dict[str, List[Dict[str, Any]]] = {}
+    items: List[Tuple[int, Any]] = []
+    for span in children.get(parent, []):
+        if fold and _foldable(span) and not children.get(span["span_id"]):
+            group = folded.setdefault(span["name"], [])
+            if not group:
+                items.append((span["start_time_unix_nano"], group))
+            group.append(span)
+        else:
+            items.append((span["start_time_unix_nano"], span))
+    for _, item in sorted(items, key=lambda entry: entry[0]):
+        if isinstance(item, dict):
+            rows.append((depth, item["name"], item["start_time_unix_nano"], item["end_time_unix_nano"], _note(item)))
+            if max_depth is None or depth + 1 < max_depth:
+                rows.extend(_rows(children, item["span_id"], depth + 1, max_depth, fold))
+            continue
+        errors = sum(1 for span in item if span.get("status", {}).get("code") == "ERROR")
+        note = f"x{len(item)}" + (f", {errors} failed" if errors else "")
+        if item[0].get("kind") == "client":
+            latencies = sorted(duration_ms(span) for span in item)
+            note += f", p50 {_fmt_ms(percentile(latencies, 50))}, max {_fmt_ms(latencies[-1])}"
+        rows.append((depth, item[0]["name"], min(s["start_time_unix_nano"] for s in item),
+                     max(s["end_time_unix_nano"] for s in item), note))
+    return rows
+
+
+def _note(span: Dict[str, Any]) -> str:
+    attrs = span.get("attributes", {})
+    parts = []
+    if span.get("status", {}).get("code") == "ERROR":
+        parts.append(f"ERROR {span['status'].get('message', '')}".strip())
+    if "http.response.status_code" in attrs:
+        parts.append(str(attrs["http.response.status_code"]))
+    if attrs.get("cache.status") not in (None, "none"):
+        parts.append(f"cache {attrs['cache.status']}")
+    if attrs.get("http.request.resend_count"):
+        parts.append(f"{attrs['http.request.resend_count']} resent")
+    for key in ("requests", "errors", "to_fetch", "records", "exit_code"):
+        if attrs.get(key):
+            parts.append(f"{key}={attrs[key]}")
+    return ", ".join(parts)
+
+
+def print_timeline(spans: List[Dict[str, Any]], width: int = 50, max_depth: Optional[int] = None,
+                   fold: bool = True) -> None:
+    origin = min(span["start_time_unix_nano"] for span in spans)
+    total = max(span["end_time_unix_nano"] for span in spans) - origin or 1
+    rows = _rows(_children(spans), None, 0, max_depth, fold)
+    label_width = min(48, max(len("  " * depth + label) for depth, label, *_ in rows))
+    print(f"Timeline ({_fmt_ms(total / 1e6)}, one column = {_fmt_ms(total / 1e6 / width)})")
+    print(f"{'start':>8} {'duration':>8}  {'span':<{label_width}}  |{'':{width}}|")
+    for depth, label, start, end, note in rows:
+        first = int((start - origin) * width / total)
+        last = max(first + 1, int(round((end - origin) * width / total)))
+        bar = " " * first + ("#" * (last - first) if end > start else "|") + " " * (width - last)
+        name = ("  " * depth + label)[:label_width]
+        print(f"{_fmt_ms((start - origin) / 1e6):>8} {_fmt_ms((end - start) / 1e6):>8}  "
+              f"{name:<{label_width}}  |{bar[:width]}|  {note}")
+
+
+# ---------------------------------------------------------------------------
+# Per-host latencies
+# ---------------------------------------------------------------------------
+def host_stats(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    by_host: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        if span.get("kind") == "client":
+            host = span.get("attributes", {}).get("server.address", "?")
+            by_host.setdefault(host, []).append(span)
+
+    stats = {}
+    for host, requests in sorted(by_host.items()):
+        latencies = sorted(duration_ms(span) for span in requests)
+        statuses: Dict[str, int] = {}
+        caches: Dict[str, int] = {}
+        for span in requests:
+            attrs = span.get("attributes", {})
+            status = str(attrs.get("http.response.status_code") or attrs.get("error.type") or "?")
+            statuses[status] = statuses.get(status, 0) + 1
+            cache = attrs.get("cache.status")
+            if cache:
+                caches[cache] = caches.get(cache, 0) + 1
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for ms in latencies:
+            histogram[next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms < bound),
+                           len(LATENCY_BUCKETS_MS))] += 1
+        stats[host] = {
+            "requests": len(requests),
+            "errors": sum(1 for span in requests if span.get("status", {}).get("code") == "ERROR"),
+            "resent": sum(span.get("attributes", {}).get("http.request.resend_count", 0) for span in requests),
+            "bytes": sum(span.get("attributes", {}).get("http.response.body.size", 0) for span in requests),
+            "statuses": dict(sorted(statuses.items())),
+            "cache": dict(sorted(caches.items())),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p90_ms": round(percentile(latencies, 90), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(latencies[-1], 1),
+            "histogram": histogram,
+        }
+    return stats
+
+
+def print_hosts(stats: Dict[str, Dict[str, Any]], width: int = 40) -> None:
+    labels = [f"< {_fmt_ms(bound)}" for bound in LATENCY_BUCKETS_MS] + [f">= {_fmt_ms(LATENCY_BUCKETS_MS[-1])}"]
+    for host, s in stats.items():
+        print(f"\n{host}: {s['requests']} requests, {s['errors']} failed, {s['resent']} resent, "
+              f"{s['bytes'] / 1024:.0f} KiB")
+        print(f"  status {s['statuses']}" + (f"  cache {s['cache']}" if s["cache"] else ""))
+        print(f"  p50 {_fmt_ms(s['p50_ms'])}  p90 {_fmt_ms(s['p90_ms'])}  "
+              f"p99 {_fmt_ms(s['p99_ms'])}  max {_fmt_ms(s['max_ms'])}")
+        peak = max(s["histogram"]) or 1
+        # Only the buckets between the first and last non-empty one
+        used = [i for i, count in enumerate(s["histogram"]) if count]
+        for i in range(used[0], used[-1] + 1):
+            count = s["histogram"][i]
+            print(f"  {labels[i]:>9} {'#' * max(int(count * width / peak), 1 if count else 0):<{width}} {count}")
+
+
+# ---------------------------------------------------------------------------
+# Chrome trace event export
+# ---------------------------------------------------------------------------
+def chrome_events(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Complete ("X") events; lanes keep overlapping spans apart: requests
+    on their fetch thread, other spans in their source's lane."""
+    by_id = {span["span_id"]: span for span in spans}
+
+    def lane(span: Dict[str, Any]) -> str:
+        if span.get("kind") == "client":
+            return span.get("attributes", {}).get("thread.name", "http")
+        current: Optional[Dict[str, Any]] = span
+        while current is not None:
+            source = current.get("attributes", {}).get("source")
+            if source:
+                return f"source {source}"
+            current = by_id.get(current.get("parent_span_id") or "")
+        return "main"
+
+    lanes: Dict[str, int] = {}
+    events = []
+    for span in sorted(spans, key=lambda s: s["start_time_unix_nano"]):
+        tid = lanes.setdefault(lane(span), len(lanes) + 1)
+        events.append({
+            "name": span["name"],
+            "cat": span.get("kind", "internal"),
+            "ph": "X",
+            "ts": span["start_time_unix_nano"] / 1000,
+            "dur": (span["end_time_unix_nano"] - span["start_time_unix_nano"]) / 1000,
+            "pid": 1,
+            "tid": tid,
+            "args": {**span.get("attributes", {}), "status": span.get("status", {}).get("code")},
+        })
+    events.extend(
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+        for name, tid in lanes.items()
+    )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Timeline and per-host latency report of an NDJSON trace")
+    parser.add_argument("trace", type=Path, help="Trace file written with --trace / TRACE_FILE")
+    parser.add_argument("--trace-id", help="Trace to report (default: the last one in the file)")
+    parser.add_argument("--list", action="store_true", help="List the traces in the file")
+    parser.add_argument("--requests", action="store_true", help="One timeline row per HTTP request and event")
+    parser.add_argument("--max-depth", type=int, help="Timeline depth limit")
+    parser.add_argument("--width", type=int, default=50, help="Timeline bar width (columns)")
+    parser.add_argument("--hosts-only", action="store_true", help="Only the per-host report")
+    parser.add_argument("--json", action="store_true", help="Print the per-host report as JSON")
+    parser.add_argument("--chrome", type=Path, help="Also write a Chrome trace event file (Perfetto)")
+    return parser
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.trace.is_file():
+        logger.error("No trace file %s", args.trace)
+        return 1
+    spans = load_spans(args.trace)
+    found = traces(spans)
+    if not found:
+        logger.error("No span in %s", args.trace)
+        return 1
+    if args.list:
+        for trace_id, (start, end, count) in found.items():
+            print(f"{trace_id}  {count:6d} spans  {(end - start) / 1e9:8.1f}s")
+        return 0
+    trace_id = args.trace_id or list(found)[-1]
+    if trace_id not in found:
+        logger.error("No trace %s in %s (see --list)", trace_id, args.trace)
+        return 1
+    spans = [span for span in spans if span["trace_id"] == trace_id]
+
+    stats = host_stats(spans)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        if not args.hosts_only:
+            print_timeline(spans, width=args.width, max_depth=args.max_depth, fold=not args.requests)
+        print_hosts(stats)
+    if args.chrome:
+        args.chrome.write_text(json.dumps(chrome_events(spans)), encoding="utf-8")
+        logger.info("Wrote %s (open it in ui.perfetto.dev)", args.chrome)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
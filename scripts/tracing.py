@@ -0,0 +1,195 @@
+"""Optional NDJSON span traces of the scrapers (OpenTelemetry-shaped).
+
+Off unless `configure(path)` is given a file (the scrapers' --trace option,
+or the TRACE_FILE environment variable); every helper is then a no-op.
+
+One JSON object per line and span, with OpenTelemetry field names so the
+file can be mapped onto an OTLP exporter:
+    {"trace_id", "span_id", "parent_span_id", "name", "kind",
+     "start_time_unix_nano", "end_time_unix_nano",
+     "attributes": {"thread.name", ...}, "status": {"code": "OK" | "ERROR", "message"}}
+
+The current span lives in a context variable, so spans opened in asyncio
+tasks and in worker threads started with `contextvars.copy_context()` nest
+under the span that started them. Every HTTP request (http_client.py) is a
+"client" span with host, status, bytes, retries and cache status, each
+scraper source an "internal" span (fetch_engine.py), and the pipeline steps
+of both scripts are `stage()` spans.
+
+Read a trace back with trace_report.py.
+
+Usage:
+    tracing.configure("/tmp/run.trace.ndjson")
+    with tracing.span("pharmacies_scraper"):
+        tracing.stage("merge")          # ends the previous stage, starts this one
+        ...
+        with tracing.span("GET lematin.ma", kind="client", url=url) as sp:
+            sp.set(status=200)
+    tracing.close()
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Iterator, Optional, TextIO, Union
+
+logger = logging.getLogger("tracing")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind", "start", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], trace_id: str, attributes: dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.attributes = {"thread.name": threading.current_thread().name, **attributes}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class _Sink:
+    def __init__(self, path: Path):
+        self.path = path
+        self.trace_id = secrets.token_hex(16)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Line-buffered: a crash or a killed daemon still leaves whole spans
+        self._fh: TextIO = path.open("a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+        self.spans = 0
+
+    def write(self, span: Span, end: int) -> None:
+        payload = {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "start_time_unix_nano": span.start,
+            "end_time_unix_nano": end,
+            "attributes": span.attributes,
+            "status": {"code": "ERROR", "message": span.error} if span.error else {"code": "OK"},
+        }
+        line = json.dumps(payload, ensure_ascii=False, default=str, separators=(",", ":"))
+        with self._lock:
+            self._fh.write(line + "\n")
+            self.spans += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+
+_SINK: Optional[_Sink] = None
+_CURRENT: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+_STAGE: ContextVar[Optional[tuple]] = ContextVar("trace_stage", default=None)
+
+
+def configure(path: Union[str, Path, None] = None) -> bool:
+    """Start writing spans to *path* (default: TRACE_FILE, if set). Returns
+    whether tracing is on."""
+    global _SINK
+    path = path or os.getenv("TRACE_FILE")
+    if not path:
+        return False
+    close()
+    _SINK = _Sink(Path(path))
+    logger.info("Tracing to %s (trace %s)", path, _SINK.trace_id)
+    return True
+
+
+def enabled() -> bool:
+    return _SINK is not None
+
+
+def close() -> None:
+    global _SINK
+    if _SINK is not None:
+        end_stage()
+        _SINK.close()
+        logger.info("Trace: %d spans written to %s", _SINK.spans, _SINK.path)
+        _SINK = None
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+def _start(name: str, kind: str, attributes: dict) -> Span:
+    assert _SINK is not None
+    return Span(name, kind, _CURRENT.get(), _SINK.trace_id, attributes)
+
+
+def _finish(span: Span) -> None:
+    if _SINK is not None:
+        _SINK.write(span, time.time_ns())
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+    """A span around the block (None when tracing is off). An exception
+    marks it as an error; stages started inside end with it."""
+    if _SINK is None:
+        yield None
+        return
+    current = _start(name, kind, attributes)
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    except SystemExit as exc:
+        current.set(exit_code=exc.code)
+        raise
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        stage = _STAGE.get()
+        if stage is not None and stage[0].parent_span_id == current.span_id:
+            end_stage()
+        _CURRENT.reset(token)
+        _finish(current)
+
+
+def event(name: str, **attributes: Any) -> None:
+    """A zero-length span (cache hits and other instant facts)."""
+    if _SINK is None:
+        return
+    instant = _start(name, "internal", attributes)
+    _SINK.write(instant, instant.start)
+
+
+def stage(name: str, **attributes: Any) -> None:
+    """End the current pipeline stage, if any, and start *name* as the
+    current span. Meant for long sequential functions: stages need no
+    re-indented `with` blocks, and the enclosing `span()` ends the last one."""
+    if _SINK is None:
+        return
+    end_stage()
+    current = _start(name, "internal", {"stage": True, **attributes})
+    _STAGE.set((current, _CURRENT.set(current)))
+
+
+def end_stage() -> None:
+    stage_entry = _STAGE.get()
+    if stage_entry is None:
+        return
+    current, token = stage_entry
+    _STAGE.set(None)
+    try:
+        _CURRENT.reset(token)
+    except ValueError:  # set in another context; just stop pointing at it
+        _CURRENT.set(None)
+    _finish(current)